@@ -4,8 +4,91 @@ Tools for setting up colors for display.
 
 from .imports import *
 from matplotlib.colors import SymLogNorm, LogNorm
+import weakref
+import json
 
-def cmap_norm_ticks(a, whatpercentiles=[1, 99], howmanysigmaarelinear=1.5, whatfractionislinear=0.15, vmax=None, vmin=None, cmap=None):
+# by default, how many pixel values are used to choose a color scale?
+defaultmaxsamples = 1000000
+
+# samples of the (first) images of sequences, kept for each sequence
+colorsamples = weakref.WeakKeyDictionary()
+
+
+def sample_pixels(a, maxsamples=defaultmaxsamples, seed=0):
+    '''
+    Pick a random (but repeatable) subset of the values in an array,
+    which is enough to estimate percentiles and widths of big images
+    without sorting every pixel.
+
+    Parameters
+    ----------
+
+    a : array
+            The values to sample (of any shape).
+
+    maxsamples : int, None
+            The most values to keep (None = keep them all).
+            More is more accurate, fewer is faster; the percentiles
+            of n samples are typically accurate to ~1/sqrt(n) in rank.
+
+    seed : int
+            The seed for the random choice (the same seed
+            always picks the same pixels of the same array).
+
+    Returns
+    -------
+    sample : 1D array
+            The sampled values (including any NaNs that were picked).
+    '''
+    a = np.asarray(a).ravel()
+    if (maxsamples is None) or (a.size <= maxsamples):
+        return a
+    indices = np.random.default_rng(seed).integers(0, a.size, int(maxsamples))
+    return a[np.sort(indices)]
+
+
+def combine_samples(samples, sizes, maxsamples=defaultmaxsamples, seed=0):
+    '''
+    Combine samples of several arrays into one sample, drawing from
+    each in proportion to how many values it was sampled from (so the
+    result is like a sample of all the arrays joined together).
+
+    Parameters
+    ----------
+
+    samples : list of 1D arrays
+            The samples (from `sample_pixels`).
+
+    sizes : list of int
+            The number of values each sample was drawn from.
+
+    maxsamples : int, None
+            The most values to keep, in total (None = keep them all).
+
+    seed : int
+            The seed for the random choice.
+
+    Returns
+    -------
+    sample : 1D array
+            The combined sample.
+    '''
+    if len(samples) == 0:
+        return np.array([])
+    total = np.sum(sizes)
+    rng = np.random.default_rng(seed)
+    combined = []
+    for sample, size in zip(samples, sizes):
+        n = len(sample)
+        if maxsamples is not None:
+            n = min(n, int(np.ceil(maxsamples * size / total)))
+        if n < len(sample):
+            sample = sample[np.sort(rng.choice(len(sample), n, replace=False))]
+        combined.append(sample)
+    return np.concatenate(combined)
+
+
+def cmap_norm_ticks(a, whatpercentiles=[1, 99], howmanysigmaarelinear=1.5, whatfractionislinear=0.15, vmax=None, vmin=None, cmap=None, maxsamples=defaultmaxsamples, seed=0):
     '''
     Return a probably pretty-OK colormap, a color normalization,
     and suggested tick marks for a colorbar, based on an input array.
@@ -15,8 +98,18 @@ def cmap_norm_ticks(a, whatpercentiles=[1, 99], howmanysigmaarelinear=1.5, whatf
 
     a : array
             The cmap and norm will be set on the basis of values in this array.
+
+    maxsamples : int, None
+            If `a` has more values than this, the color scale is
+            estimated from a random sample of this many of them
+            (see `sample_pixels`); None uses every value.
+
+    seed : int
+            The seed for choosing the random sample.
     '''
 
+    a = sample_pixels(a, maxsamples=maxsamples, seed=seed)
+
     if vmin is None:
         gonegative = (a <= 0).any()
     else:
@@ -54,3 +147,224 @@ def cmap_norm_ticks(a, whatpercentiles=[1, 99], howmanysigmaarelinear=1.5, whatf
         ticks = [vmin, vmin * np.sqrt(vmax / vmin), vmax]
 
     return cmap, norm, ticks
+
+
+def _describe_norm(norm):
+    '''
+    The parameters that define a normalization (to check whether
+    a quantized cube was made with the same one).
+    '''
+    description = dict(norm=type(norm).__name__)
+    for k in ['vmin', 'vmax', 'linthresh', 'linscale', 'base']:
+        value = getattr(norm, k, None)
+        if value is not None:
+            description[k] = float(value)
+    return description
+
+
+class QuantizedCube(Talker):
+    '''
+    A cube of images, stored as compact integer color indices:
+    each pixel is normalized (by the same norm used to display it)
+    and then rounded to one of a fixed number of levels. This takes
+    1 (uint8) or 2 (uint16) bytes per pixel, instead of 8 (float64),
+    and drawing an image from it needs only a lookup table.
+
+    The last three indices are reserved for values that are under
+    the color scale, over it, or bad (NaN or masked).
+    '''
+
+    def __init__(self, norm, shape, N, dtype='uint8', filename=None, description={}):
+        '''
+        Set up an (empty, or previously saved) quantized cube.
+
+        Parameters
+        ----------
+
+        norm : matplotlib.colors.Normalize
+                The normalization that maps values to colors.
+
+        shape : tuple
+                The (nrows, ncols) shape of each image.
+
+        N : int
+                The number of images.
+
+        dtype : str
+                'uint8' (253 levels) or 'uint16' (65533 levels).
+
+        filename : str, None
+                If given, the cube is memory-mapped to this .npy file
+                (with its metadata in a .json next to it), so it can be
+                reused later; if a matching cube is already saved there,
+                it's opened rather than made again.
+
+        description : dict
+                Anything else that must match, for a saved cube to be
+                reused (like the processing steps that made the images).
+        '''
+
+        Talker.__init__(self)
+        self.norm = norm
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in [np.uint8, np.uint16]:
+            raise ValueError('quantized cubes must be uint8 or uint16, not {}'.format(dtype))
+        self.levels = np.iinfo(self.dtype).max + 1 - 3
+        self.under, self.over, self.bad = self.levels, self.levels + 1, self.levels + 2
+        self.filename = filename
+
+        self.metadata = dict(shape=[int(n) for n in shape], N=int(N), dtype=self.dtype.name,
+                             **_describe_norm(norm), **description)
+        if filename is None:
+            self.cube = np.zeros((N,) + tuple(shape), dtype=self.dtype)
+            self.filled = np.zeros(N, dtype=bool)
+        else:
+            self._open()
+
+        # the value at the middle of each level (plus under, over, and bad)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            middles = np.hstack([(np.arange(self.levels) + 0.5) / self.levels, [-0.5, 1.5]])
+            self.values = np.hstack([np.ma.filled(norm.inverse(middles), np.nan), np.nan]).astype(np.float32)
+
+    def __repr__(self):
+        return '<{} | {} images of {} | {} | {}/{} filled>'.format(
+                    self.nametag, self.metadata['N'], tuple(self.metadata['shape']),
+                    self.dtype.name, np.sum(self.filled), len(self.filled))
+
+    def _open(self):
+        '''
+        Open the cube saved on disk, or make a new one there.
+        '''
+        metadatafilename = self.filename + '.json'
+        try:
+            with open(metadatafilename) as f:
+                saved = json.load(f)
+            if saved['metadata'] != self.metadata:
+                # (a cube made with different processing or colors can't be reused)
+                different = sorted(k for k in set(saved['metadata']) | set(self.metadata)
+                                   if saved['metadata'].get(k) != self.metadata.get(k))
+                self.speak('the cube in {} was made with different {}, so it will be made again'.format(
+                            self.filename, different))
+                raise AssertionError
+            self.cube = np.lib.format.open_memmap(self.filename, mode='r+')
+            self.filled = np.asarray(saved['filled'], dtype=bool)
+            self.speak('reopened {} from {}'.format(self, self.filename))
+        except (IOError, ValueError, KeyError, AssertionError):
+            self.cube = np.lib.format.open_memmap(self.filename, mode='w+', dtype=self.dtype,
+                                                  shape=(self.metadata['N'],) + tuple(self.metadata['shape']))
+            self.filled = np.zeros(self.metadata['N'], dtype=bool)
+            self.save()
+
+    def save(self):
+        '''
+        Make sure everything filled so far is saved to disk (if memory-mapped).
+        '''
+        if self.filename is None:
+            return
+        self.cube.flush()
+        with open(self.filename + '.json', 'w') as f:
+            json.dump(dict(metadata=self.metadata, filled=self.filled.tolist()), f)
+
+    @property
+    def complete(self):
+        return bool(np.all(self.filled))
+
+    def quantize(self, image):
+        '''
+        Convert an image into color indices.
+
+        Parameters
+        ----------
+
+        image : 2D array
+                The image (as it would be displayed).
+
+        Returns
+        -------
+        indices : 2D array
+                The color index of every pixel.
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            normalized = self.norm(image)
+        bad = np.ma.getmaskarray(normalized)
+        normalized = np.ma.getdata(normalized)
+        bad = bad | ~np.isfinite(normalized)
+        with np.errstate(invalid='ignore'):
+            indices = np.clip(normalized * self.levels, 0, self.levels - 1).astype(self.dtype)
+            indices[normalized < 0] = self.under
+            indices[normalized > 1] = self.over
+        indices[bad] = self.bad
+        return indices
+
+    def put(self, timestep, image):
+        '''
+        Quantize and store an image.
+
+        Parameters
+        ----------
+
+        timestep : int
+                Which image is this?
+
+        image : 2D array
+                The image (as it would be displayed).
+        '''
+        self.cube[timestep] = self.quantize(image)
+        self.filled[timestep] = True
+
+    def get(self, timestep):
+        '''
+        Get the color indices of a stored image.
+
+        Parameters
+        ----------
+
+        timestep : int
+                Which image?
+
+        Returns
+        -------
+        indices : 2D array, None
+                The color indices (or None, if not stored yet).
+        '''
+        if not self.filled[timestep]:
+            return None
+        return self.cube[timestep]
+
+    def dequantize(self, indices):
+        '''
+        Convert color indices back into (approximate) image values,
+        which the norm maps back into the same levels.
+
+        Parameters
+        ----------
+
+        indices : 2D array
+                The color indices.
+
+        Returns
+        -------
+        image : 2D array
+                The value at the middle of each pixel's level.
+        '''
+        return self.values[indices]
+
+    def lookup(self, cmap):
+        '''
+        Make a lookup table from color indices to RGBA colors.
+
+        Parameters
+        ----------
+
+        cmap : matplotlib.colors.Colormap
+                The colormap.
+
+        Returns
+        -------
+        lut : array
+                An (nindices, 4) array of uint8 RGBA colors.
+        '''
+        middles = (np.arange(self.levels) + 0.5) / self.levels
+        return np.vstack([cmap(middles, bytes=True),
+                          co.to_rgba_array([cmap.get_under(), cmap.get_over(), cmap.get_bad()]) * 255
+                          ]).astype(np.uint8)
@@ -47,19 +47,6 @@ class CCDFrame(CameraFrame):
         # give a non-empty string title for this CCD
         # self.titlefordisplay = self.name
 
-    def _transformimage(self, image):
-        '''
-        This first transforms by the CCD's transformation to get to
-        Camera coordinates, and then transforms from Camera coordinates
-        to get to display coordinates.
-
-        It reuses the definition of CameraFrame's transformations,
-        but first with the (transpose,flipx,flipy) of the CCD,
-        and then after with the (transpose,flipx,flipy) of the Camera.
-        '''
-        cameraimage = CameraFrame._transformimage(self, image)
-        return self.camera._transformimage(cameraimage)
-
     def _transformxy(self, x, y):
         '''
         This first transforms by the CCD's transformation to get to
@@ -76,6 +63,15 @@ class CCDFrame(CameraFrame):
         camerax, cameray = CameraFrame._transformxy(self, x, y)
         return self.camera._transformxy(camerax, cameray)
 
+    def _transformrecipe(self):
+        '''
+        The CCD's (transpose,flipy,flipx) step to get to Camera
+        coordinates, followed by the Camera's step to get to display.
+        (`_transformimage` reduces these to a single step, so the
+        image is only sliced and copied once.)
+        '''
+        return CameraFrame._transformrecipe(self) + self.camera._transformrecipe()
+
 class CCD1Frame(CCDFrame):
     '''
     CCDs 1 and 2 have (0,0) in the upper right.
@@ -51,26 +51,6 @@ class CameraFrame(imshowFrame):
         self.flipy     = False
         self.flipx     = False
 
-    def _transformimage(self, image):
-        '''
-        horizontal:
-                (should be) +x is up, +y is left
-                (looks like) +x is up, +y is right
-        '''
-        if self._get_orientation() == 'horizontal':
-            if self.transpose:
-                displayimage = image.T
-            else:
-                displayimage = image
-            if self.flipy:
-                displayimage = displayimage[::-1, :]
-            if self.flipx:
-                displayimage = displayimage[:, ::-1]
-        else:
-            raise RuntimeError("Sorry! No orientations besides 'horizontal' have been defined yet!")
-
-        return displayimage
-
     def _transformxy(self, x, y):
         '''
         This handles the same transformation as that which goes into
@@ -104,6 +84,20 @@ class CameraFrame(imshowFrame):
 
         return displayx, displayy
 
+    def _transformrecipe(self):
+        '''
+        The camera's transformation from its own pixels to the display,
+        as a list of (transpose, flipy, flipx) steps.
+
+        horizontal:
+                (should be) +x is up, +y is left
+                (looks like) +x is up, +y is right
+        '''
+        if self._get_orientation() == 'horizontal':
+            return [(self.transpose, self.flipy, self.flipx)]
+        else:
+            raise RuntimeError("Sorry! No orientations besides 'horizontal' have been defined yet!")
+
 
 class Camera1Frame(CameraFrame):
 
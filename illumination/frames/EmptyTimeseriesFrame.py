@@ -14,6 +14,10 @@ class EmptyTimeseriesFrame(FrameBase):
 
     frametype = 'timeseries'
 
+    # the time bar moves at every step of an animation
+    continuous = True
+    animatedingredients = ['vline']
+
     def __init__(self, name='timeseries', xlim=[None, None], ylim=[None, None], ylabel='', histogram=True, **kwargs):
         '''
         Initialize an empty timeseries frame.
@@ -90,9 +94,11 @@ class EmptyTimeseriesFrame(FrameBase):
         if self.ymin is not None and self.ymax is not None:
             plt.ylim(self.ymin, self.ymax)
 
-    def update(self, time):
+    def update(self, time, timestep=None):
         '''
         Update this frame to a particular time (for use in animations).
+
+        (The timestep is ignored, since the time bar moves continuously.)
         '''
 
         # add a vertical line
@@ -1,4 +1,5 @@
 from ..imports import *
+from ..utilities import transform_image, compose_recipe
 
 
 class FrameBase(Talker):
@@ -7,6 +8,12 @@ class FrameBase(Talker):
     timeunit = 'day'
     aspectratio = 1
 
+    # does this frame change continuously with time (rather than in discrete timesteps)?
+    continuous = False
+
+    # which of the plotted elements does .update() change?
+    animatedingredients = ['image', 'time']
+
     def __init__(self,
                     name='',
                     ax=None,
@@ -173,6 +180,23 @@ class FrameBase(Talker):
         '''
         return self.data._find_timestep(time)
 
+    def _find_timesteps(self, times):
+        '''
+        Given some times, identify their indices (all at once).
+
+        Parameters
+        ----------
+
+        times : astropy Time, array
+                The times to look up (as astropy Times, or GPS seconds).
+
+        Returns
+        -------
+        indices : array
+                The index of the *closest* time point to each time.
+        '''
+        return self.data._find_timesteps(times)
+
     def _get_times(self):
         '''
         Get the available times associated with this frame.
@@ -222,13 +246,28 @@ class FrameBase(Talker):
 
         return times, cadence
 
+    def _animated_artists(self):
+        '''
+        The plotted artists that change during an animation
+        (so they're the only ones that need to be redrawn).
+        '''
+        return [self.plotted[k] for k in self.animatedingredients
+                if isinstance(self.plotted.get(k), plt.Artist)]
+
     def _transformimage(self, image):
         '''
         Some frames will want to flip or rotate an image before display.
         This handles that transformation. (This should probably be set
         up as an matplotlib.axes transform type of thing.)
+
+        All the steps of `_transformrecipe` are reduced to one, and
+        the pixels are copied (just once) into a contiguous array,
+        so they're quick to draw and to cut regions out of.
         '''
-        return image
+        recipe = compose_recipe(self._transformrecipe())
+        if len(recipe) == 0:
+            return image
+        return np.ascontiguousarray(transform_image(image, recipe))
 
     def _transformxy(self, x, y):
         '''
@@ -237,6 +276,14 @@ class FrameBase(Talker):
         '''
         return x, y
 
+    def _transformrecipe(self):
+        '''
+        The same transformation as `_transformimage`, written
+        as a list of (transpose, flipy, flipx) steps, so it can
+        be applied to (or traced back from) part of an image.
+        '''
+        return []
+
     def _get_orientation(self):
         '''
         Figure out the orientation of the overarching illustration.
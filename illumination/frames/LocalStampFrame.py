@@ -62,6 +62,12 @@ class LocalStampFrame(imshowFrame):
         '''
         return self.data._find_timestep(time)
 
+    def _find_timesteps(self, times):
+        '''
+        Get many timesteps at once, by using the source frame.
+        '''
+        return self.data._find_timesteps(times)
+
     def position_center(self):
         return self.data.col_cent
 
@@ -117,17 +123,21 @@ class LocalStampFrame(imshowFrame):
         # keep track of the current timestep
         self.currenttimestep = timestep
 
-    def update(self, time):
+    def update(self, time, timestep=None):
         '''
         Update this frame to a particular time (for use in animations).
         '''
-        # update the data, if we need to
-        timestep = self._find_timestep(time)
-        image, actual_time = self._get_image(time)
+        if timestep is None:
+            timestep = self._find_timestep(time)
+
+        # update the data, only if we need to
+        if timestep == self.currenttimestep:
+            return
+        image, actual_time = self._get_image(time, timestep=timestep)
         if image is None:
             return
 
-        if timestep != self.currenttimestep:
-            self.plotted['image'].set_data(image)
-            timestring = self.source._timestring(actual_time)
-            self.source.plotted['time'].set_text(timestring)
+        self.plotted['image'].set_data(image)
+        timestring = self.source._timestring(actual_time)
+        self.source.plotted['time'].set_text(timestring)
+        self.currenttimestep = timestep
@@ -55,23 +55,24 @@ class LocalZoomFrame(ZoomFrame):
         '''
         return self.source._find_timestep(time)
 
-    def _get_image(self, time=None):
+    def _find_timesteps(self, times):
+        '''
+        Get many timesteps at once, by using the source frame.
+        '''
+        return self.source._find_timesteps(times)
+
+    def _get_image(self, time=None, timestep=None):
         '''
         Get the image at a given time (defaulting to the first time),
         by pulling it from the source frame.
         '''
 
-        # get the image, transform to the rotated camera frame
-        transformedbigimage, actual_time = self.source._get_image(time)
-
         # get the position of this stamp, transformed to the rotated camera frame
         transformedxy = self.source._transformxy(*self.position)
-        self.cutout = Cutout2D(transformedbigimage,
-                               transformedxy, self.size, mode='partial')
 
-        # all coordinates for the cutout are now in the transformed coordinates
-        cutoutimage = self.cutout.data
-        return cutoutimage, actual_time
+        # cut out (only) those pixels, transformed to the rotated camera frame
+        # (all coordinates for the cutout are now in the transformed coordinates)
+        return self._cut_out(transformedxy, time, timestep=timestep)
 
     def plot(self, time=None):
         '''
@@ -133,20 +134,22 @@ class LocalZoomFrame(ZoomFrame):
             timestep = None
         self.currenttimestep = timestep
 
-    def update(self, time):
+    def update(self, time, timestep=None):
         '''
         Update this frame to a particular time (for use in animations).
         '''
-        # update the data, if we need to
-        timestep = self._find_timestep(time)
-        image, actual_time = self._get_image(time)
+        if timestep is None:
+            timestep = self._find_timestep(time)
+
+        # update the data, only if we need to
+        if timestep == self.currenttimestep:
+            return
+        image, actual_time = self._get_image(time, timestep=timestep)
         if image is None:
             return
 
-        if timestep != self.currenttimestep:
-            self.plotted['image'].set_data(image)
-
-            if 'time' in self.plotted:
-                timestring = self.source._timestring(actual_time)
-                self.source.plotted['time'].set_text(timestring)
+        self.plotted['image'].set_data(image)
+        if 'time' in self.plotted:
+            timestring = self.source._timestring(actual_time)
+            self.source.plotted['time'].set_text(timestring)
         self.currenttimestep = timestep
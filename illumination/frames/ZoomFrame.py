@@ -5,6 +5,9 @@ from astropy.nddata.utils import Cutout2D
 class ZoomFrame(imshowFrame):
     frametype = "Zoom"
 
+    # (zooms show only part of their source's images)
+    sharecolorsamples = False
+
     def __init__(
         self,
         source=None,
@@ -67,6 +70,10 @@ class ZoomFrame(imshowFrame):
 
         self.cmapkw = copy.copy(cmapkw)  # why do I have to do this?
 
+        # the geometry of the cutout (worked out when first needed)
+        self.cutout = None
+        self._cutoutkey = None
+
     def _get_times(self):
         """
         Get the available times associated with this frame.
@@ -79,15 +86,55 @@ class ZoomFrame(imshowFrame):
         """
         return self.source._find_timestep(time)
 
-    def _get_image(self, time=None):
+    def _find_timesteps(self, times):
+        """
+        Get many timesteps at once, by using the source frame.
+        """
+        return self.source._find_timesteps(times)
+
+    def _get_image(self, time=None, timestep=None):
         """
         Get the image at a given time (defaulting to the first time),
         by pulling it from the source frame.
         """
 
-        bigimage, actual_time = self.source._get_image(time)
-        self.cutout = Cutout2D(bigimage, self.position, self.size, mode="partial")
-        cutoutimage = self.cutout.data
+        return self._cut_out(self.position, time, timestep=timestep)
+
+    def _cut_out(self, position, time=None, timestep=None):
+        """
+        Cut out the zoomed region, centered on a `position` in the
+        source's displayed coordinates, at a given time (or timestep).
+
+        If the source can read just part of its images, only the
+        pixels inside the cutout are read (and transformed);
+        otherwise, the whole displayed image is fetched and trimmed.
+        """
+
+        if not hasattr(self.source, "_get_region"):
+            bigimage, actual_time = self.source._get_image(time, timestep=timestep)
+            self.cutout = Cutout2D(bigimage, position, self.size, mode="partial")
+            return self.cutout.data, actual_time
+
+        # work out the geometry of the cutout once, without needing any pixels
+        key = (tuple(np.atleast_1d(position)), tuple(self.size))
+        if key != self._cutoutkey:
+            placeholder = np.broadcast_to(np.float32(np.nan), self.source._get_displayshape())
+            self.cutout = Cutout2D(placeholder, position, self.size, mode="partial")
+            self._cutoutkey = key
+
+        # read only the part of the source that lands inside the cutout
+        region, actual_time = self.source._get_region(
+            *self.cutout.slices_original, time=time, timestep=timestep
+        )
+        if region is None:
+            return None, None
+
+        # (pad with NaN, if the cutout hangs off the edge of the image)
+        cutoutimage = np.full(
+            self.cutout.shape, np.nan, dtype=np.result_type(region.dtype, np.float32)
+        )
+        cutoutimage[self.cutout.slices_cutout] = region
+        self.cutout.data = cutoutimage
         return cutoutimage, actual_time
 
     def plot(self, *args, **kwargs):
@@ -98,20 +145,23 @@ class ZoomFrame(imshowFrame):
         # add a box to the source image (cutout must have ben created, if plot has happened)
         self.cutout.plot_on_original(ax=self.source.ax, clip_on=True)
 
-    def update(self, time):
+    def update(self, time, timestep=None):
         """
         Update this frame to a particular time (for use in animations).
         """
-        # update the data, if we need to
-        timestep = self._find_timestep(time)
-        image, actual_time = self._get_image(time)
+        if timestep is None:
+            timestep = self._find_timestep(time)
+
+        # update the data, only if we need to
+        if timestep == self.currenttimestep:
+            return
+        image, actual_time = self._get_display_image(time, timestep=timestep)
         if image is None:
             return
 
-        if timestep != self.currenttimestep:
-            self.plotted["image"].set_data(image)
-            if "time" in self.plotted:
-                self.plotted["time"].set_text(self._timestring(actual_time))
+        self.plotted["image"].set_data(image)
+        if "time" in self.plotted:
+            self.plotted["time"].set_text(self._timestring(actual_time))
         self.currenttimestep = timestep
 
     def __repr__(self):
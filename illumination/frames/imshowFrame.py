@@ -1,6 +1,7 @@
 from .FrameBase import *
-from ..colors import cmap_norm_ticks
-from ..sequences import make_image_sequence
+from ..colors import cmap_norm_ticks, sample_pixels, colorsamples, defaultmaxsamples, QuantizedCube
+from ..sequences import make_image_sequence, Pipeline, make_step, FrameCache
+from ..utilities import transform_image, untransform_region, compose_recipe, block_reduce
 
 class imshowFrame(FrameBase):
     '''
@@ -14,6 +15,9 @@ class imshowFrame(FrameBase):
     xmin, xmax = None, None
     ymin, ymax = None, None
 
+    # can other frames showing the same data share its color samples?
+    sharecolorsamples = True
+
     def __init__(self,
                  name='image',
                  ax=None,
@@ -28,6 +32,12 @@ class imshowFrame(FrameBase):
                  firstframe=None,
                  cmapkw=dict(),
                  transform=None,
+                 medianmethod='exact',
+                 rawbuffer=4,
+                 processedbuffer=4,
+                 rollingwindow=5,
+                 downsample=None,
+                 downsamplehow='mean',
                  **kwargs):
         '''
         Initialize this imshowFrame, will can show a sequence of 2D images.
@@ -57,6 +67,12 @@ class imshowFrame(FrameBase):
             when initializing the frame, or any time before
             calling `i.plot()` from the illustration.
 
+        processingsteps : list, Pipeline
+            Steps to apply to each image before displaying it, in order.
+            These can be names ('subtractmedian', 'subtractprevious',
+            'subtractrollingmedian', ...), ProcessingSteps, or a whole
+            Pipeline (which can be shared among frames of the same data).
+
         cmapkw : dict
             Dictionary of keywords to feed into the cmap generation.
 
@@ -66,6 +82,39 @@ class imshowFrame(FrameBase):
             For example, this might be a transform that converts from
             pixel coordinates to local tangent-plane sky coordinates
             (as done by pix2local in the-friendly-stars).
+
+        medianmethod : str
+            How should median images (for firstframe='median' or
+            'subtractmedian') be calculated? 'exact' (the default),
+            'approximate' (from per-pixel histograms, in one pass), or
+            'auto' (exact unless the sequence is too big to fit in memory).
+
+        rawbuffer : int
+            How many of the most recent raw images should be kept
+            around for processing? (Difference images need the
+            neighboring frames too, so when animating in order,
+            each raw image only has to be read once.)
+
+        processedbuffer : int
+            How many of the most recent processed images should be
+            kept around (for zooms and repeated requests)?
+
+        rollingwindow : int
+            For 'subtractrollingmedian' or 'subtractrollingmean',
+            the background is calculated from the frames within
+            +/- this many timesteps of each one.
+
+        downsample : 'auto', int, None
+            Should images be reduced in resolution before they're
+            drawn? 'auto' combines blocks of pixels so the image
+            is about as sharp as the screen pixels it covers (and
+            no sharper); an int sets the size of the blocks; None
+            (the default) always draws every pixel. The blocks
+            are aligned with the original pixels, and any partial
+            blocks at the edges are clipped to the image.
+
+        downsamplehow : str
+            How to combine the pixels in each block, 'mean' or 'max'.
         '''
 
         # initialize the frame base
@@ -100,6 +149,30 @@ class imshowFrame(FrameBase):
         # keep track of any special affine transformation to apply
         self.transform = transform
 
+        # how should median images be calculated?
+        self.medianmethod = medianmethod
+
+        # the processing pipeline is set up (from the steps) when first needed
+        self.rawbuffer = rawbuffer
+        self.processedbuffer = processedbuffer
+        self.rollingwindow = rollingwindow
+        self._pipeline, self._pipelinesteps = None, None
+
+        # the most recent images, transformed for display (shared with zooms)
+        self._transformed = FrameCache(maxbytes=np.inf, maxitems=processedbuffer,
+                                       name='{}-transformed'.format(name))
+
+        # images are drawn reduced by this factor (chosen when plotted)
+        self.downsample = downsample
+        self.downsamplehow = downsamplehow
+        self.displayfactor = 1
+        self._reduced = FrameCache(maxbytes=np.inf, maxitems=processedbuffer,
+                                   name='{}-reduced'.format(name))
+
+        # the images can be quantized into color indices (see .quantize)
+        self.quantized = None
+        self.currentindices = None
+
         # if there's an image, use it to set the size
         if self.transform is None:
             try:
@@ -162,6 +235,45 @@ class imshowFrame(FrameBase):
                          self.plotted['norm'],
                          self.plotted['ticks'])
 
+    def _get_color_sample(self, maxsamples=defaultmaxsamples, seed=0):
+        '''
+        Sample the pixels of the first (processed) image,
+        for choosing a color scale.
+
+        Samples are kept with the sequence, for each set of processing
+        steps (and their parameters), so making the plot again (or another frame that shows the
+        same data) doesn't need to read and sample the image again.
+
+        Parameters
+        ----------
+        maxsamples : int, None
+            The most pixels to sample (see `colors.sample_pixels`).
+
+        seed : int
+            The seed for the random choice of pixels.
+
+        Returns
+        -------
+        sample : 1D array
+            The sampled pixel values.
+
+        size : int
+            The number of pixels the sample was drawn from.
+        '''
+        def load():
+            image, actual_time = self._get_image()
+            if image is None:
+                raise IndexError('{} has no image to sample'.format(self))
+            return sample_pixels(image, maxsamples=maxsamples, seed=seed), np.size(image)
+
+        if not self.sharecolorsamples:
+            return load()
+        key = (self.pipeline.description, maxsamples, seed)
+        samples = colorsamples.setdefault(self.data, {})
+        if key not in samples:
+            samples[key] = load()
+        return samples[key]
+
     def _ensure_colorbar_exists(self, image):
         '''
         Make sure this axes has its colorbar created.
@@ -289,6 +401,7 @@ class imshowFrame(FrameBase):
 
         # kind of a kludge (to make the plots and cmaps reset)?
         self.plotted = {}
+        self.quantized, self.currentindices = None, None
 
         # pull out the array to work on
         image, actual_time = self._get_image(time)
@@ -299,15 +412,19 @@ class imshowFrame(FrameBase):
             # pull out the cmap, normalization, and suggested ticks
             cmap, norm, ticks = self._cmap_norm_ticks(image, **self.cmapkw)
 
-            # display the image for this frame
-            extent = [0, image.shape[1], 0, image.shape[0]]
+            # display the image for this frame (at roughly the screen's resolution)
+            f = self.displayfactor = self._choose_displayfactor(image.shape)
+            self._reduced.clear()
+            extent = [0, -(-image.shape[1] // f) * f, 0, -(-image.shape[0] // f) * f]
 
             # make a stacked image
             if self.firstframe is None:
                 firstimage = image
             elif self.firstframe == 'median':
                 #assert(np.size(image) < 10000 or self.data.N < 50)
-                firstimage = self.data.median()
+                firstimage = self.data.median(method=self.medianmethod)
+            if f > 1:
+                firstimage = block_reduce(firstimage, f, self.downsamplehow)
 
             # do we need to apply any fancy transformation to the imshow?
             if self.transform is None:
@@ -317,6 +434,13 @@ class imshowFrame(FrameBase):
                         origin='lower',
                         norm=norm,
                         cmap=cmap)
+                if f > 1:
+                    # don't draw the padding of partial blocks beyond the edges
+                    # (a Polygon, because a Rectangle would replace the axes' clip box)
+                    nrows, ncols = image.shape
+                    self.plotted['image'].set_clip_path(
+                        plt.Polygon([[0, 0], [ncols, 0], [ncols, nrows], [0, nrows]],
+                                    transform=self.ax.transData))
             else:
                 self.ax.imshow(firstimage,
                      origin='lower',
@@ -371,47 +495,63 @@ class imshowFrame(FrameBase):
             timestep = None
         self.currenttimestep = timestep
 
-    def get_processed_image(self, timestep):
+    @property
+    def pipeline(self):
+        '''
+        The processing Pipeline for this frame's images, made from
+        `processingsteps` (and remade whenever those change).
+        '''
+        if isinstance(self.processingsteps, Pipeline):
+            return self.processingsteps
+        steps = list(self.processingsteps)
+        if (self._pipeline is None) or (steps != self._pipelinesteps):
+            self._pipeline = Pipeline(
+                [make_step(k, medianmethod=self.medianmethod, rollingwindow=self.rollingwindow)
+                 for k in steps],
+                buffer=self.processedbuffer,
+                rawbuffer=self.rawbuffer,
+                name='{}-pipeline'.format(self.name))
+            self._pipelinesteps = steps
+        return self._pipeline
+
+    def get_processed_image(self, timestep, region=None):
         '''
         Get the image, and apply any extra processing
         steps to it (subtract differences, normalize,
         subtract smooth backgrounds, etc...?)
-        '''
 
-        # pull out the raw image
-        rawimage = self.data[timestep]
-        assert(rawimage is not None)
-
-        if 'subtractmedian' in self.processingsteps:
-            processedimage = rawimage - self.data.median()
-            #self.speak('subtracted median image')
-        elif 'subtractmean' in self.processingsteps:
-            processedimage = rawimage - self.data.mean()
-        elif 'subtractbackground' in self.processingsteps:
-            processedimage = rawimage - np.median(rawimage)
-        elif 'subtractprevious' in self.processingsteps:
-            comparison = timestep - 1 #this wraps at the end
-            processedimage = rawimage - self.data[comparison]
-        elif 'subtractbeforeandafter' in self.processingsteps:
-            before = timestep - 1
-            after = (timestep + 1)%len(self.data)
-            processedimage = rawimage - 0.5*(self.data[before] + self.data[after])
-        else:
-            processedimage = rawimage
-        return processedimage
+        Parameters
+        ----------
+        timestep : int
+            Which element of the sequence?
+
+        region : (slice, slice), None
+            The (rows, cols) of the original image to process,
+            if we only need part of it (by default, the whole thing).
+
+        The steps are applied in order by this frame's `pipeline`,
+        which keeps the most recent output of each step (so difference
+        images don't reread their neighbors) and times each step.
+        '''
+        assert(timestep is not None)
+        if (region is not None) and not self.pipeline.regionsafe:
+            return self.pipeline.process(self.data, timestep)[region]
+        return self.pipeline.process(self.data, timestep, region=region)
 
-    def _get_image(self, time=None):
+    def _get_image(self, time=None, timestep=None):
         '''
-        Get the image at a given time (defaulting to the first time).
+        Get the image at a given time (defaulting to the first time),
+        or at a given timestep (if it's already known).
         '''
 
         try:
-            if time is None:
-                time = self._get_times()[0]
-            timestep = self._find_timestep(time)
+            if timestep is None:
+                if time is None:
+                    time = self._get_times()[0]
+                timestep = self._find_timestep(time)
 
-            processedimage = self.get_processed_image(timestep)
-            image = self._transformimage(processedimage)
+            image = self._transformed.fetch(self._transformedkey(timestep),
+                        lambda: self._transformimage(self.get_processed_image(timestep)))
             actual_time = self._get_times()[timestep]
             # self.speak(" ")
             # self.speak(time, timestep)
@@ -419,6 +559,186 @@ class imshowFrame(FrameBase):
             return None, None
         return image, actual_time
 
+    def _transformedkey(self, timestep):
+        '''
+        The key under which the transformed image for a
+        timestep is cached (which changes if the data, processing
+        steps, or transformation change).
+        '''
+        return (timestep, self.data, self.pipeline, tuple(compose_recipe(self._transformrecipe())))
+
+    def _choose_displayfactor(self, shape):
+        '''
+        How many image pixels should be combined (along each side)
+        into each one that's drawn, so the image has roughly the
+        resolution of the part of the screen its axes cover?
+
+        Parameters
+        ----------
+        shape : tuple
+            The (nrows, ncols) of the image, as displayed.
+
+        Returns
+        -------
+        factor : int
+            The size of the blocks (1 = draw every pixel).
+        '''
+        if self.downsample in [None, False]:
+            return 1
+        if self.downsample != 'auto':
+            return max(int(self.downsample), 1)
+        if (self.transform is not None) or (self.ax is None):
+            return 1
+
+        # how many image pixels span the axes, and how many screen pixels do they cover?
+        spans = [shape[0] if None in [self.ymin, self.ymax] else np.abs(self.ymax - self.ymin),
+                 shape[1] if None in [self.xmin, self.xmax] else np.abs(self.xmax - self.xmin)]
+        box = self.ax.get_window_extent()
+        screen = [box.height, box.width]
+        if np.min(screen) <= 0:
+            return 1
+        return max(int(np.floor(np.min(np.divide(spans, screen)))), 1)
+
+    def _get_display_image(self, time=None, timestep=None):
+        '''
+        Get the image at a given time (or timestep), reduced to
+        the resolution at which it's drawn (by `displayfactor`).
+        The most recent reduced images are kept around.
+        '''
+        if self.displayfactor <= 1:
+            return self._get_image(time, timestep=timestep)
+
+        try:
+            if timestep is None:
+                if time is None:
+                    time = self._get_times()[0]
+                timestep = self._find_timestep(time)
+            actual_time = self._get_times()[timestep]
+        except (IndexError, AssertionError, ValueError):
+            return None, None
+
+        key = (timestep, self.displayfactor, self.downsamplehow)
+        reduced = self._reduced.get(key)
+        if reduced is None:
+            image, actual_time = self._get_image(time, timestep=timestep)
+            if image is None:
+                return None, None
+            reduced = block_reduce(image, self.displayfactor, self.downsamplehow)
+            reduced = self._reduced.put(key, reduced)
+        return reduced, actual_time
+
+    def quantize(self, dtype='uint8', filename=None):
+        '''
+        Quantize every image of this frame (as it's displayed) into
+        a compact cube of color indices, through the frame's color
+        normalization. Afterwards, updating the frame draws from the
+        cube, without reading or processing any images.
+
+        This should be called after the frame has been plotted
+        (so its normalization has been chosen).
+
+        Parameters
+        ----------
+        dtype : str
+            'uint8' (253 color levels) or 'uint16' (65533 levels),
+            8 or 4 times smaller than float64 images.
+
+        filename : str, None
+            If given, store the cube in this .npy file, memory-mapped,
+            so rendering the same data again (with the same color scale
+            and processing) can reuse it instead of making it again.
+
+        Returns
+        -------
+        cube : QuantizedCube
+            The quantized images.
+        '''
+        if 'norm' not in self.plotted:
+            raise RuntimeError('{} must be plotted before it can be quantized'.format(self))
+
+        # (a saved cube is only reused if these match, as well as the color scale)
+        description = dict(steps=[step.description for step in self.pipeline.steps],
+                           displayfactor=int(self.displayfactor),
+                           downsamplehow=self.downsamplehow,
+                           transform=[[bool(x) for x in step] for step in self._transformrecipe()])
+        shape = self.plotted['image'].get_array().shape
+        N = len(self._get_times())
+        cube = QuantizedCube(self.plotted['norm'], shape, N,
+                             dtype=dtype, filename=filename, description=description)
+
+        missing = np.flatnonzero(~cube.filled)
+        for i, timestep in enumerate(missing):
+            self.speak(' quantized {}/{} images'.format(i + 1, len(missing)), progress=True)
+            image, actual_time = self._get_display_image(timestep=int(timestep))
+            cube.put(timestep, image)
+        cube.save()
+        self.speak('quantized the images into {}'.format(cube))
+        self.quantized = cube
+
+        # show the current image from the cube, too
+        if (self.currenttimestep is not None) and ('image' in self.plotted):
+            self.currentindices = cube.get(self.currenttimestep)
+            self.plotted['image'].set_data(cube.dequantize(self.currentindices))
+        return cube
+
+    def _get_displayshape(self):
+        '''
+        Get the (nrows, ncols) shape of the images, as displayed.
+        '''
+        shape = self.pipeline.outputshape(self.data.shape[-2:])
+        for transpose, flipy, flipx in self._transformrecipe():
+            if transpose:
+                shape = shape[::-1]
+        return shape
+
+    def _get_region(self, rows, cols, time=None, timestep=None):
+        '''
+        Get part of the image at a given time (or timestep), as displayed,
+        reading only the pixels of the original image that land there
+        (or cutting it out of the whole displayed image, if this frame
+        has already made that for the same timestep).
+
+        Parameters
+        ----------
+        rows, cols : slice
+            The region of the displayed (transformed) image.
+
+        time : astropy Time
+            The time to show (defaulting to the first time).
+
+        timestep : int, None
+            The timestep to show, if it's already known.
+
+        Returns
+        -------
+        image : 2D array
+            The displayed image within the region.
+
+        actual_time : astropy Time
+            The time of that image.
+        '''
+
+        try:
+            if timestep is None:
+                if time is None:
+                    time = self._get_times()[0]
+                timestep = self._find_timestep(time)
+
+            # if the whole image has already been transformed, cut from it
+            full = self._transformed.get(self._transformedkey(timestep))
+            if full is not None:
+                image = full[rows, cols]
+            else:
+                recipe = self._transformrecipe()
+                shape = self.pipeline.outputshape(self.data.shape[-2:])
+                region = untransform_region(rows, cols, shape, recipe)
+                processedimage = self.get_processed_image(timestep, region=region)
+                image = transform_image(processedimage, recipe)
+            actual_time = self._get_times()[timestep]
+        except (IndexError, AssertionError, ValueError):
+            return None, None
+        return image, actual_time
+
     def _get_alternate_time(self, time=None):
         '''
         The time are still a little kludgy.
@@ -433,19 +753,37 @@ class imshowFrame(FrameBase):
                 pass
         return actual_time
 
-    def update(self, time):
+    def update(self, time, timestep=None):
         '''
         Update this frame to a particular time (for use in animations).
+
+        Parameters
+        ----------
+        time : astropy Time
+            The time to show.
+
+        timestep : int, None
+            The timestep to show, if it's already known
+            (for example, from an animation's Timeline).
         '''
-        # update the data, if we need to
-        timestep = self._find_timestep(time)
-        image, actual_time = self._get_image(time)
+        if timestep is None:
+            timestep = self._find_timestep(time)
+
+        # update the data, only if we need to
+        if timestep == self.currenttimestep:
+            return
+        indices = None if self.quantized is None else self.quantized.get(timestep)
+        if indices is not None:
+            # (draw from the quantized cube, without reading or processing anything)
+            image, actual_time = self.quantized.dequantize(indices), self._get_times()[timestep]
+        else:
+            image, actual_time = self._get_display_image(time, timestep=timestep)
         if image is None:
             return
+        self.currentindices = indices
 
-        if timestep != self.currenttimestep:
-            if 'image' in self.plotingredients:
-                self.plotted['image'].set_data(image)
-            if 'time' in self.plotingredients:
-                self.plotted['time'].set_text(self._timestring(actual_time))
+        if 'image' in self.plotingredients:
+            self.plotted['image'].set_data(image)
+        if 'time' in self.plotingredients:
+            self.plotted['time'].set_text(self._timestring(actual_time))
         self.currenttimestep = timestep
@@ -1,8 +1,17 @@
 from ..imports import *
 from ..sequences import *
 from ..frames import *
-from ..colors import cmap_norm_ticks
+from ..colors import cmap_norm_ticks, combine_samples, defaultmaxsamples
 from ..utilities import *
+import matplotlib as mpl
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import multiprocessing
+import tempfile
+import traceback
+import queue
+import sys
+from .Timeline import Timeline
+from .RasterRenderer import RasterRenderer
 
 
 class IllustrationBase(Talker):
@@ -79,6 +88,9 @@ class IllustrationBase(Talker):
         #
         self.plotted = {}
 
+        # (nothing is being blitted until an animation needs it)
+        self._blitted, self._blitbackground = [], None
+
     def __repr__(self):
         """
         How should this illustration be represented?
@@ -175,6 +187,26 @@ class IllustrationBase(Talker):
         for k, f in self.frames.items():
             f.update(*args, **kwargs)
 
+    def _update_step(self, timeline, step):
+        """
+        Update all the frames in this illustration to
+        one step of an animation, using its timeline.
+
+        Parameters
+        ----------
+        timeline : Timeline
+            The precomputed plan for the animation.
+
+        step : int
+            Which step of the animation to show?
+        """
+        time = timeline.time(step)
+        for j, (k, f) in enumerate(self.frames.items()):
+            if timeline.continuous[j]:
+                f.update(time)
+            else:
+                f.update(time, timestep=timeline.timesteps[step, j])
+
     def _cmap_norm_ticks(self, remake=False, **cmapkw):
         """
         Return the cmap and normalization.
@@ -192,18 +224,23 @@ class IllustrationBase(Talker):
             assert remake == False
         except (KeyError, AssertionError):
 
-            # collect all the (first) images
-            firstimages = []
+            # sample the pixels of all the (first) images
+            maxsamples = cmapkw.get("maxsamples", defaultmaxsamples)
+            seed = cmapkw.get("seed", 0)
+            samples, sizes = [], []
             for name, frame in self.frames.items():
                 try:
-                    firstimages.extend(frame._get_image()[0].flatten())
+                    sample, size = frame._get_color_sample(maxsamples=maxsamples, seed=seed)
+                    samples.append(sample)
+                    sizes.append(size)
                     self.speak("included {} in the shared color scheme".format(frame))
                 except (TypeError, IndexError, AttributeError):
                     self.speak("found no color scheme data for {}".format(frame))
 
-            # create the cmap from the given data
+            # create the cmap from the given data (sampled as if it were all one image)
+            combined = combine_samples(samples, sizes, maxsamples=maxsamples, seed=seed)
             (self.plotted["cmap"], self.plotted["norm"], self.plotted["ticks"]) = (
-                cmap_norm_ticks(np.asarray(firstimages), **cmapkw)
+                cmap_norm_ticks(combined, **cmapkw)
             )
             self.speak(
                 "defined color scheme with \n cmap={}\n norm={}\n ticks={}".format(
@@ -309,6 +346,12 @@ class IllustrationBase(Talker):
         cadence=1 * u.s,
         fps=30,
         dpi=None,
+        prefetch=False,
+        prefetchworkers=2,
+        blit=False,
+        renderer="matplotlib",
+        workers=None,
+        deduplicate=False,
         **kw,
     ):
         """
@@ -321,6 +364,44 @@ class IllustrationBase(Talker):
         ----------
 
         filename : str
+
+        prefetch : bool, int
+            Should images be read on background threads,
+            ahead of when they're needed? If an int,
+            this sets how many images can be read ahead
+            (for each sequence); True means 8.
+
+        prefetchworkers : int
+            How many background threads should read
+            images for each sequence (if prefetching)?
+
+        blit : bool
+            Should the static parts of the figure (axes, colorbars,
+            labels, titles, arrows) be drawn only once, so that only
+            the images and time labels get redrawn at each step?
+            (This needs an ffmpeg or pillow writer; if blitting
+            isn't possible, every frame is redrawn as usual.)
+
+        renderer : str
+            How should frames be drawn?
+                'matplotlib' = let matplotlib draw each frame
+                'raster' = draw the static parts with matplotlib once,
+                           then color and place the images of imshow
+                           frames directly with numpy (this is much
+                           faster, but needs an ffmpeg or pillow writer)
+
+        workers : int, None
+            If more than 1, the animation is split into this many
+            contiguous segments, each rendered by its own worker
+            process, and then joined together (without re-encoding,
+            for .mp4). This needs processes that can be forked.
+
+        deduplicate : bool
+            Should steps where nothing changes (because the animation's
+            cadence is finer than the data's) reuse the last frame,
+            rather than drawing and saving the figure again? (GIFs
+            hold the last frame for longer, so they have fewer frames
+            with varying durations; movies repeat it.)
         """
 
         if self.hasbeenplotted == False:
@@ -349,33 +430,393 @@ class IllustrationBase(Talker):
             upper = lower + np.minimum(upper - lower, maxtimespan.to("s").value)
 
         times = np.arange(lower, upper, cadence)
+
+        # work out which timestep every frame shows at every step, all at once
+        self.timeline = Timeline(self.frames, times)
         self.speak(
-            "about to animate {} times at {}s cadence for {}".format(
-                len(times), cadence, self
+            "about to animate {} times at {}s cadence for {} ({})".format(
+                len(times), cadence, self, self.timeline
             )
         )
 
-        # get the writer
-        writer = get_writer(filename, fps=fps)
+        if renderer not in ["matplotlib", "raster"]:
+            raise ValueError('"{}" is not a renderer'.format(renderer))
         self.speak("{} frames/second :".format(fps))
         self.speak("the animation will be saved to {}".format(filename))
-        # set up the animation writer
-        with writer.saving(self.figure, filename, dpi or self.figure.get_dpi()):
-            for i, t in enumerate(times):
-                self.speak(
-                    "  {}/{} at {}".format(i + 1, len(times), Time.now().iso),
-                    progress=True,
-                )
 
-                # update the illustration to a new time
-                # self.speak(
-                #    "setting time to {}".format(Time(t, format="gps", scale="tdb"))
-                # )
-                self.update(Time(t, format="gps", scale="tdb"))
-                writer.grab_frame()
+        # render the frames, either here or split among worker processes
+        options = dict(fps=fps, dpi=dpi, prefetch=prefetch, prefetchworkers=prefetchworkers,
+                       blit=blit, renderer=renderer, deduplicate=deduplicate)
+        if (workers or 1) > 1:
+            self._render_in_parallel(filename, self.timeline, workers=workers, **options)
+        else:
+            self._render(filename, self.timeline, **options)
+
         self.speak("")
         self.speak("the animation is finished!")
 
+    def _render(
+        self,
+        filename,
+        timeline,
+        fps=30,
+        dpi=None,
+        prefetch=False,
+        prefetchworkers=2,
+        blit=False,
+        renderer="matplotlib",
+        deduplicate=False,
+        progress=None,
+    ):
+        """
+        Render the steps of a timeline into an animation file
+        (see `animate` for the meaning of the options).
+
+        Parameters
+        ----------
+        filename : str
+            Where should the animation be saved?
+
+        timeline : Timeline
+            The plan for the animation.
+
+        progress : function, None
+            If given, this is called with the number of steps
+            that have been rendered so far (instead of speaking).
+        """
+
+        # get the writer
+        writer = get_writer(filename, fps=fps, variable=deduplicate)
+
+        # start reading images ahead of when they're needed
+        if prefetch:
+            depth = 8 if prefetch is True else int(prefetch)
+            self._start_prefetching(timeline, depth=depth, workers=prefetchworkers)
+        raster = None
+
+        # (blitting and rasterizing need the figure to be drawn at the movie's resolution)
+        originaldpi = self.figure.get_dpi()
+        if (blit or renderer == "raster") and (dpi is not None):
+            self.figure.set_dpi(dpi)
+
+        # set up the animation writer
+        try:
+            with writer.saving(self.figure, filename, dpi or self.figure.get_dpi()):
+                if renderer == "raster":
+                    raster = RasterRenderer(self)
+                    if not raster.setup(writer):
+                        raster = None
+                blitting = (raster is None) and blit and self._start_blitting(writer)
+                deduplicating = deduplicate and can_push_frames(writer)
+                last = None
+                for i in range(len(timeline)):
+                    if progress is None:
+                        self.speak(
+                            "  {}/{} at {}".format(i + 1, len(timeline), Time.now().iso),
+                            progress=True,
+                        )
+
+                    # update the illustration to a new time (if anything changes)
+                    if timeline.changed[i]:
+                        self._update_step(timeline, i)
+                    if progress is not None:
+                        progress(i + 1)
+
+                    # reuse the last frame, if nothing changed
+                    if deduplicating and (last is not None) and not timeline.changed[i]:
+                        repeat_frame(writer, last)
+                        continue
+
+                    if raster is not None:
+                        last = raster.render()
+                    elif blitting:
+                        last = self._render_blitted()
+                    elif deduplicating:
+                        last = render_frame(writer)
+                    else:
+                        writer.grab_frame()
+                        continue
+                    push_frame(writer, last)
+        finally:
+            self._stop_prefetching()
+            self._stop_blitting()
+            self.figure.set_dpi(originaldpi)
+
+    def _render_segment(self, k, timeline, segment, filename, messages, **options):
+        """
+        Render one contiguous segment of a timeline, inside a
+        (forked) worker process, reporting back through a queue.
+
+        Parameters
+        ----------
+        k : int
+            Which segment is this?
+
+        timeline : Timeline
+            The plan for the whole animation.
+
+        segment : tuple
+            The (start, stop) steps of this segment.
+
+        filename : str
+            Where should this segment be saved?
+
+        messages : multiprocessing.Queue
+            Where to send (k, 'progress', nsteps),
+            (k, 'done', None), or (k, 'failed', traceback).
+
+        **options are passed to `_render`
+        """
+        try:
+            # draw headlessly, and leave the talking to the parent process
+            FigureCanvasAgg(self.figure)
+            sys.stdout = open(os.devnull, "w")
+
+            start, stop = segment
+            part = Timeline(self.frames, timeline.gps[start:stop])
+            self._render(filename, part, progress=lambda n: messages.put((k, "progress", n)), **options)
+            messages.put((k, "done", None))
+        except Exception:
+            messages.put((k, "failed", traceback.format_exc()))
+
+    def _render_in_parallel(self, filename, timeline, workers=2, **options):
+        """
+        Split a timeline into contiguous segments, render each in
+        its own worker process, and join them into one animation.
+
+        The workers are forked from this process, so each starts
+        with its own copy of the (already plotted) illustration.
+        If a worker fails, the others carry on, and its segment
+        is rendered again here before everything is joined.
+
+        Parameters
+        ----------
+        filename : str
+            Where should the animation be saved?
+
+        timeline : Timeline
+            The plan for the animation.
+
+        workers : int
+            How many worker processes should render segments?
+
+        **options are passed to `_render`
+        """
+        if "fork" not in multiprocessing.get_all_start_methods():
+            self.speak("worker processes can't be forked here; rendering in one process")
+            return self._render(filename, timeline, **options)
+        context = multiprocessing.get_context("fork")
+
+        # split the steps into contiguous segments, one per worker
+        edges = np.linspace(0, len(timeline), workers + 1).astype(int)
+        segments = [(a, b) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+        base, extension = os.path.splitext(os.path.abspath(filename))
+        directory = tempfile.mkdtemp(prefix=os.path.basename(base) + "-segments-",
+                                     dir=os.path.dirname(base))
+        filenames = [os.path.join(directory, "segment-{:04d}{}".format(k, extension))
+                     for k in range(len(segments))]
+        self.speak("rendering {} steps in {} segments, each on its own worker process".format(
+                    len(timeline), len(segments)))
+
+        try:
+            messages = context.Queue()
+            processes = [context.Process(target=self._render_segment,
+                                         args=(k, timeline, segment, filenames[k], messages),
+                                         kwargs=options, daemon=True)
+                         for k, segment in enumerate(segments)]
+            for p in processes:
+                p.start()
+
+            # keep track of each worker's progress, until they've all finished
+            rendered, status = [0] * len(segments), {}
+            while len(status) < len(segments):
+                try:
+                    k, kind, value = messages.get(timeout=0.5)
+                except queue.Empty:
+                    # (did any worker die without saying so?)
+                    for k, p in enumerate(processes):
+                        if (k not in status) and (p.exitcode not in [None, 0]):
+                            status[k] = "the worker exited with code {}".format(p.exitcode)
+                    continue
+                if kind == "progress":
+                    rendered[k] = value
+                    self.speak("  " + " | ".join(["{}/{}".format(n, b - a)
+                                for n, (a, b) in zip(rendered, segments)]), progress=True)
+                else:
+                    status[k] = value
+            for p in processes:
+                p.join()
+            self.speak("")
+
+            # render any segments that failed again, here
+            for k in sorted(status):
+                if status[k] is None:
+                    continue
+                self.speak("segment {} failed, so rendering it again:\n{}".format(k, status[k]))
+                a, b = segments[k]
+                self._render(filenames[k], Timeline(self.frames, timeline.gps[a:b]), **options)
+
+            # join the segments together
+            self.speak("joining {} segments into {}".format(len(segments), filename))
+            concatenate_animations(filenames, filename, fps=options.get("fps", 30))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _start_blitting(self, writer):
+        """
+        Draw everything that won't change during the animation
+        once, and keep it as a background for every frame.
+
+        Parameters
+        ----------
+        writer : matplotlib.animation.AbstractMovieWriter
+            The writer that frames will be pushed to.
+
+        Returns
+        -------
+        blitting : bool
+            Whether blitting could be set up.
+        """
+        canvas = self.figure.canvas
+        if not (can_push_frames(writer) and all(
+                hasattr(canvas, k) for k in ["copy_from_bbox", "restore_region", "buffer_rgba"])):
+            self.speak("blitting is not possible with {}; redrawing every frame".format(writer))
+            return False
+        if tuple(canvas.get_width_height(physical=True)) != tuple(writer.frame_size):
+            self.speak("the figure and the movie have different sizes; redrawing every frame")
+            return False
+
+        # the artists that change (and anything layered on top of them in their axes)
+        changing = []
+        for f in self.frames.values():
+            changing.extend(f._animated_artists())
+        animated = []
+        for ax in self.figure.axes:
+            here = [a for a in changing if a.axes is ax]
+            if len(here) == 0:
+                continue
+            lowest = min(a.get_zorder() for a in here)
+            animated.extend(self._artists_above(ax, lowest))
+        animated.extend([a for a in changing if a.axes is None])
+
+        self._blitted = [(a, a.get_animated()) for a in animated]
+        for a in animated:
+            a.set_animated(True)
+
+        # draw the static background, once
+        canvas.draw()
+        self._blitbackground = canvas.copy_from_bbox(self.figure.bbox)
+        self.speak("blitting {} changing artists onto a static background".format(len(animated)))
+        return True
+
+    def _artists_above(self, ax, zorder):
+        """
+        The visible artists drawn in an axes at or above a zorder
+        (not counting its background patch or its axis ticks and labels).
+
+        Parameters
+        ----------
+        ax : matplotlib.axes.Axes
+            The axes to look in.
+
+        zorder : float
+            The lowest zorder to include.
+
+        Returns
+        -------
+        artists : list
+            The artists, in the order they're drawn.
+        """
+        hidden = (ax.patch,) if ax.axison else (ax.patch, *ax.spines.values())
+        artists = [a for a in ax.get_children()
+                   if (a.get_zorder() >= zorder) and a.get_visible()
+                   and (a not in hidden) and not isinstance(a, mpl.axis.Axis)]
+        return sorted(artists, key=lambda a: a.get_zorder())
+
+    def _render_blitted(self):
+        """
+        Draw the changing artists over the static background.
+
+        Returns
+        -------
+        rgba : array
+            An (nrows, ncols, 4) array of uint8 RGBA pixels.
+        """
+        canvas = self.figure.canvas
+        canvas.restore_region(self._blitbackground)
+        for a, _ in self._blitted:
+            self.figure.draw_artist(a)
+        return np.array(canvas.buffer_rgba())
+
+    def _stop_blitting(self):
+        """
+        Put the artists back the way they were before blitting.
+        """
+        for a, animated in self._blitted:
+            a.set_animated(animated)
+        self._blitted, self._blitbackground = [], None
+
+    def _prefetchable_sequences(self):
+        """
+        Find the (unique) sequences in this illustration
+        that can read their images ahead of time.
+        """
+        sequences = []
+        for f in self.frames.values():
+            s = getattr(f, "data", None)
+            if hasattr(s, "prefetch") and not np.any([s is other for other in sequences]):
+                sequences.append(s)
+        return sequences
+
+    def _start_prefetching(self, timeline, depth=8, workers=2):
+        """
+        Start prefetching images for every sequence in this
+        illustration, in the order the animation will need them.
+
+        Parameters
+        ----------
+        timeline : Timeline
+            The plan for the animation.
+
+        depth : int
+            The maximum number of images to read ahead, for each sequence.
+
+        workers : int
+            The number of background threads reading images, for each sequence.
+        """
+        for s in self._prefetchable_sequences():
+            # (use the timeline's column for a frame showing this sequence, if there is one)
+            columns = [j for j, k in enumerate(timeline.names)
+                       if (getattr(self.frames[k], "data", None) is s) and not timeline.continuous[j]]
+            if len(columns) > 0:
+                timesteps = timeline.timesteps[:, columns[0]]
+            else:
+                timesteps = s._find_timesteps(timeline.gps)
+            p = s.prefetch(timesteps, depth=depth, workers=workers)
+            self.speak("prefetching images for {} with {}".format(s, p))
+
+    def _stop_prefetching(self):
+        """
+        Stop prefetching images, and report how well it worked.
+
+        Returns
+        -------
+        statistics : dict
+            The prefetching statistics, keyed by sequence.
+        """
+        statistics = {}
+        for s in self._prefetchable_sequences():
+            this = s.stop_prefetching()
+            if this is not None:
+                self.speak(
+                    "prefetching for {} had {requests} requests, {ready} ready, "
+                    "{stalls} stalls ({stalltime:.3f}s), {misses} misses, "
+                    "queue depth {meandepth:.1f} (mean) {maxdepth} (max)".format(s, **this)
+                )
+                statistics[s] = this
+        self.prefetchstatistics = statistics
+        return statistics
+
 
 """
 class Row(IllustrationBase):
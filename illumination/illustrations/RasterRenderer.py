@@ -0,0 +1,318 @@
+"""
+Render animation frames directly into RGB arrays, without asking
+matplotlib to resample and draw every image at every step.
+
+Everything that doesn't change during an animation (the figure,
+axes, colorbars, titles, arrows) is drawn by matplotlib once. Then,
+at each step, the images of imshowFrames are sampled onto the
+pixels their axes cover and colored with a lookup table built from
+the frame's own cmap and norm, the static decorations that sit on
+top of the images are laid over them, and anything else that
+changes (like time labels) is drawn by Agg onto a transparent layer.
+"""
+
+from ..imports import *
+from ..utilities import can_push_frames
+from matplotlib.backends.backend_agg import RendererAgg
+import matplotlib as mpl
+
+__all__ = ["RasterRenderer"]
+
+
+def _composite(under, over):
+    """
+    Lay RGBA pixels over others, in place.
+
+    Parameters
+    ----------
+    under : array
+        The (nrows, ncols, 4) uint8 pixels to draw onto.
+
+    over : array
+        The (nrows, ncols, 4) uint8 pixels to lay on top.
+    """
+    alpha = over[..., 3]
+    opaque = alpha == 255
+    under[opaque] = over[opaque]
+    partial = (alpha > 0) & ~opaque
+    if np.any(partial):
+        a = alpha[partial, np.newaxis].astype(np.float32) / 255
+        blended = over[partial].astype(np.float32) * a + under[partial].astype(np.float32) * (1 - a)
+        under[partial] = np.round(blended).astype(np.uint8)
+        under[partial, 3] = 255
+
+
+class RasterPanel(Talker):
+    """
+    The pixels on which one imshowFrame's image is displayed,
+    and how to color them for each new image.
+    """
+
+    def __init__(self, image, canvasshape, frame=None):
+        """
+        Work out which element of the image lands on each pixel.
+
+        Parameters
+        ----------
+        image : matplotlib.image.AxesImage
+            The (already drawn) image artist to replace.
+
+        canvasshape : tuple
+            The (nrows, ncols) of the whole canvas, in pixels.
+
+        frame : imshowFrame, None
+            The frame showing the image (if its images
+            have been quantized, they're colored directly).
+        """
+
+        Talker.__init__(self, prefixformat="{:>32}")
+        self.artist = image
+        self.frame = frame
+        self.name = "panel"
+        self.lut = self._lookup()
+        self._quantizedlut, self._quantizedcube = None, None
+        nrows, ncols = image.get_array().shape[:2]
+        height, width = canvasshape
+
+        # the pixels (within the canvas) that the axes cover
+        box = image.axes.bbox
+        x0, x1 = int(np.clip(np.round(box.x0), 0, width)), int(np.clip(np.round(box.x1), 0, width))
+        y0, y1 = int(np.clip(np.round(box.y0), 0, height)), int(np.clip(np.round(box.y1), 0, height))
+
+        # the data coordinates at the center of each of those pixels
+        px = np.arange(x0, x1) + 0.5
+        py = np.arange(y0, y1)[::-1] + 0.5
+        inverse = image.axes.transData.inverted()
+        x = inverse.transform(np.transpose([px, np.zeros_like(px)]))[:, 0]
+        y = inverse.transform(np.transpose([np.zeros_like(py), py]))[:, 1]
+
+        # which image column and row land on each of those pixels?
+        left, right, bottom, top = image.get_extent()
+        fx = (x - left) / (right - left)
+        fy = (y - bottom) / (top - bottom)
+        if image.origin == "upper":
+            fy = 1 - fy
+        cols = np.floor(fx * ncols).astype(int)
+        rows = np.floor(fy * nrows).astype(int)
+        okx = (cols >= 0) & (cols < ncols)
+        oky = (rows >= 0) & (rows < nrows)
+
+        # (respect any clip path, like the one trimming partial blocks off a reduced image)
+        clip = image.get_clip_path()
+        if clip is not None:
+            clipbox = clip.get_fully_transformed_path().get_extents()
+            okx &= (px >= clipbox.x0) & (px <= clipbox.x1)
+            oky &= (py >= clipbox.y0) & (py <= clipbox.y1)
+
+        # (buffer rows count down from the top of the canvas)
+        xs, ys = np.flatnonzero(okx), np.flatnonzero(oky)
+        self.cols, self.rows = cols[xs], rows[ys]
+        if len(xs) == 0 or len(ys) == 0:
+            self.window = (slice(0, 0), slice(0, 0))
+        else:
+            self.window = (slice(height - y1 + ys[0], height - y1 + ys[-1] + 1),
+                           slice(x0 + xs[0], x0 + xs[-1] + 1))
+
+    def _lookup(self):
+        """
+        The RGBA colors of the cmap, plus those of
+        values that are under, over, or bad.
+        """
+        cmap = self.artist.cmap
+        lut = np.vstack([cmap(np.arange(cmap.N), bytes=True),
+                         co.to_rgba_array([cmap.get_under(), cmap.get_over(), cmap.get_bad()])
+                         * 255]).astype(np.uint8)
+        return lut
+
+    def render(self, frame):
+        """
+        Color this panel's current image, and draw it onto a frame.
+
+        Parameters
+        ----------
+        frame : array
+            The (nrows, ncols, 4) uint8 canvas to draw onto.
+        """
+        if len(self.rows) == 0 or len(self.cols) == 0:
+            return
+
+        # if the image is quantized, its color indices can be used directly
+        indices = getattr(self.frame, "currentindices", None)
+        if indices is not None:
+            cube = self.frame.quantized
+            if self._quantizedcube is not cube:
+                self._quantizedlut, self._quantizedcube = cube.lookup(self.artist.cmap), cube
+            _composite(frame[self.window], self._quantizedlut[indices[self.rows][:, self.cols]])
+            return
+
+        # sample the image onto the display pixels
+        data = self.artist.get_array()
+        sampled = np.ma.getdata(data)[self.rows][:, self.cols]
+        bad = ~np.isfinite(sampled)
+        if np.ma.is_masked(data):
+            bad |= np.ma.getmaskarray(data)[self.rows][:, self.cols]
+
+        # normalize, and look up the colors (following Colormap.__call__)
+        cmap = self.artist.cmap
+        with np.errstate(invalid="ignore", divide="ignore"):
+            normalized = self.artist.norm(sampled)
+        bad |= np.ma.getmaskarray(normalized)
+        scaled = np.ma.getdata(normalized).astype(float) * cmap.N
+        scaled[scaled == cmap.N] = cmap.N - 1
+        under, over = scaled < 0, scaled >= cmap.N
+        with np.errstate(invalid="ignore"):
+            index = np.clip(scaled, 0, cmap.N - 1).astype(int)
+        index[under] = cmap.N
+        index[over] = cmap.N + 1
+        index[bad | ~np.isfinite(scaled)] = cmap.N + 2
+
+        _composite(frame[self.window], self.lut[index])
+
+
+class RasterRenderer(Talker):
+    """
+    Render the frames of an animation as raw RGBA arrays,
+    rasterizing images with NumPy rather than with matplotlib.
+    """
+
+    def __init__(self, illustration):
+        """
+        Set up a renderer for an illustration.
+
+        Parameters
+        ----------
+        illustration : IllustrationBase
+            The (already plotted) illustration to render.
+        """
+
+        Talker.__init__(self, prefixformat="{:>32}")
+        self.name = "rasterrenderer"
+        self.illustration = illustration
+        self.figure = illustration.figure
+
+    def __repr__(self):
+        return "<RasterRenderer | {}>".format(self.illustration)
+
+    def _split(self):
+        """
+        Sort the artists that change into those whose images can
+        be rasterized directly, and those Agg needs to draw.
+        """
+        images, others, frames = [], [], {}
+        for f in self.illustration.frames.values():
+            for a in f._animated_artists():
+                if (isinstance(a, mpl.image.AxesImage)
+                        and getattr(f, "transform", None) is None
+                        and a.get_interpolation() in ["nearest", "none"]
+                        and a.axes.transData.is_affine
+                        and a.axes.transData.is_separable):
+                    images.append(a)
+                    frames[a] = f
+                else:
+                    others.append(a)
+        return images, others, frames
+
+    def setup(self, writer):
+        """
+        Draw everything static once, and work out where the images go.
+
+        Parameters
+        ----------
+        writer : matplotlib.animation.AbstractMovieWriter
+            The writer that frames will be pushed to.
+
+        Returns
+        -------
+        ok : bool
+            Whether frames can be rendered this way.
+        """
+        canvas = self.figure.canvas
+        if not can_push_frames(writer):
+            self.speak("frames can't be pushed to {}; using matplotlib instead".format(writer))
+            return False
+        if not (hasattr(canvas, "buffer_rgba") and all(
+                hasattr(RendererAgg, k) for k in ["buffer_rgba", "clear"])):
+            self.speak("the canvas can't be rasterized into; using matplotlib instead")
+            return False
+        width, height = canvas.get_width_height(physical=True)
+        if (width, height) != tuple(writer.frame_size):
+            self.speak("the figure and the movie have different sizes; using matplotlib instead")
+            return False
+
+        images, others, frames = self._split()
+        if len(images) == 0:
+            self.speak("there are no images to rasterize; using matplotlib instead")
+            return False
+
+        # the static decorations layered on top of the images
+        decorations = []
+        for ax in set(a.axes for a in images):
+            lowest = min(a.get_zorder() for a in images if a.axes is ax)
+            decorations.extend([a for a in self.illustration._artists_above(ax, lowest)
+                                if (a not in images) and (a not in others)])
+
+        # draw the static background (without anything that sits on or changes over it)
+        hidden = [a for a in images + others + decorations if a.get_visible()]
+        for a in hidden:
+            a.set_visible(False)
+        try:
+            canvas.draw()
+            self.background = np.array(canvas.buffer_rgba())
+        finally:
+            for a in hidden:
+                a.set_visible(True)
+
+        # draw the decorations, once, onto a transparent layer
+        self.layer = RendererAgg(width, height, self.figure.dpi)
+        for a in sorted(decorations, key=lambda a: a.get_zorder()):
+            a.draw(self.layer)
+        layer = np.asarray(self.layer.buffer_rgba()).reshape(-1, 4)
+        self.decorated = np.flatnonzero(layer[:, 3] > 0)
+        self.decorations = layer[self.decorated].copy()
+
+        self.panels = [RasterPanel(a, (height, width), frame=frames[a]) for a in images]
+        self.others = sorted(others, key=lambda a: a.get_zorder())
+        self.speak("rasterizing {} image(s), with {} other changing artist(s) drawn by Agg".format(
+                    len(self.panels), len(self.others)))
+        return True
+
+    def _draw_others(self, frame):
+        """
+        Draw the changing artists that can't be rasterized
+        onto a transparent layer, and lay that over a frame.
+        """
+        if len(self.others) == 0:
+            return
+        self.layer.clear()
+        boxes = []
+        for a in self.others:
+            if a.get_visible():
+                a.draw(self.layer)
+                boxes.append(a.get_window_extent(self.layer))
+        if len(boxes) == 0:
+            return
+        box = mpl.transforms.Bbox.union(boxes)
+        height, width = frame.shape[:2]
+        x0, x1 = int(np.clip(np.floor(box.x0) - 2, 0, width)), int(np.clip(np.ceil(box.x1) + 2, 0, width))
+        y0, y1 = int(np.clip(np.floor(box.y0) - 2, 0, height)), int(np.clip(np.ceil(box.y1) + 2, 0, height))
+        window = (slice(height - y1, height - y0), slice(x0, x1))
+        _composite(frame[window], np.asarray(self.layer.buffer_rgba())[window])
+
+    def render(self):
+        """
+        Render the illustration, as it is right now.
+
+        Returns
+        -------
+        frame : array
+            An (nrows, ncols, 4) array of uint8 RGBA pixels.
+        """
+        frame = self.background.copy()
+        for p in self.panels:
+            p.render(frame)
+        flat = frame.reshape(-1, 4)
+        under = flat[self.decorated]
+        _composite(under[:, np.newaxis], self.decorations[:, np.newaxis])
+        flat[self.decorated] = under
+        self._draw_others(frame)
+        return frame
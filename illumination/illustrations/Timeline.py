@@ -0,0 +1,99 @@
+from ..imports import *
+
+__all__ = ["Timeline"]
+
+
+class Timeline(Talker):
+    """
+    A Timeline is the plan for an animation, worked out once:
+    the time shown at every step, which timestep each frame
+    should display at that step, and which steps change anything.
+    """
+
+    def __init__(self, frames, gps):
+        """
+        Resolve every frame's timesteps for every animation step.
+
+        Parameters
+        ----------
+
+        frames : dict
+            The frames of an illustration (keyed by name).
+
+        gps : array
+            The times of the animation steps (in GPS seconds).
+        """
+
+        Talker.__init__(self, prefixformat="{:>32}")
+
+        self.gps = np.asarray(gps, dtype=float)
+        self.names = list(frames.keys())
+
+        # an (nsteps x nframes) table of timesteps (-1 = the frame follows time continuously)
+        self.timesteps = np.full((len(self.gps), len(self.names)), -1, dtype=np.int64)
+        self.continuous = np.zeros(len(self.names), dtype=bool)
+        for j, name in enumerate(self.names):
+            frame = frames[name]
+            try:
+                assert frame.continuous == False
+                timesteps = frame._find_timesteps(self.gps)
+                assert timesteps is not None
+                self.timesteps[:, j] = timesteps
+            except (AssertionError, AttributeError, TypeError, ValueError, IndexError):
+                self.continuous[j] = True
+
+        # which steps change what's displayed, compared to the step before?
+        if np.any(self.continuous):
+            self.changed = np.ones(len(self.gps), dtype=bool)
+        else:
+            self.changed = np.hstack(
+                [True, np.any(self.timesteps[1:] != self.timesteps[:-1], axis=1)]
+            )[: len(self.gps)]
+
+    def __repr__(self):
+        return "<Timeline | {} steps ({} changed) | {} frames>".format(
+            len(self), np.sum(self.changed), len(self.names)
+        )
+
+    def __len__(self):
+        return len(self.gps)
+
+    def time(self, step):
+        """
+        The time displayed at a particular step.
+
+        Parameters
+        ----------
+
+        step : int
+            Which animation step?
+
+        Returns
+        -------
+        time : astropy Time
+            The time of that step.
+        """
+        return Time(self.gps[step], format="gps", scale="tdb")
+
+    def timestep(self, step, name):
+        """
+        The timestep a particular frame shows at a particular step.
+
+        Parameters
+        ----------
+
+        step : int
+            Which animation step?
+
+        name : str
+            The name of the frame.
+
+        Returns
+        -------
+        timestep : int, None
+            The frame's timestep (or None if it follows time continuously).
+        """
+        j = self.names.index(name)
+        if self.continuous[j]:
+            return None
+        return int(self.timesteps[step, j])
@@ -1,4 +1,6 @@
 from .IllustrationBase import *
+from .Timeline import *
+from .RasterRenderer import *
 from .StampsIllustration import *
 from .FourCameraIllustration import *
 from .FourCameraOfCCDsIllustration import *
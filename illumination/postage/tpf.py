@@ -2,6 +2,9 @@ from ..imports import *
 
 from lightkurve.targetpixelfile import TargetPixelFile, KeplerTargetPixelFile, KeplerTargetPixelFileFactory, KeplerQualityFlags
 from lightkurve import KeplerLightCurve, TessLightCurve
+from astropy.nddata.utils import overlap_slices
+from astropy.coordinates import SkyCoord
+from astropy.wcs import WCS
 import datetime, warnings
 from tqdm import tqdm
 
@@ -30,6 +33,40 @@ class EarlyTessLightCurve(KeplerLightCurve):
         return np.median(np.diff(self.time))*u.day
 
 
+def _read_stamp(hdu, position, size):
+    """
+    Read a stamp out of an image HDU, touching only the
+    pixels inside it (through the HDU's section, where possible).
+
+    This gives the same pixels as a partial-mode Cutout2D,
+    with NaN wherever the stamp hangs off the edge of the image.
+
+    Attributes
+    ----------
+    hdu : fits.ImageHDU
+        The image to cut the stamp out of.
+    position : astropy.SkyCoord, or (x, y)
+        Position around which to cut out pixels (as a sky
+        position, or as pixel coordinates in the image).
+    size : (int, int)
+        Dimensions (rows, cols) of the stamp.
+
+    Returns
+    -------
+    stamp : array
+        The pixels of the stamp.
+    """
+    if isinstance(position, SkyCoord):
+        x, y = WCS(hdu.header).world_to_pixel(position)
+    else:
+        x, y = position
+    shape = (hdu.header['NAXIS2'], hdu.header['NAXIS1'])
+    large, small = overlap_slices(shape, tuple(size), (y, x), mode='partial')
+    stamp = np.full(tuple(size), np.nan)
+    stamp[small] = getattr(hdu, 'section', hdu.data)[large]
+    return stamp
+
+
 class EarlyTessTargetPixelFile(KeplerTargetPixelFile):
     """
     Defines a TargetPixelFile class for early (MIT) TESS data.
@@ -297,20 +334,24 @@ class EarlyTessTargetPixelFile(KeplerTargetPixelFile):
                                                    n_cols=size[1],
                                                    target_id=target_id)
         for idx, img in tqdm(enumerate(images), total=len(images)):
+            hdulist = None
             if isinstance(img, fits.ImageHDU):
                 hdu = img
             elif isinstance(img, fits.HDUList):
                 hdu = img[extension]
             else:
-                hdu = fits.open(img)[extension]
+                # (memory-map the file, so only the stamp's pixels get read)
+                hdulist = fits.open(img, memmap=True)
+                hdu = hdulist[extension]
             if idx == 0:  # Get default keyword values from the first image
                 factory.keywords = hdu.header
             if position is None:
-                cutout = hdu
+                flux = hdu.data
             else:
-                cutout = Cutout2D(hdu.data, position, wcs=WCS(hdu.header),
-                                  size=size, mode='partial')
-            factory.add_cadence(frameno=idx, flux=cutout.data, header=hdu.header)
+                flux = _read_stamp(hdu, position, size)
+            factory.add_cadence(frameno=idx, flux=flux, header=hdu.header)
+            if hdulist is not None:
+                hdulist.close()
         return factory.get_tpf(**kwargs)
 
     @staticmethod
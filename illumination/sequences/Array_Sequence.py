@@ -3,25 +3,42 @@ Define a generic sequence of images.
 '''
 from .Image_Sequence import *
 
+
+def _isarraylike(x):
+    '''
+    Does this object act like an array (without necessarily being one)?
+    '''
+    return all(hasattr(x, k) for k in ['shape', 'dtype', '__getitem__'])
+
 class Array_Sequence(Image_Sequence):
     def __init__(self, initial, name='array', time=None, temporal={}, spatial={}, **kwargs):
         '''
         Initialize a Sequence from 2D or 3D numpy array.
 
+        The array is never copied, so it can be a memory map
+        (or any other array-like object with `shape`, `dtype`,
+        and `__getitem__`, like an h5py dataset) that's much
+        too big to fit in memory; frames are read only as needed.
+
         Parameters
         ----------
         initial : 2D/3D numpy array, or list of numpy arrays
             - a (ysize x = xsize)-shaped array = single image
             - a (ntimes x ysize x = xsize)-shaped array = multiple images
+            - a (ntimes x ysize x = xsize)-shaped np.memmap or array-like
 
         time : array, None
             An array of times for the sequence.
         '''
 
-
-
-        # make sure we're dealing with an array
-        array = np.atleast_2d(initial)
+        if isinstance(initial, np.ndarray) or not _isarraylike(initial):
+            # make sure we're dealing with an array (without copying it)
+            array = np.atleast_2d(initial)
+        else:
+            # leave array-likes alone, so nothing gets loaded yet
+            array = initial
+            if len(array.shape) == 2:
+                array = np.asarray(array[:, :])
 
         # handle a single image as a 1-element array
         if len(array.shape) == 2:
@@ -35,7 +52,23 @@ class Array_Sequence(Image_Sequence):
         # create a sequence
         Image_Sequence.__init__(self, name=name, time=time, temporal=temporal, spatial=spatial)
 
+    @property
+    def inmemory(self):
+        '''
+        Is the whole array already in memory
+        (rather than memory-mapped, or some other array-like)?
+        '''
+        return type(self.images) == np.ndarray and not isinstance(self.images.base, np.memmap)
 
+    @property
+    def shape(self):
+        '''
+        Returns
+        -------
+        s : tuple
+            The shape of the image stack (ntimes x nrows x ncols)
+        '''
+        return tuple(self.images.shape)
 
     def __getitem__(self, timestep):
         '''
@@ -53,6 +86,27 @@ class Array_Sequence(Image_Sequence):
         else:
             return self.images[timestep, :, :]
 
+    def read_region(self, timestep, rows, cols):
+        '''
+        Read a rectangular region of the image for a given timestep
+        (as a view for arrays and memory maps, and touching only
+        that region for other array-likes).
+
+        Parameters
+        ----------
+        timestep : int
+            A timestep index (which element in the sequence do you want?)
+
+        rows, cols : slice
+            The rows and columns of the region.
+
+        Returns
+        -------
+        region : 2D image
+            The pixels within the region.
+        '''
+        return self.images[timestep, rows, cols]
+
     def _gather_3d(self):
         '''
         Gather a 3D cube of images.
@@ -68,22 +122,25 @@ class Array_Sequence(Image_Sequence):
         The image stack, with shape (ntimes x nrows x ncols)
         '''
 
-        # for an array, we're already 3D!
-        s = self.images
-        return s
-
+        # for an array (or memory map), we're already 3D!
+        if isinstance(self.images, np.ndarray):
+            return self.images
+        else:
+            return np.asarray(self.images[:, :, :])
 
     def mean(self):
         '''
-        Calculate the sum of all the images.
-        It works in an inline fashion, so you
-        don't need to load the entire image
-        cube into memory (that might get big!)
+        Calculate the mean of all the images.
+        If the array isn't all in memory, this works
+        in an inline fashion, so you don't need to
+        load the entire image cube (that might get big!)
 
         Returns
         -------
         mean : 2D image
             The mean of the image sequence.
         '''
-
-        return np.mean(self.images, 0)
+        if self.inmemory:
+            return np.mean(self.images, 0)
+        else:
+            return Image_Sequence.mean(self)
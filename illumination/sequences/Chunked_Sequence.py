@@ -0,0 +1,312 @@
+'''
+Define a sequence of images stored as a chunked on-disk cube:
+a directory of memory-mappable .npy chunks, each holding a block
+of (ntimes x nrows x ncols) pixels, plus a small JSON manifest
+with the time axis and any other metadata.
+
+Consolidating a sequence (like thousands of FFIs) into a cube
+means later work only has to memory-map the chunks it needs.
+The shape of the chunks sets which access is fastest:
+    (1, None, None) = each chunk is one whole frame (for animation)
+    (None, 32, 32) = each chunk is a whole time series (for photometry)
+    (16, 256, 256) = a compromise that's reasonable for both
+'''
+
+from .Image_Sequence import *
+from .Stamp_Sequence import Stamp_Sequence
+from .FITS_Sequence import _column
+from .index import _encode, _decode
+from ..postage.cubes import Cube
+import json
+
+__all__ = ['Chunked_Sequence', 'consolidate', 'manifestfilename']
+
+# the name of the manifest inside a cube's directory
+manifestfilename = 'manifest.json'
+
+# by default, how big are the chunks (ntimes, nrows, ncols)?
+defaultchunkshape = (16, 256, 256)
+
+
+def _chunkfilename(i, j, k):
+    '''
+    The filename of the chunk with grid indices (i, j, k).
+    '''
+    return 'chunk-{:05d}-{:05d}-{:05d}.npy'.format(i, j, k)
+
+
+def _edges(n, size):
+    '''
+    The (start, stop) of the chunks along an axis of length n.
+    '''
+    return [(start, min(start + size, n)) for start in range(0, n, size)]
+
+
+def _bounds(s, n):
+    '''
+    The (start, stop) of the unit-step region that contains the
+    elements of a slice along an axis of length n, and the slice
+    that picks those elements back out of that region.
+    '''
+    start, stop, step = s.indices(n)
+    if step == 1:
+        return (start, stop), slice(None)
+    selected = range(start, stop, step)
+    if len(selected) == 0:
+        return (0, 0), slice(None)
+    lowest, highest = min(selected[0], selected[-1]), max(selected[0], selected[-1])
+    return (lowest, highest + 1), slice(None, None, step)
+
+
+def consolidate(sequence, directory, chunkshape=defaultchunkshape, dtype=None, overwrite=False):
+    '''
+    Write an image sequence into a chunked on-disk cube.
+
+    The sequence is read one block of frames at a time
+    (as many as fit in one chunk's time axis), so only
+    that block ever needs to be held in memory.
+
+    Parameters
+    ----------
+    sequence : Image_Sequence, Cube
+        The sequence to consolidate (e.g. a FITS_Sequence,
+        or a Stamp_Sequence, or a Stamp/Cube itself).
+
+    directory : str
+        The directory in which to store the cube.
+
+    chunkshape : tuple
+        The (ntimes, nrows, ncols) shape of each chunk.
+        Any of these can be None, meaning the whole axis.
+
+    dtype : numpy dtype, None
+        The data type in which to store the pixels
+        (by default, that of the sequence's first image).
+
+    overwrite : bool
+        Should an existing cube in `directory` be replaced?
+
+    Returns
+    -------
+    cube : Chunked_Sequence
+        The consolidated sequence, read back from disk.
+    '''
+
+    if isinstance(sequence, Cube):
+        sequence = Stamp_Sequence(sequence)
+
+    manifestpath = os.path.join(directory, manifestfilename)
+    if os.path.exists(manifestpath) and not overwrite:
+        raise RuntimeError('{} already holds a cube (use overwrite=True to replace it)'.format(directory))
+    mkdir(directory)
+
+    shape = tuple(sequence.shape)
+    chunkshape = tuple(int(c or n) for c, n in zip(chunkshape, shape))
+    dtype = np.dtype(dtype or np.asarray(sequence[0]).dtype).newbyteorder('=')
+    sequence.speak('consolidating {} into {} chunks of {} in {}'.format(
+                    shape, dtype, chunkshape, directory))
+
+    times, rows, cols = [_edges(n, c) for n, c in zip(shape, chunkshape)]
+    for i, (t0, t1) in enumerate(times):
+        sequence.speak(' consolidated frames {}-{}/{}'.format(t0 + 1, t1, shape[0]), progress=True)
+        block = np.empty((t1 - t0,) + shape[1:], dtype=dtype)
+        for t in range(t0, t1):
+            block[t - t0] = sequence[t]
+        for j, (r0, r1) in enumerate(rows):
+            for k, (c0, c1) in enumerate(cols):
+                np.save(os.path.join(directory, _chunkfilename(i, j, k)), block[:, r0:r1, c0:c1])
+
+    # record the metadata (written last, so a half-written cube is never read)
+    time = sequence._get_times()
+    manifest = dict(shape=shape,
+                    chunkshape=chunkshape,
+                    dtype=dtype.str,
+                    name=sequence.name,
+                    time=dict(jd1=list(time.jd1), jd2=list(time.jd2), scale=time.scale),
+                    timeisfake=bool(sequence._timeisfake),
+                    temporal={k: [_encode(v) for v in np.atleast_1d(c)]
+                              for k, c in getattr(sequence, 'temporal', {}).items()},
+                    static={k: _encode(v) for k, v in getattr(sequence, 'static', {}).items()})
+    with open(manifestpath, 'w') as f:
+        json.dump(manifest, f)
+
+    return Chunked_Sequence(directory)
+
+
+class Chunked_Sequence(Image_Sequence):
+    '''
+    A sequence of images read from a chunked on-disk cube.
+    '''
+
+    def __init__(self, directory, name=None, **kwargs):
+        '''
+        Initialize a Sequence from a directory written by `consolidate`.
+
+        Parameters
+        ----------
+        directory : str
+            The directory containing the cube's chunks and manifest.
+
+        name : str, None
+            A name for this sequence (by default, the one stored with it).
+        '''
+
+        self.directory = directory
+        with open(os.path.join(directory, manifestfilename)) as f:
+            self.manifest = json.load(f)
+
+        self._shape = tuple(self.manifest['shape'])
+        self.chunkshape = tuple(self.manifest['chunkshape'])
+        self._edges = [_edges(n, c) for n, c in zip(self._shape, self.chunkshape)]
+        self._chunks = {}
+
+        # pull out the time axis
+        stored = self.manifest['time']
+        time = Time(np.asarray(stored['jd1']), np.asarray(stored['jd2']),
+                    format='jd', scale=stored['scale'])
+
+        Image_Sequence.__init__(self, name=name or self.manifest['name'], time=time, **kwargs)
+        self._timeisfake = self.manifest['timeisfake']
+
+        self.temporal = {k: _column([_decode(v) for v in c])
+                         for k, c in self.manifest['temporal'].items()}
+        self.static = {k: _decode(v) for k, v in self.manifest['static'].items()}
+
+    def _chunk(self, i, j, k):
+        '''
+        Get a memory map of one chunk (opening it only once).
+        '''
+        try:
+            return self._chunks[i, j, k]
+        except KeyError:
+            chunk = np.load(os.path.join(self.directory, _chunkfilename(i, j, k)), mmap_mode='r')
+            self._chunks[i, j, k] = chunk
+            return chunk
+
+    def _overlapping(self, axis, region):
+        '''
+        Which chunks along an axis overlap a (start, stop) region?
+        '''
+        start, stop = region
+        return [(i, edge) for i, edge in enumerate(self._edges[axis])
+                if (edge[0] < stop) and (edge[1] > start)]
+
+    def _read_block(self, times, rows, cols):
+        '''
+        Read a (ntimes x nrows x ncols) block of the cube,
+        without copying if it falls within a single chunk.
+
+        Parameters
+        ----------
+        times, rows, cols : slice
+            The block to read (any steps are applied
+            after reading the region that spans them).
+
+        Returns
+        -------
+        block : array
+            The pixels of the block (read-only, if not copied).
+        '''
+        bounds = [_bounds(s, n) for s, n in zip([times, rows, cols], self._shape)]
+        regions = [b[0] for b in bounds]
+        steps = tuple(b[1] for b in bounds)
+        overlapping = [self._overlapping(axis, region) for axis, region in enumerate(regions)]
+
+        def within(region, edge):
+            return slice(max(region[0], edge[0]) - edge[0], min(region[1], edge[1]) - edge[0])
+
+        # if everything is in one chunk, return a view of it
+        if all(len(o) == 1 for o in overlapping):
+            (i, ti), (j, rj), (k, ck) = [o[0] for o in overlapping]
+            chunk = self._chunk(i, j, k)
+            return chunk[within(regions[0], ti), within(regions[1], rj), within(regions[2], ck)][steps]
+
+        # otherwise, stitch together the pieces from each chunk
+        block = np.empty([max(r[1] - r[0], 0) for r in regions], dtype=self.manifest['dtype'])
+        for i, ti in overlapping[0]:
+            for j, rj in overlapping[1]:
+                for k, ck in overlapping[2]:
+                    inchunk = [within(r, e) for r, e in zip(regions, [ti, rj, ck])]
+                    inblock = [slice(s.start + e[0] - r[0], s.stop + e[0] - r[0])
+                               for s, r, e in zip(inchunk, regions, [ti, rj, ck])]
+                    block[tuple(inblock)] = self._chunk(i, j, k)[tuple(inchunk)]
+        return block[steps]
+
+    def __getitem__(self, timestep):
+        '''
+        Return the image data for a given timestep.
+
+        This function is called when you say `sequence[timestep]`.
+
+        Parameters
+        ----------
+        timestep : int
+            A timestep index (which element in the sequence do you want?)
+        '''
+        if timestep is None:
+            return None
+        timestep = range(self._shape[0])[timestep]
+        return self._read_block(slice(timestep, timestep + 1), slice(None), slice(None))[0]
+
+    def read_region(self, timestep, rows, cols):
+        '''
+        Read a rectangular region of the image for a given timestep,
+        touching only the chunks that overlap it.
+
+        Parameters
+        ----------
+        timestep : int
+            A timestep index (which element in the sequence do you want?)
+
+        rows, cols : slice
+            The rows and columns of the region.
+
+        Returns
+        -------
+        region : 2D image
+            The pixels within the region.
+        '''
+        timestep = range(self._shape[0])[timestep]
+        return self._read_block(slice(timestep, timestep + 1), rows, cols)[0]
+
+    def read_timeseries(self, rows, cols, timesteps=slice(None)):
+        '''
+        Read the time series of a block of pixels
+        (for example, to do photometry on them).
+
+        Parameters
+        ----------
+        rows, cols : slice
+            The rows and columns of the pixels.
+
+        timesteps : slice
+            Which timesteps to include (by default, all of them).
+
+        Returns
+        -------
+        timeseries : 3D array
+            The (ntimes x nrows x ncols) pixel time series.
+        '''
+        return self._read_block(timesteps, rows, cols)
+
+    def _gather_3d(self):
+        '''
+        Gather a 3D cube of images.
+        '''
+        return self._read_block(slice(None), slice(None), slice(None))
+
+    @property
+    def shape(self):
+        '''
+        Returns
+        -------
+        s : tuple
+            The shape of the image stack (ntimes x nrows x ncols)
+        '''
+        return self._shape
+
+    def __repr__(self):
+        '''
+        How should this sequence be represented, by default, as a string.
+        '''
+        return '<{} of {} elements in {}-shaped chunks>'.format(self.nametag, self.N, self.chunkshape)
@@ -5,19 +5,153 @@ Define a sequence of FITS images.
 from __future__ import print_function
 from .filenameparsers import *
 from .Image_Sequence import *
+from .caches import FrameCache
+from .fitsreader import scan_fits, read_fits_headers, read_fits_header_values
+from .index import SequenceIndex, default_index_path
+from .prefetch import Prefetcher
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import functools
 
-__all__ = ['FITS_Sequence']
+__all__ = ['FITS_Sequence', 'scan_headers', 'timekeys']
+
+# these keywords aren't values that can change with time
+commentarykeys = ['COMMENT', 'HISTORY', '']
+
+# these keywords might define a time axis (in order of preference)
+timekeys = ['TIME', 'MJD', 'JD', 'BJD', 'BJD_TDB', 'DATE-OBS']
+
+
+def _header_values(headers, keys=None):
+    '''
+    Merge some headers into one dictionary of values
+    (with later headers taking priority over earlier ones),
+    keeping only some keys (or all of them, if keys is None).
+    '''
+    values = {}
+    for h in headers:
+        if keys is None:
+            for k, v in h.items():
+                if k not in commentarykeys:
+                    values[k] = v
+        else:
+            for k in keys:
+                if k in h:
+                    values[k] = h[k]
+    return values
+
+
+def _scan_header_values(filename, extensions, keys=None):
+    '''
+    Read the headers (and only the headers) of some
+    extensions of a file, merged into one dictionary.
+    '''
+    if keys is None:
+        return _header_values(read_fits_headers(filename, extensions))
+    else:
+        return _header_values(read_fits_header_values(filename, extensions, keys), keys)
+
+
+def _column(values):
+    '''
+    Convert a list of values (one per file) into a typed array,
+    using NaN for missing numbers and an object array
+    only if the values can't share a simpler type.
+    '''
+    present = [v for v in values if v is not None]
+    complete = len(present) == len(values)
+    if len(present) > 0:
+        if np.all([isinstance(v, (bool, np.bool_)) for v in present]):
+            if complete:
+                return np.array(values, dtype=bool)
+        elif np.all([isinstance(v, (int, float, np.number)) for v in present]):
+            if complete:
+                return np.array(values)
+            return np.array([np.nan if v is None else v for v in values], dtype=float)
+        elif np.all([isinstance(v, str) for v in present]):
+            if complete:
+                return np.array(values, dtype=str)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _isconstant(column):
+    '''
+    Are all the values in a column the same?
+    '''
+    column = np.atleast_1d(column)
+    first = column[0]
+    try:
+        same = column == first
+        if column.dtype.kind == 'f':
+            same |= np.isnan(column) & np.isnan(first)
+        return bool(np.all(same))
+    except (TypeError, ValueError):
+        return len(set([repr(v) for v in column])) == 1
+
+
+def scan_headers(filenames, extensions=[0, 1], workers=None, pool='thread', keys=None):
+    '''
+    Read the header values from many FITS files,
+    (optionally) spread across a pool of workers.
+
+    Parameters
+    ----------
+    filenames : list
+        The FITS files to scan.
+
+    extensions : list
+        Which extensions' headers should be merged together?
+        (Values in later extensions take priority.)
+
+    workers : int, None
+        How many workers should scan the headers?
+        If None, use up to 8 (but only if there are
+        enough files to make it worth it).
+
+    pool : str
+        Should the workers be 'thread's or 'process'es?
+
+    keys : list, None
+        Which keywords should be extracted? Only the cards for
+        these keywords get parsed. If None, extract all of them.
+
+    Returns
+    -------
+    values : list of dicts
+        The header values for each file, in the same order as `filenames`.
+    '''
+
+    if workers is None:
+        workers = int(np.clip(len(filenames) // 16, 1, np.minimum(8, os.cpu_count() or 1)))
+
+    scan = functools.partial(_scan_header_values, extensions=extensions, keys=keys)
+    if workers <= 1:
+        return [scan(f) for f in filenames]
+
+    Executor = dict(thread=ThreadPoolExecutor, process=ProcessPoolExecutor)[pool]
+    with Executor(max_workers=workers) as executor:
+        # (map returns results in the same order as the inputs)
+        return list(executor.map(scan, filenames, chunksize=np.maximum(len(filenames) // (4 * workers), 1)))
 
 class FITS_Sequence(Image_Sequence):
     '''
     A sequence of FITS images, with a time associated with each.
     '''
 
+    # by default, images are read only when they're requested
+    prefetcher = None
+
     def __init__(self, initial, ext_image=1, ext_primary=0, name='FITS',
                        use_headers=True,
                        use_filenames=False,
                        filenameparser=flexible_filenameparser,
                        timekey=None, timeformat=None,
+                       cache=None, cachebytes=256*1024**2,
+                       reader='astropy',
+                       headerworkers=None, headerpool='thread',
+                       index=None,
+                       header_keys=None,
                        **kwargs):
         '''
         Initialize a Sequence of FITS images. The goal is
@@ -59,6 +193,48 @@ class FITS_Sequence(Image_Sequence):
             timeformt : string
                 What's the time format for defining the time axis?
 
+            cache : FrameCache, None, False
+                Where should decoded images be cached? By default (None),
+                each sequence gets its own cache; pass a FrameCache
+                (like `sequences.caches.framecache`) to share one
+                across many sequences, or False to never cache.
+
+            cachebytes : int
+                The byte budget for this sequence's own cache
+                (ignored if a shared cache is provided).
+
+            reader : str
+                How should images be read from files?
+                    'astropy' = open a full (verified) HDUList for every frame
+                    'direct' = parse each file's headers once, and then read
+                               pixels straight from disk with np.fromfile
+                               (falling back to astropy for anything,
+                               like a compressed image, that can't be)
+
+            headerworkers : int, None
+                How many workers should scan the headers of the files?
+                If None, pick a sensible number for the number of files.
+
+            headerpool : str
+                Should the header-scanning workers be 'thread's or 'process'es?
+
+            index : SequenceIndex, str, bool, None
+                Should the information extracted from the files (header
+                and filename values, the time axis, the sort order) be
+                kept in an on-disk index, so that reopening the same
+                files doesn't require rescanning them? This can be a
+                SequenceIndex, the path to an index file, or True to
+                use a default index file in the files' directory.
+
+            header_keys : list, str, None
+                Which header keywords should be extracted into `temporal`
+                and `static`? By default (None), only the keywords that
+                might define a time axis (and `timekey`, if given) are
+                extracted; any keywords in a list are extracted in addition
+                to those. Use 'all' to extract every keyword in the headers.
+                Only extracted keywords are stored in an `index`, so only
+                they can be used in its `query`.
+
         '''
         # initialize the basic sequence
         Sequence.__init__(self, name=name)
@@ -67,6 +243,16 @@ class FITS_Sequence(Image_Sequence):
         # (this should probably someday be rewritten as an iterator?)
         self._hdulists = None
 
+        # keep decoded images in memory, so we don't keep re-reading them
+        if cache is None:
+            cache = FrameCache(maxbytes=cachebytes, name='{}-cache'.format(name))
+        self.cache = None if cache is False else cache
+
+        # keep track of where the image data live within each file
+        assert(reader in ['astropy', 'direct'])
+        self.reader = reader
+        self._layouts = {}
+
         # ultimately, we want to make a list of filenames or HDULists
         if type(initial) in [fits.HDUList,
                              fits.PrimaryHDU,
@@ -102,38 +288,69 @@ class FITS_Sequence(Image_Sequence):
         self.ext_primary = ext_primary
         self.ext_image = ext_image
         if len(self.filenames) > 0:
-                self.ext_image = np.minimum(self.ext_image, len(self._get_hdulist(0))-1)
+            self.ext_image = np.minimum(self.ext_image, self._count_extensions() - 1)
 
         self.temporal = {}
         self.static = {}
         self.spatial = {}
 
+        # set up an on-disk index of what we learn from the files
+        if (self._hdulists is not None) or (len(self.filenames) == 0) or (index in [None, False]):
+            index = None
+        elif index is True:
+            index = SequenceIndex(default_index_path(self.filenames))
+        elif isinstance(index, str):
+            index = SequenceIndex(index)
+        self.index = index
+
+        # decide which header keywords we need
+        if header_keys == 'all':
+            self.header_keys = None
+        else:
+            self.header_keys = list(timekeys)
+            for k in ([timekey] + list(header_keys or [])):
+                if (k is not None) and (k not in self.header_keys):
+                    self.header_keys.append(k)
+
         # populate the temporal axes, somehow
         assert(use_headers or use_filenames)
         if use_headers:
             try:
-                self._populate_from_headers()
-            except:
-                self.speak('unable to extract temporal things from headers for {}'.format(self))
-                self.speak('making up fake times')
+                self._populate_from_headers(workers=headerworkers, pool=headerpool)
+            except Exception as e:
+                self.warning('unable to extract temporal things from headers for {} ({})'.format(self, e))
+                self.warning('making up fake times')
                 self._define_time_axis()
         if use_filenames:
             try:
                 self._populate_from_filenames(filenameparser=filenameparser)
-            except:
-                self.speak('unable to extract temporal things from filenames for {}'.format(self))
-                self.speak('making up fake times')
+            except Exception as e:
+                self.warning('unable to extract temporal things from filenames for {} ({})'.format(self, e))
+                self.warning('making up fake times')
                 self._define_time_axis()
                 
-        # make sure a time axis gets defined
-        self._define_time_axis(timekey=timekey, timeformat=timeformat)
-
-        # Debug why sort breaks
-        # self._count()
+        # make sure a time axis gets defined (or recall it from the index)
+        options = dict(use_headers=use_headers, use_filenames=use_filenames,
+                       filenameparser=filenameparser.__name__,
+                       ext_primary=self.ext_primary, ext_image=self.ext_image,
+                       timekey=timekey, timeformat=timeformat)
+        time = None
+        if self.index is not None:
+            time, timeisfake = self.index.recall_time_axis(self.filenames, **options)
+        if time is None:
+            self._define_time_axis(timekey=timekey, timeformat=timeformat)
+        else:
+            self.speak('recalled the time axis for {} from {}'.format(self, self.index))
+            self.time, self._timeisfake = time, timeisfake
 
         # make sure everything gets sorted by time
         self._sort()
 
+        # remember what we've learned, for next time
+        if self.index is not None:
+            self.index.record(self, **options)
+            self.index.save()
+
     def _count(self):
         '''
         Count the temporals
@@ -146,8 +363,8 @@ class FITS_Sequence(Image_Sequence):
         Sort the images, and the temporals.
         '''
 
-        # calculate sorting indices
-        i = np.argsort(np.unique(self.time.gps))
+        # calculate sorting indices (keeping the file order for identical times)
+        i = np.argsort(self.time.gps, kind='stable')
         # print('i',i)
         # sort the temporal values
         for k in self.temporal.keys():
@@ -173,6 +390,17 @@ class FITS_Sequence(Image_Sequence):
         '''
         return len(self.filenames)
 
+    def _count_extensions(self):
+        '''
+        How many extensions are in the (first) file?
+        '''
+        if self._hdulists is None:
+            try:
+                return len(scan_fits(self.filenames[0]))
+            except (ValueError, EOFError, OSError):
+                pass
+        return len(self._get_hdulist(0))
+
     def _get_hdulist(self, i):
         '''
         Return an HDUlist for the ith element in the sequence.
@@ -192,14 +420,19 @@ class FITS_Sequence(Image_Sequence):
         '''
         # move non-changing things to static
         for k in list(self.temporal.keys()):
-            if len(np.unique(self.temporal[k])) == 1:
+            column = self.temporal[k]
+            if not isinstance(column, np.ndarray):
+                column = _column(list(column))
+            if _isconstant(column):
                 # if we have a one-element sequence, repeat it in both static and temporal
-                if len(self.temporal[k]) == 1:
-                    self.static[k] = self.temporal[k][0]
+                if len(column) == 1:
+                    self.static[k] = column[0]
+                    self.temporal[k] = column
                 else:
-                    self.static[k] = self.temporal.pop(k)[0]
+                    self.static[k] = column[0]
+                    self.temporal.pop(k)
             else:
-                self.temporal[k] = np.asarray(self.temporal[k])
+                self.temporal[k] = column
 
         self.speak('the temporal keys for {} are {}'.format(self, list(self.temporal.keys())))
         self.speak('the static keys for {} are {}'.format(self, list(self.static.keys())))
@@ -209,69 +442,57 @@ class FITS_Sequence(Image_Sequence):
         Pull the basic information and temporal axis from the filenames.
         '''
         self.speak('populating {} information from the filenames (like {})'.format(self, self.filenames[0]))
-        for i, f in enumerate(self.filenames):
-            this = filenameparser(f)
-
-            # create empty lists, if necessary
-            if i == 0:
-                for k in this.keys():
-                    self.temporal[k] = []
-
-            # tack this file onto the list
-            for k in this.keys():
-                #print(this[k])
-                self.temporal[k].append(this[k])
+        if self.index is not None:
+            parsed = self.index.filename_values(self.filenames, filenameparser)
+        else:
+            parsed = [filenameparser(f) for f in self.filenames]
+        for k in parsed[0].keys():
+            self.temporal[k] = _column([this.get(k, None) for this in parsed])
 
         # move static things away from temporal
         self._clean_temporal()
 
-    def _populate_from_headers(self):
+    def _populate_from_headers(self, workers=None, pool='thread'):
         '''
         Attempt to populate the sequence from the headers.
+
+        Only the header blocks of the primary and image extensions
+        are read (never the data), and files can be scanned in parallel.
+
+        Parameters
+        ----------
+        workers : int, None
+            How many workers should scan the headers? If None,
+            pick a sensible number for the number of files.
+
+        pool : str
+            Should the workers be 'thread's or 'process'es?
         '''
 
         self.speak('populating {} information from the headers'.format(self))
 
-        # pull out the first HDUList in the sequence
-        first = self._get_hdulist(0)
-
-        # check to see if the requested image extension exists
-        try:
-            first[self.ext_image]
-        except IndexError:
-            self.speak('image extension {} not found, switching to 0'.format(self.ext_image))
-            self.ext_image = 0
+        # look through the unique extensions
+        extensions = list(np.unique([self.ext_primary, self.ext_image]))
 
-        # load the headers for the primary and the image
-        pri, img = first[self.ext_primary].header, first[self.ext_image].header
+        # pull the headers (as dictionaries of the keys we want), in file order
+        keys = self.header_keys
+        scan = functools.partial(scan_headers, extensions=extensions, workers=workers, pool=pool, keys=keys)
+        if self._hdulists is not None:
+            values = [_header_values([h[e].header for e in extensions], keys) for h in self._hdulists]
+        elif self.index is not None:
+            values = self.index.header_values(self.filenames, extensions, scan=scan, keys=keys)
+        else:
+            values = scan(self.filenames)
 
         # if only a single image, everything is static (but can be viewed as temporal)
         if self.N == 1:
-            for h in [pri, img]:
-                for k in h.keys():
-                    self.static[k] = h[k]
-                    self.temporal[k] = [self.static[k]]
+            for k, v in values[0].items():
+                self.static[k] = v
+                self.temporal[k] = _column([v])
         else:
-
-            # look through the unique extensions
-            extensions = np.unique([self.ext_primary, self.ext_image])
-
-            # create lists for each key in the headers
-            for e in extensions[0]:   # DEBUG
-                h = first[e].header
-                for k in h.keys():
-                    self.temporal[k] = []
-
-            # compile all values from the headers
-            for i in range(self.N):
-                hdulist = self._get_hdulist(i)
-                self.speak("populating header {} of {}".format(i+1, self.N), progress=True)
-                for e in extensions:
-                    h = hdulist[e].header
-                    for k in h.keys():
-                        # print("populating",k, "with", h[k])
-                        #print(k,self.temporal[k])
-                        self.temporal[k].append(h[k])
+            # compile each value from the headers into a column (keyed by the first file)
+            for k in values[0].keys():
+                self.temporal[k] = _column([v.get(k, None) for v in values])
 
             # move static things away from temporal
             self._clean_temporal()
@@ -289,10 +510,11 @@ class FITS_Sequence(Image_Sequence):
             self.time = Time(np.asarray(self.temporal[timekey]),
                         format=timeformat or 'gps',
                         scale=timescale)
+            self._timeisfake = False
             self.speak('using "{}" as the time axis'.format(timekey))
         except (AssertionError, KeyError):
             # try to pull a time axis from these
-            for k in ['TIME', 'MJD', 'JD', 'BJD', 'BJD_TDB', 'DATE-OBS']:
+            for k in timekeys:
                 try:
                     #print('k',k)
                     # treat some value as a time
@@ -305,11 +527,12 @@ class FITS_Sequence(Image_Sequence):
                     # make an astropy time out of the values
                     else:
                         # print("i guess i'm here now")
-                        timescale='utc'
-                        #print(t, timeformat, timescale)
+                        # (named so it doesn't hide the module's `timescale`, used above)
+                        guessedscale='utc'
+                        #print(t, timeformat, guessedscale)
                         self.time = Time(np.asarray(t),
                                     format=timeformat or guess_time_format(t),
-                                    scale=timescale)
+                                    scale=guessedscale)
                         self._timeisfake = False
                     self.speak('guessing "{}" is good as the time axis'.format(k))
                     self._timeisfake = False
@@ -329,5 +552,167 @@ class FITS_Sequence(Image_Sequence):
         '''
         if timestep is None:
             return None
+        if self.prefetcher is not None:
+            image = self.prefetcher.get(timestep)
+            if image is not None:
+                return image
+        return self._fetch_image(timestep)
+
+    def _fetch_image(self, timestep):
+        '''
+        Get the image data for a given timestep, from the cache if possible.
+
+        Parameters
+        ----------
+        timestep : int
+                A timestep index (which element in the sequence do you want?)
+        '''
+        if (self.cache is None) or (self._hdulists is not None):
+            # (loaded HDULists are already in memory, so don't cache them)
+            return self._read_image(timestep)
         else:
-            return self._get_hdulist(timestep)[self.ext_image].data
+            key = (self.filenames[timestep], self.ext_image)
+            return self.cache.fetch(key, lambda: self._read_image(timestep))
+
+    def prefetch(self, timesteps, depth=8, workers=2):
+        '''
+        Start reading images on background threads, ahead of when they'll be needed.
+
+        Parameters
+        ----------
+        timesteps : list
+            The timesteps that will be requested, in order.
+
+        depth : int
+            The maximum number of images to read ahead.
+
+        workers : int
+            The number of background threads reading images.
+
+        Returns
+        -------
+        prefetcher : Prefetcher
+            The prefetcher, which keeps track of how well it's working.
+        '''
+        self.stop_prefetching()
+        self.prefetcher = Prefetcher(self._fetch_image, timesteps, depth=depth, workers=workers,
+                                     name='{}-prefetcher'.format(self.name))
+        return self.prefetcher
+
+    def stop_prefetching(self):
+        '''
+        Stop reading images ahead of time.
+
+        Returns
+        -------
+        statistics : dict, None
+            A summary of how well the prefetching worked
+            (or None if we weren't prefetching).
+        '''
+        if self.prefetcher is None:
+            return None
+        self.prefetcher.close()
+        statistics = self.prefetcher.statistics()
+        self.prefetcher = None
+        return statistics
+
+    def _read_image(self, timestep):
+        '''
+        Read the image data for a given timestep from its HDUList.
+
+        Parameters
+        ----------
+        timestep : int
+                A timestep index (which element in the sequence do you want?)
+        '''
+        if (self.reader == 'direct') and (self._hdulists is None):
+            layout = self._get_layout(timestep)
+            if layout is not None:
+                return layout.read()
+        return self._get_hdulist(timestep)[self.ext_image].data
+
+    def read_region(self, timestep, rows, cols):
+        '''
+        Read a rectangular region of the image for a given timestep,
+        reading only the bytes it covers from disk (where possible).
+
+        Parameters
+        ----------
+        timestep : int
+            A timestep index (which element in the sequence do you want?)
+
+        rows, cols : slice
+            The rows and columns of the region.
+
+        Returns
+        -------
+        region : 2D image
+            The pixels within the region.
+        '''
+
+        # use an image that's already in memory, if there is one
+        if self._hdulists is not None:
+            return self._hdulists[timestep][self.ext_image].data[rows, cols]
+        if self.cache is not None:
+            # (get it just once, since another thread might evict it at any time)
+            image = self.cache.get((self.filenames[timestep], self.ext_image))
+            if image is not None:
+                return image[rows, cols]
+
+        # otherwise, read just this section of the file
+        layout = self._get_layout(timestep)
+        if layout is not None:
+            return layout.read_section(rows, cols)
+        with fits.open(self.filenames[timestep], memmap=True) as hdulist:
+            return hdulist[self.ext_image].section[rows, cols]
+
+    def _get_layout(self, timestep):
+        '''
+        Get the layout (data offset, BITPIX, shape, scaling) of the
+        image extension of a file, parsing its headers only once.
+
+        Parameters
+        ----------
+        timestep : int
+                A timestep index (which element in the sequence do you want?)
+
+        Returns
+        -------
+        layout : FITSLayout, None
+                The layout of the image, or None if it can't be read directly.
+        '''
+        filename = self.filenames[timestep]
+        key = (filename, self.ext_image)
+        try:
+            return self._layouts[key]
+        except KeyError:
+            try:
+                layout = scan_fits(filename, extensions=[self.ext_image])[self.ext_image]
+                if not layout.isreadable:
+                    layout = None
+            except (ValueError, EOFError, KeyError, IndexError, OSError):
+                layout = None
+            self._layouts[key] = layout
+            return layout
+
+    @property
+    def shape(self):
+        '''
+        Returns
+        -------
+        s : tuple
+            The shape of the image stack (ntimes x nrows x ncols)
+        '''
+
+        # loaded HDUs know their shape (from their headers)
+        if self._hdulists is not None:
+            ysize, xsize = self._hdulists[0][self.ext_image].shape[-2:]
+            return (self.N, ysize, xsize)
+
+        # files can have their shapes parsed from their headers
+        layout = self._get_layout(0)
+        if layout is not None:
+            ysize, xsize = layout.shape[-2:]
+            return (self.N, ysize, xsize)
+
+        return Image_Sequence.shape.fget(self)
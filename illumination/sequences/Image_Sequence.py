@@ -2,6 +2,9 @@
 Define a generic sequence of images.
 '''
 from .Sequence import *
+from .reductions import tiled_reduce, reductionbytes
+from .quantiles import estimate_quantiles
+from .accumulators import accumulate_statistics, streamingstatistics
 
 class Image_Sequence(Sequence):
     def __init__(self, name='images', time=None, temporal={}, spatial={}, **kwargs):
@@ -26,7 +29,8 @@ class Image_Sequence(Sequence):
 
 
         self.temporal = temporal
-        self.spatial = spatial
+        # (a copy, so statistics of one sequence never leak into another)
+        self.spatial = dict(spatial)
 
         # pull out the shape of the array
         N, ysize, xsize = self.shape
@@ -82,66 +86,240 @@ class Image_Sequence(Sequence):
             s[i, :, :] = self[i]
         return s
 
-    def median(self):
+    def read_region(self, timestep, rows, cols):
+        '''
+        Read a rectangular region of the image for a given timestep
+        (for example, a spatial tile, or the pixels behind a zoom).
+
+        This works for any sequence, but sequences that can read
+        part of an image without reading all of it should do so.
+
+        Parameters
+        ----------
+        timestep : int
+            A timestep index (which element in the sequence do you want?)
+
+        rows, cols : slice
+            The rows and columns of the region.
+
+        Returns
+        -------
+        region : 2D image
+            The pixels within the region.
+        '''
+        return self[timestep][rows, cols]
+
+    def consolidate(self, directory, chunkshape=(16, 256, 256), dtype=None, overwrite=False):
+        '''
+        Write this sequence into a chunked on-disk cube,
+        which can be memory-mapped quickly later on.
+
+        Parameters
+        ----------
+        directory : str
+            The directory in which to store the cube.
+
+        chunkshape : tuple
+            The (ntimes, nrows, ncols) shape of each chunk.
+            Any of these can be None, meaning the whole axis.
+            (1, None, None) is fastest for reading whole frames;
+            (None, 32, 32) is fastest for reading pixel time series.
+
+        dtype : numpy dtype, None
+            The data type in which to store the pixels.
+
+        overwrite : bool
+            Should an existing cube in `directory` be replaced?
+
+        Returns
+        -------
+        cube : Chunked_Sequence
+            The consolidated sequence, read back from disk.
+        '''
+        from .Chunked_Sequence import consolidate
+        return consolidate(self, directory, chunkshape=chunkshape, dtype=dtype, overwrite=overwrite)
+
+    def median(self, maxbytes=None, workers=1, method='exact', nbins=32):
         '''
         Calculate the median image.
 
+        The exact median is calculated one spatial tile at a time,
+        so the whole image cube never needs to be in memory. For
+        huge sequences, an approximate median can instead be
+        estimated from per-pixel histograms in a single pass.
+
+        Parameters
+        ----------
+        maxbytes : int, None
+            The memory budget (in bytes) for the stacks of tiles.
+
+        workers : int
+            How many tiles should be processed at once?
+
+        method : str
+            How should the median be calculated?
+                'exact' = the exact (tiled) nanmedian
+                'approximate' = estimated from histograms with `nbins`
+                                bins per pixel (see `approximate_percentile`)
+                'auto' = exact if the whole cube fits within the
+                         memory budget, otherwise approximate
+            The exact median is the default; the others
+            must be asked for.
+
+        nbins : int
+            The number of histogram bins per pixel (for 'approximate').
+
         Returns
         -------
         median : 2D image
             The median of the image sequence.
         '''
 
+        if method == 'auto':
+            small = np.prod(self.shape) * 8 <= (maxbytes or reductionbytes)
+            method = 'exact' if small else 'approximate'
+
+        if method == 'approximate':
+            self.speak('using an approximate median (from {} histogram bins) for {}'.format(nbins, self))
+            return self.approximate_percentile(50, nbins=nbins)[0]
+
         try:
             self.spatial['median']
         except KeyError:
             self.speak('creating a median image for {}'.format(self))
-            s = self._gather_3d()
-            self.spatial['median'] = np.nanmedian(s, axis=0)
+            self.spatial['median'] = tiled_reduce(self, 'median', maxbytes=maxbytes, workers=workers)
         return self.spatial['median']
 
+    def approximate_percentile(self, q, nbins=32, ncalibration=8):
+        '''
+        Estimate a percentile image in a single streaming pass, using
+        a small histogram for each pixel (see `sequences.quantiles`).
+
+        Approximate medians (q=50) are stored in `spatial` as
+        'approximatemedian-{nbins}bins' (and '...-error').
+
+        Parameters
+        ----------
+        q : float
+            The percentile to estimate (between 0 and 100).
+
+        nbins : int
+            The number of histogram bins per pixel.
+
+        ncalibration : int
+            How many frames should set the range of the histograms?
+
+        Returns
+        -------
+        estimate : 2D image
+            The estimated percentile of the image sequence.
+
+        errorbound : 2D image
+            The maximum error of the estimate, for each pixel.
+        '''
+        key = 'approximatemedian-{}bins'.format(nbins)
+        if (q == 50) and (key in self.spatial):
+            return self.spatial[key], self.spatial[key + '-error']
+
+        self.speak('estimating the {}th percentile of {} from histograms'.format(q, self))
+        estimates, errorbounds = estimate_quantiles(self, q=[q / 100.0], nbins=nbins, ncalibration=ncalibration)
+        if q == 50:
+            self.spatial[key] = estimates[0]
+            self.spatial[key + '-error'] = errorbounds[0]
+        return estimates[0], errorbounds[0]
+
+    def percentile(self, q, maxbytes=None, workers=1):
+        '''
+        Calculate percentile image(s).
+
+        Parameters
+        ----------
+        q : float, list
+            The percentile(s) to calculate (between 0 and 100).
+
+        maxbytes : int, None
+            The memory budget (in bytes) for the stacks of tiles.
+
+        workers : int
+            How many tiles should be processed at once?
+
+        Returns
+        -------
+        percentile : 2D image (or 3D, for a list of q)
+            The per-pixel percentile(s) of the image sequence.
+        '''
+        return tiled_reduce(self, 'percentile', q=q, maxbytes=maxbytes, workers=workers)
+
+    def statistics(self, which=['mean', 'std', 'min', 'max', 'nfinite'], workers=1, remake=False):
+        '''
+        Calculate many per-pixel statistics at once, in a single
+        streaming pass over the frames (the median, which can't
+        be streamed, is calculated with its own tiled pass).
+
+        All results are stored in `self.spatial`, and stored
+        results are reused unless `remake` is True.
+
+        Parameters
+        ----------
+        which : list
+            Which statistics do we want? Options include
+            'mean', 'std', 'var', 'min', 'max', 'sum',
+            'nfinite' (the number of finite values), and 'median'.
+
+        workers : int
+            How many chunks of frames should be accumulated at once?
+
+        remake : bool
+            Should we recalculate statistics that are already stored?
+
+        Returns
+        -------
+        statistics : dict
+            The 2D images of each requested statistic.
+        '''
+
+        needed = [k for k in which if remake or (k not in self.spatial)]
+        streaming = [k for k in needed if k in streamingstatistics]
+        if len(streaming) > 0:
+            self.speak('calculating {} for {} in one pass'.format(streaming, self))
+            accumulator = accumulate_statistics(self, workers=workers)
+            self.spatial.update(accumulator.results(streaming))
+        if 'median' in needed:
+            self.spatial.pop('median', None)
+            self.median(workers=workers)
+        return {k: self.spatial[k] for k in which}
+
     def sum(self):
         '''
         Calculate the sum of all the images.
+        It works in an inline fashion, so you
+        don't need to load the entire image
+        cube into memory.
 
         Returns
         -------
         sum : 2D image
-            The median of the image sequence.
+            The sum of the image sequence.
         '''
-
-        s = self._gather_3d()
-        return np.nansum(s, axis=0)
+        return self.statistics(['sum'])['sum']
 
     def mean(self):
         '''
-        Calculate the sum of all the images.
+        Calculate the mean of all the images.
         It works in an inline fashion, so you
         don't need to load the entire image
         cube into memory (that might get big!)
 
+        Non-finite values count as zero, so this is the sum of
+        the finite values divided by the number of images (for
+        the mean of only the finite values, use `statistics`).
+
         Returns
         -------
         mean : 2D image
-            The median of the image sequence.
+            The mean of the image sequence.
         '''
-
-        try:
-            self.spatial['mean']
-        except KeyError:
-            self.speak('creating a mean image for {}'.format(self))
-
-            # calculate the mean in a running fashion (less memory)
-            total = np.zeros_like(self[0])
-            for i in range(self.N):
-                self.speak(' included frame {}/{} in mean'.format(i+1, self.N), progress=True)
-                thisimage = self[i]
-                ok = np.isfinite(thisimage)
-                total[ok] += thisimage[ok]
-
-            self.spatial['mean'] = total/self.N
-
-        return self.spatial['mean']
+        return self.statistics(['sum'])['sum'] / self.N
 
     def __repr__(self):
         '''
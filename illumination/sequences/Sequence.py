@@ -45,6 +45,58 @@ class Sequence(Talker):
 
         return np.median(np.diff(self.time))
 
+    def _time_index(self):
+        '''
+        Get the times of this sequence as sorted GPS seconds
+        (recalculated only when the time axis changes).
+
+        Returns
+        -------
+        sortedgps : array
+                The GPS times, sorted in increasing order.
+
+        order : array
+                The timestep of each element of `sortedgps`.
+        '''
+        times = self._get_times()
+        try:
+            indexed, sortedgps, order = self._timeindex
+            if indexed is times:
+                return sortedgps, order
+        except AttributeError:
+            pass
+
+        gps = np.atleast_1d(np.asarray(times.gps if isinstance(times, Time) else times, dtype=float))
+        order = np.argsort(gps, kind='stable')
+        sortedgps = gps[order]
+        self._timeindex = times, sortedgps, order
+        return sortedgps, order
+
+    def _find_timesteps(self, times):
+        '''
+        Given some times, identify their indices.
+
+        Parameters
+        ----------
+
+        times : astropy Time, array
+                The times to look up (as astropy Times, or GPS seconds).
+
+        Returns
+        -------
+        indices : array
+                The index of the *closest* time point to each time.
+        '''
+
+        sortedgps, order = self._time_index()
+
+        # if there are no times, return nothing
+        if len(order) == 0:
+            return None
+
+        gps = times.gps if isinstance(times, Time) else np.asarray(times, dtype=float)
+        return order[nearest_sorted(sortedgps, gps)]
+
     def _find_timestep(self, time):
         '''
         Given a time, identify its index.
@@ -52,26 +104,18 @@ class Sequence(Talker):
         Parameters
         ----------
 
-        time : float
-                A single time (in JD?).
+        time : astropy Time, float
+                A single time (as an astropy Time, or in GPS seconds).
 
         Returns
         -------
         index : int
                 The index of the *closest* time point.
         '''
-
-        # pull out actual times associated with this sequence
-        times = self._get_times()
-
-        # if there are no times, return nothing
-        if len(times) == 0:
+        step = self._find_timesteps(time)
+        if step is None:
             return None
-        else:
-            # find the index of the timepoint that is closest to this one
-            diff = time - times
-            step = np.argmin(abs(diff))
-            return step
+        return int(step)
 
     def _get_times(self):
         '''
@@ -1,12 +1,22 @@
 from .Sequence import *
+from .caches import *
+from .index import *
+from .prefetch import *
+from .reductions import *
+from .accumulators import *
+from .quantiles import *
+from .rolling import *
 from .FITS_Sequence import *
 from .Stamp_Sequence import *
 
 # from .TPF_Sequence import *
 from .Timeseries_Sequence import *
 from .Array_Sequence import *
+from .Array_Sequence import _isarraylike
 from .filenameparsers import *
 from .Movie_Sequence import *
+from .Chunked_Sequence import *
+from .pipeline import *
 
 
 def make_image_sequence(initial, *args, **kwargs):
@@ -29,6 +39,8 @@ def make_image_sequence(initial, *args, **kwargs):
                     - single FITS HDUList, and an extension to use.
                     - list of loaded FITS HDULists, and an extension to use.
                     - a Stamp object from the `cosmics` package.
+                    - a directory containing a consolidated (chunked) cube.
+                    - a 3D array, memory map, or array-like (e.g. an h5py dataset).
 
         *args
             Positional arguments will be passed on to whatever Sequence is initialized
@@ -47,7 +59,13 @@ def make_image_sequence(initial, *args, **kwargs):
     # is it a Stamp?
     elif isinstance(initial, Cube):
         return Stamp_Sequence(initial, *args, **kwargs)
-    elif type(initial) == np.ndarray:
+    # is it a directory holding a consolidated cube?
+    elif isinstance(initial, str) and os.path.exists(
+        os.path.join(initial, manifestfilename)
+    ):
+        return Chunked_Sequence(initial, *args, **kwargs)
+    # is it an array (or a memory map, or something else array-like)?
+    elif isinstance(initial, np.ndarray) or _isarraylike(initial):
         return Array_Sequence(initial, **kwargs)
     else:
         # try:
@@ -0,0 +1,188 @@
+'''
+Tools for calculating many per-pixel statistics of a sequence
+(mean, standard deviation, min, max, sum, number of finite values...)
+in a single streaming pass over its frames. Partial results for
+different chunks of frames can be merged together, so chunks
+can be accumulated in parallel.
+'''
+
+from ..imports import *
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ['StatisticsAccumulator', 'accumulate_statistics', 'streamingstatistics']
+
+# the statistics that can be calculated in one streaming pass
+streamingstatistics = ['mean', 'std', 'var', 'min', 'max', 'sum', 'nfinite']
+
+
+class StatisticsAccumulator(object):
+    '''
+    Accumulate per-pixel statistics one image at a time,
+    using numerically stable (Welford) updates in float64.
+    '''
+
+    def __init__(self, shape):
+        '''
+        Start an empty accumulator.
+
+        Parameters
+        ----------
+        shape : tuple
+            The (nrows, ncols) shape of the images.
+        '''
+        self.shape = tuple(shape)
+        self.nfinite = np.zeros(self.shape, dtype=np.int64)
+        self.mean = np.zeros(self.shape)
+        self.m2 = np.zeros(self.shape)
+        self.min = np.full(self.shape, np.inf)
+        self.max = np.full(self.shape, -np.inf)
+
+        # (the sum is kept too, so it isn't rounded by going through the mean)
+        self.sum = np.zeros(self.shape)
+
+    def __repr__(self):
+        return '<StatisticsAccumulator | {} | up to {} images>'.format(
+                    self.shape, np.max(self.nfinite) if self.nfinite.size else 0)
+
+    def add(self, image):
+        '''
+        Include one image in the statistics (ignoring non-finite pixels).
+
+        Parameters
+        ----------
+        image : 2D array
+            The image to include.
+        '''
+        image = np.asarray(image, dtype=np.float64)
+        ok = np.isfinite(image)
+        x = image[ok]
+
+        # Welford's update of the running mean and sum of squared deviations
+        self.nfinite[ok] += 1
+        delta = x - self.mean[ok]
+        mean = self.mean[ok] + delta / self.nfinite[ok]
+        self.m2[ok] += delta * (x - mean)
+        self.mean[ok] = mean
+
+        self.min[ok] = np.minimum(self.min[ok], x)
+        self.max[ok] = np.maximum(self.max[ok], x)
+        self.sum[ok] += x
+
+    def merge(self, other):
+        '''
+        Include another accumulator's statistics in this one
+        (as if all of its images had been added here).
+
+        Parameters
+        ----------
+        other : StatisticsAccumulator
+            An accumulator of images with the same shape.
+
+        Returns
+        -------
+        self : StatisticsAccumulator
+            This (updated) accumulator.
+        '''
+        assert(other.shape == self.shape)
+        n = self.nfinite + other.nfinite
+        ok = n > 0
+
+        # combine the means and squared deviations (Chan et al.)
+        delta = other.mean - self.mean
+        weight = np.zeros(self.shape)
+        weight[ok] = other.nfinite[ok] / n[ok]
+        self.m2 += other.m2 + delta**2 * self.nfinite * weight
+        self.mean += delta * weight
+        self.nfinite = n
+
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        self.sum += other.sum
+        return self
+
+    def results(self, which=streamingstatistics, ddof=0):
+        '''
+        Calculate the statistics from what's been accumulated.
+
+        Pixels with no finite values have NaN statistics
+        (and 0 for the sum and the number of finite values).
+
+        Parameters
+        ----------
+        which : list
+            Which statistics do we want? (Any of `streamingstatistics`.)
+
+        ddof : int
+            The "delta degrees of freedom" for the variance
+            and standard deviation (as in np.var).
+
+        Returns
+        -------
+        statistics : dict
+            The 2D images of each statistic.
+        '''
+        empty = self.nfinite == 0
+        results = {}
+        for k in which:
+            if k == 'mean':
+                results[k] = np.where(empty, np.nan, self.mean)
+            elif k in ['var', 'std']:
+                dof = self.nfinite - ddof
+                var = np.full(self.shape, np.nan)
+                var[dof > 0] = self.m2[dof > 0] / dof[dof > 0]
+                results[k] = var if k == 'var' else np.sqrt(var)
+            elif k == 'min':
+                results[k] = np.where(empty, np.nan, self.min)
+            elif k == 'max':
+                results[k] = np.where(empty, np.nan, self.max)
+            elif k == 'sum':
+                results[k] = self.sum.copy()
+            elif k == 'nfinite':
+                results[k] = self.nfinite.copy()
+            else:
+                raise ValueError('"{}" is not a streaming statistic'.format(k))
+        return results
+
+
+def accumulate_statistics(sequence, timesteps=None, workers=1):
+    '''
+    Accumulate the statistics of a sequence's frames in one pass,
+    (optionally) in parallel chunks that get merged at the end.
+
+    Parameters
+    ----------
+    sequence : Image_Sequence
+        The sequence whose frames should be included.
+
+    timesteps : list, None
+        Which timesteps to include (by default, all of them).
+
+    workers : int
+        How many chunks of frames should be accumulated at once (in threads)?
+
+    Returns
+    -------
+    accumulator : StatisticsAccumulator
+        The accumulated statistics.
+    '''
+    if timesteps is None:
+        timesteps = np.arange(sequence.N)
+    shape = sequence.shape[1:]
+
+    def accumulate(chunk):
+        accumulator = StatisticsAccumulator(shape)
+        for i in chunk:
+            accumulator.add(sequence[i])
+        return accumulator
+
+    workers = int(np.clip(workers or 1, 1, np.maximum(len(timesteps), 1)))
+    if workers == 1:
+        return accumulate(timesteps)
+
+    chunks = np.array_split(np.asarray(timesteps), workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        partials = list(executor.map(accumulate, chunks))
+    total = partials[0]
+    for p in partials[1:]:
+        total.merge(p)
+    return total
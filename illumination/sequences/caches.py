@@ -0,0 +1,213 @@
+'''
+Define a cache for decoded images, so that asking a sequence
+for the same frame over and over again (as happens when many
+frames, zooms, and processing steps share one source) doesn't
+keep re-reading and re-verifying the same file from disk.
+'''
+
+from ..imports import *
+from collections import OrderedDict
+import threading
+
+__all__ = ['FrameCache', 'framecache']
+
+
+class FrameCache(Talker):
+    '''
+    A least-recently-used cache of image arrays,
+    capped by a total budget of bytes.
+    '''
+
+    def __init__(self, maxbytes=256 * 1024**2, maxitems=None, name='cache'):
+        '''
+        Initialize an empty cache.
+
+        Parameters
+        ----------
+
+        maxbytes : int
+            The total number of bytes of image data that
+            may be held in the cache at once. When adding
+            an image would exceed this, the least recently
+            used images get evicted first.
+
+        maxitems : int, None
+            (Optionally) also limit the number of images
+            that can be held in the cache at once.
+
+        name : str
+            A name to give this cache.
+        '''
+
+        Talker.__init__(self)
+        self.name = name
+        self.maxbytes = maxbytes
+        self.maxitems = maxitems
+
+        # the cached images, with the most recently used at the end
+        self._images = OrderedDict()
+        self._lock = threading.RLock()
+
+        # keep track of how well the cache is working
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        '''
+        How should this cache be represented as a string?
+        '''
+        return '<{} | {} images | {:.1f}/{:.1f} MB | {} hits, {} misses, {} evictions>'.format(
+                    self.name, len(self), self.nbytes / 1024**2, self.maxbytes / 1024**2,
+                    self.hits, self.misses, self.evictions)
+
+    def __len__(self):
+        return len(self._images)
+
+    def __contains__(self, key):
+        return key in self._images
+
+    def __getstate__(self):
+        '''
+        Caches are shared by reference, so don't pickle the images or the lock.
+        '''
+        state = dict(self.__dict__)
+        state['_images'] = OrderedDict()
+        state['_lock'] = None
+        state['nbytes'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        '''
+        Get an image from the cache (or None if it isn't there).
+
+        Parameters
+        ----------
+        key : hashable
+            The key under which the image was stored.
+
+        Returns
+        -------
+        image : array, None
+            The cached image.
+        '''
+        with self._lock:
+            try:
+                image = self._images[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._images.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        '''
+        Store an image in the cache, evicting old images if necessary.
+
+        What's stored is a read-only view of the image, so that
+        nobody accidentally modifies the copy that everyone else
+        sees (the caller's own array is left writeable).
+
+        Parameters
+        ----------
+        key : hashable
+            The key under which to store the image.
+
+        image : array
+            The image to store.
+
+        Returns
+        -------
+        image : array
+            The read-only view that was stored (or the
+            original image, if it wasn't worth storing).
+        '''
+        if image is None:
+            return image
+
+        nbytes = np.asarray(image).nbytes
+        if nbytes > self.maxbytes:
+            # don't bother storing images that would fill the whole cache
+            return image
+
+        try:
+            image = image.view()
+            image.flags.writeable = False
+        except (AttributeError, ValueError):
+            pass
+
+        with self._lock:
+            if key in self._images:
+                self.nbytes -= self._images.pop(key).nbytes
+            self._images[key] = image
+            self.nbytes += nbytes
+            self._evict()
+        return image
+
+    def fetch(self, key, load):
+        '''
+        Get an image from the cache, or load (and store) it if it's missing.
+
+        Parameters
+        ----------
+        key : hashable
+            The key under which the image is stored.
+
+        load : function
+            A function (with no arguments) that returns the
+            image, to be called only if it's not already cached.
+
+        Returns
+        -------
+        image : array
+            The (possibly cached) image.
+        '''
+        image = self.get(key)
+        if image is None:
+            image = self.put(key, load())
+        return image
+
+    def _evict(self):
+        '''
+        Remove the least recently used images until we're under budget.
+        '''
+        while (self.nbytes > self.maxbytes) or (
+               (self.maxitems is not None) and (len(self._images) > self.maxitems)):
+            key, image = self._images.popitem(last=False)
+            self.nbytes -= image.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        '''
+        Empty the cache (but keep its counters).
+        '''
+        with self._lock:
+            self._images.clear()
+            self.nbytes = 0
+
+    def statistics(self):
+        '''
+        Summarize how well the cache is working.
+
+        Returns
+        -------
+        statistics : dict
+            The number of hits, misses, and evictions,
+            and the current number of images and bytes stored.
+        '''
+        return dict(hits=self.hits,
+                    misses=self.misses,
+                    evictions=self.evictions,
+                    images=len(self),
+                    nbytes=self.nbytes,
+                    maxbytes=self.maxbytes)
+
+
+# a process-wide cache, which can be shared among many sequences
+framecache = FrameCache(maxbytes=1024**3, name='framecache')
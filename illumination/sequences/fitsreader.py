@@ -0,0 +1,383 @@
+'''
+Tools for reading images out of (uncompressed) FITS files directly,
+without building a full astropy HDUList for every frame. Each file's
+headers are parsed only once, to record where its image data start
+and how they are encoded; after that, reading a frame is a single
+`np.fromfile` (or `np.memmap`) plus one conversion to native byte order.
+'''
+
+from ..imports import *
+
+__all__ = ['FITSLayout', 'scan_fits', 'read_fits_header', 'read_fits_headers',
+           'read_fits_header_values']
+
+# FITS files are organized in blocks of this many bytes
+blocksize = 2880
+
+# each header card is this many characters long
+cardsize = 80
+
+# these keywords are needed to skip over an HDU's data
+structuralkeys = ['BITPIX', 'NAXIS', 'PCOUNT', 'GCOUNT'] + ['NAXIS{}'.format(i) for i in range(1, 1000)]
+
+# the (big-endian) data types for each BITPIX
+bitpixtodtype = {8: '>u1', 16: '>i2', 32: '>i4', 64: '>i8', -32: '>f4', -64: '>f8'}
+
+
+def _padded(nbytes):
+    '''
+    How many bytes does something occupy, once padded out to full blocks?
+    '''
+    return int(np.ceil(nbytes / blocksize) * blocksize)
+
+
+def read_fits_header(f):
+    '''
+    Read one header from an open FITS file, starting at its current position.
+
+    Only the header blocks are read; the file is left
+    positioned at the start of the data that follow.
+
+    Parameters
+    ----------
+    f : file
+        An open (binary) file, positioned at the start of a header.
+
+    Returns
+    -------
+    header : astropy.io.fits.Header
+        The parsed header.
+    '''
+
+    blocks = []
+    while True:
+        block = f.read(blocksize)
+        if len(block) < blocksize:
+            raise EOFError('reached the end of {} without finding END'.format(f.name))
+        blocks.append(block)
+
+        # look for the END card, which must start a card
+        for i in range(0, blocksize, cardsize):
+            if block[i:i + 8] == b'END     ':
+                return fits.Header.fromstring(b''.join(blocks).decode('ascii', errors='replace'))
+
+
+def _datasize(header):
+    '''
+    How many bytes of data (before padding) follow a given header?
+    '''
+    naxis = header.get('NAXIS', 0)
+    if naxis == 0:
+        return 0
+    n = np.prod([header['NAXIS{}'.format(i + 1)] for i in range(naxis)], dtype=np.int64)
+    bytesperpixel = abs(header['BITPIX']) // 8
+    return int(bytesperpixel * header.get('GCOUNT', 1) * (header.get('PCOUNT', 0) + n))
+
+
+class FITSLayout(object):
+    '''
+    Where (and how) the data for one HDU are stored in a FITS file.
+    '''
+
+    def __init__(self, filename, ext, header, offset):
+        '''
+        Parameters
+        ----------
+        filename : str
+            The path to the FITS file.
+
+        ext : int
+            Which extension is this?
+
+        header : astropy.io.fits.Header
+            The header of this extension.
+
+        offset : int
+            The byte offset at which this extension's data start.
+        '''
+
+        self.filename = filename
+        self.ext = ext
+        self.header = header
+        self.offset = offset
+
+        self.bitpix = header.get('BITPIX', 8)
+        naxis = header.get('NAXIS', 0)
+        self.shape = tuple(header['NAXIS{}'.format(i)] for i in range(naxis, 0, -1))
+        self.bscale = header.get('BSCALE', 1)
+        self.bzero = header.get('BZERO', 0)
+        self.blank = header.get('BLANK', None)
+
+        # compressed images hide inside binary tables, which we can't read directly
+        self.iscompressed = header.get('ZIMAGE', False)
+
+    def __repr__(self):
+        return '<FITSLayout | {}[{}] | {} BITPIX={} @ {} bytes>'.format(
+                    os.path.basename(self.filename), self.ext,
+                    self.shape, self.bitpix, self.offset)
+
+    @property
+    def isreadable(self):
+        '''
+        Can this layout be read directly (as an uncompressed image)?
+        '''
+        return (not self.iscompressed) and (len(self.shape) > 0) and (self.bitpix in bitpixtodtype)
+
+    @property
+    def rawdtype(self):
+        '''
+        The (big-endian) data type as stored in the file.
+        '''
+        return np.dtype(bitpixtodtype[self.bitpix])
+
+    @property
+    def _isunsigned(self):
+        '''
+        Is this using the BZERO convention for unsigned (or signed byte) integers?
+        '''
+        return (self.bitpix > 0) and (self.bscale == 1) and (
+                    self.bzero == (-128 if self.bitpix == 8 else 2**(self.bitpix - 1)))
+
+    @property
+    def _isscaled(self):
+        return ((self.bscale != 1) or (self.bzero != 0)) and not self._isunsigned
+
+    def _convert(self, raw):
+        '''
+        Convert raw (big-endian) pixels into native, physical values,
+        mimicking what astropy would return for the same HDU.
+        '''
+
+        if self._isscaled:
+            # scale into floats (converting byte order at the same time)
+            floattype = np.float32 if self.bitpix in [8, 16, -32] else np.float64
+            image = raw.astype(floattype)
+            if (self.blank is not None) and (self.bitpix > 0):
+                image[raw == self.blank] = np.nan
+            if self.bscale != 1:
+                image *= self.bscale
+            if self.bzero != 0:
+                image += self.bzero
+            return image
+
+        # convert to native byte order (swapping in place, if we own the pixels)
+        if raw.dtype.isnative:
+            image = raw
+        elif raw.flags.writeable and raw.flags.owndata:
+            image = raw.byteswap(inplace=True).view(raw.dtype.newbyteorder('='))
+        else:
+            image = raw.astype(raw.dtype.newbyteorder('='))
+        if self._isunsigned:
+            # flip the sign bit (in place), to apply the BZERO offset
+            if self.bitpix == 8:
+                image ^= np.uint8(0x80)
+                image = image.view(np.int8)
+            else:
+                unsigned = np.dtype('=u{}'.format(self.bitpix // 8))
+                image = image.view(unsigned)
+                image ^= unsigned.type(1 << (self.bitpix - 1))
+        return image
+
+    def read(self):
+        '''
+        Read the full image.
+
+        Returns
+        -------
+        image : array
+            The image, in native byte order.
+        '''
+        count = int(np.prod(self.shape))
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            raw = np.fromfile(f, dtype=self.rawdtype, count=count)
+        if raw.size != count:
+            raise EOFError('{} ended before all its data could be read'.format(self.filename))
+        return self._convert(raw).reshape(self.shape)
+
+    def read_section(self, rows, cols):
+        '''
+        Read only part of the image.
+
+        Parameters
+        ----------
+        rows, cols : slice
+            The rows and columns to read (of the last two axes).
+
+        Returns
+        -------
+        image : array
+            The section of the image, in native byte order.
+        '''
+        raw = np.array(self.memmap()[..., rows, cols])
+        return self._convert(raw)
+
+    def memmap(self):
+        '''
+        Map the (raw, big-endian) image into memory, without reading it.
+
+        Returns
+        -------
+        raw : np.memmap
+            A read-only memory map of the stored pixels.
+        '''
+        return np.memmap(self.filename, dtype=self.rawdtype, mode='r',
+                         offset=self.offset, shape=self.shape)
+
+
+def scan_fits(filename, extensions=None):
+    '''
+    Parse the headers of a FITS file, recording where each HDU's data live.
+
+    Only header blocks are read; the data are skipped over.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the FITS file.
+
+    extensions : list, None
+        Which extensions do we need? The scan stops after the
+        last of these. If None, scan every extension in the file.
+
+    Returns
+    -------
+    layouts : list of FITSLayout
+        The layouts of the HDUs, in order.
+    '''
+
+    layouts = []
+    last = None if extensions is None else np.max(extensions)
+    with open(filename, 'rb') as f:
+        if f.read(2) == b'\x1f\x8b':
+            raise ValueError("{} is gzipped, so it can't be read directly".format(filename))
+        f.seek(0)
+
+        ext = 0
+        while (last is None) or (ext <= last):
+            try:
+                header = read_fits_header(f)
+            except EOFError:
+                if last is None and ext > 0:
+                    break
+                raise
+            offset = f.tell()
+            layouts.append(FITSLayout(filename, ext, header, offset))
+            f.seek(offset + _padded(_datasize(header)))
+            ext += 1
+
+    return layouts
+
+
+def read_fits_headers(filename, extensions=[0]):
+    '''
+    Read some headers from a FITS file, without ever reading its data.
+
+    Parameters
+    ----------
+    filename : str
+        The path to the FITS file.
+
+    extensions : list
+        The extensions whose headers we want.
+
+    Returns
+    -------
+    headers : list of astropy.io.fits.Header
+        The requested headers, in the same order as `extensions`.
+    '''
+    try:
+        layouts = scan_fits(filename, extensions=extensions)
+        return [layouts[e].header for e in extensions]
+    except (ValueError, EOFError):
+        # (astropy can cope with gzipped files, or headers missing their END card,
+        #  and only reads the data of a lazily-loaded HDU when asked)
+        with fits.open(filename, ignore_missing_end=True) as hdulist:
+            return [hdulist[e].header.copy() for e in extensions]
+
+
+def _keyword(card):
+    '''
+    What is the keyword of a (raw, 80-byte) header card?
+    '''
+    if card[:9] == b'HIERARCH ':
+        return card[9:].split(b'=')[0].strip().decode('ascii', errors='replace')
+    return card[:8].rstrip().decode('ascii', errors='replace')
+
+
+def _read_header_cards(f, keys):
+    '''
+    Read one header from an open FITS file, starting at its current position,
+    but pick out only the raw cards for some keywords (plus any CONTINUE
+    cards that follow them), without parsing any of the rest.
+
+    Returns
+    -------
+    cards : dict
+        The raw card(s) for each requested keyword present in the header.
+    '''
+    cards = {}
+    previous = None
+    while True:
+        block = f.read(blocksize)
+        if len(block) < blocksize:
+            raise EOFError('reached the end of {} without finding END'.format(f.name))
+        for i in range(0, blocksize, cardsize):
+            card = block[i:i + cardsize]
+            if card[:8] == b'END     ':
+                return cards
+            if (card[:8] == b'CONTINUE') and (previous is not None):
+                cards[previous] += card
+                continue
+            k = _keyword(card)
+            if (k in keys) and (k not in cards):
+                cards[k] = card
+                previous = k
+            else:
+                previous = None
+
+
+def read_fits_header_values(filename, extensions=[0], keys=[]):
+    '''
+    Read the values of a few keywords from some headers of a FITS file,
+    parsing only the cards for those keywords (and never reading the data).
+
+    Parameters
+    ----------
+    filename : str
+        The path to the FITS file.
+
+    extensions : list
+        The extensions whose headers we want.
+
+    keys : list
+        The keywords whose values we want.
+
+    Returns
+    -------
+    values : list of dicts
+        The values of the requested keywords present in
+        each header, in the same order as `extensions`.
+    '''
+
+    keys = set(keys)
+    needed = keys | set(structuralkeys)
+    found = {}
+    try:
+        with open(filename, 'rb') as f:
+            if f.read(2) == b'\x1f\x8b':
+                raise ValueError("{} is gzipped, so it can't be read directly".format(filename))
+            f.seek(0)
+
+            for ext in range(np.max(extensions) + 1):
+                cards = _read_header_cards(f, needed)
+                parsed = {k: fits.Card.fromstring(c.decode('ascii', errors='replace')).value
+                          for k, c in cards.items()}
+                if ext in extensions:
+                    found[ext] = {k: v for k, v in parsed.items() if k in keys}
+                f.seek(f.tell() + _padded(_datasize(parsed)))
+    except (ValueError, EOFError):
+        headers = read_fits_headers(filename, extensions)
+        return [{k: h[k] for k in keys if k in h} for h in headers]
+
+    return [found[e] for e in extensions]
@@ -0,0 +1,381 @@
+'''
+Define a persistent index of the information extracted from the
+files in a sequence (header values, parsed filenames, the time
+axis, and the sort order), stored in a small JSON file on disk.
+Reopening an unchanged sequence can then skip rescanning every
+file, and only new or modified files need to be looked at again.
+'''
+
+from ..imports import *
+import json
+import hashlib
+
+__all__ = ['SequenceIndex', 'default_index_path']
+
+# the default name for the index file
+indexfilename = '.illumination-index.json'
+
+
+def default_index_path(filenames):
+    '''
+    Where should the index for a group of files live, by default?
+
+    Parameters
+    ----------
+    filenames : list
+        The files in the sequence.
+
+    Returns
+    -------
+    path : str
+        An index file in the directory shared by all the files.
+    '''
+    directory = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in filenames])
+    return os.path.join(directory, indexfilename)
+
+
+def _encode(value):
+    '''
+    Convert a value into something that can be stored as JSON.
+    '''
+    if isinstance(value, Time):
+        return {'__time__': value.isot, 'scale': value.scale}
+    elif isinstance(value, np.generic):
+        return value.item()
+    elif isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    else:
+        # (e.g. astropy's Undefined header values)
+        return None
+
+
+def _decode(value):
+    '''
+    Convert a value stored as JSON back into its original form.
+    '''
+    if isinstance(value, dict) and '__time__' in value:
+        return Time(value['__time__'], format='isot', scale=value['scale'])
+    else:
+        return value
+
+
+class SequenceIndex(Talker):
+    '''
+    An on-disk index of the information extracted from the files in sequences,
+    keyed by each file's path, size, and modification time.
+    '''
+
+    version = 2
+
+    def __init__(self, path):
+        '''
+        Load an index (or start a new one).
+
+        Parameters
+        ----------
+        path : str
+            The JSON file in which this index is stored.
+        '''
+
+        Talker.__init__(self)
+        self.path = path
+        self._modified = False
+        try:
+            with open(self.path) as f:
+                stored = json.load(f)
+            assert(stored['version'] == self.version)
+            self.files = stored['files']
+            self.sequences = stored['sequences']
+            self.speak('loaded index of {} files from {}'.format(len(self.files), self.path))
+        except (IOError, OSError, ValueError, KeyError, AssertionError):
+            self.files = {}
+            self.sequences = {}
+
+    def __repr__(self):
+        return '<SequenceIndex | {} files | {}>'.format(len(self.files), self.path)
+
+    def _entry(self, filename):
+        '''
+        Get the index entry for a file, resetting it if the file has changed.
+        '''
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        entry = self.files.get(path)
+        if (entry is None) or (entry['size'] != stat.st_size) or (entry['mtime'] != stat.st_mtime):
+            entry = dict(size=stat.st_size, mtime=stat.st_mtime)
+            self.files[path] = entry
+            self._modified = True
+        return entry
+
+    def header_values(self, filenames, extensions, scan, keys=None):
+        '''
+        Get the header values for some files, scanning only those
+        that are new (or modified) since they were last indexed
+        (or that were indexed without all the requested keys).
+
+        Parameters
+        ----------
+        filenames : list
+            The files whose header values we want.
+
+        extensions : list
+            Which extensions' headers are merged together?
+
+        scan : function
+            A function that takes a list of filenames (and a `keys`
+            keyword argument) and returns a list of dictionaries
+            of their header values.
+
+        keys : list, None
+            Which keywords do we want? If None, we want all of them.
+
+        Returns
+        -------
+        values : list of dicts
+            The header values for each file, in order.
+        '''
+
+        key = 'headers-{}'.format('-'.join([str(e) for e in extensions]))
+        entries = [self._entry(f) for f in filenames]
+
+        def covered(e):
+            if key not in e:
+                return False
+            stored = e[key]['keys']
+            return (stored is None) or ((keys is not None) and set(keys) <= set(stored))
+
+        # scan (only) the files that aren't already indexed with these keys
+        stale = [i for i, e in enumerate(entries) if not covered(e)]
+        if len(stale) > 0:
+            self.speak('scanning headers of {}/{} files missing from the index'.format(len(stale), len(filenames)))
+
+            # (keep any keys that were indexed before, as well as the new ones)
+            if keys is None:
+                wanted = None
+            else:
+                wanted = list(keys)
+                for i in stale:
+                    for k in (entries[i].get(key, {}).get('keys') or []):
+                        if k not in wanted:
+                            wanted.append(k)
+
+            scanned = scan([filenames[i] for i in stale], keys=wanted)
+            for i, values in zip(stale, scanned):
+                entries[i][key] = dict(keys=wanted, values={k: _encode(v) for k, v in values.items()})
+            self._modified = True
+
+        return [{k: _decode(v) for k, v in e[key]['values'].items() if (keys is None) or (k in keys)}
+                for e in entries]
+
+    def filename_values(self, filenames, filenameparser):
+        '''
+        Get the values parsed from some filenames, parsing
+        only those that haven't already been indexed.
+
+        Parameters
+        ----------
+        filenames : list
+            The files whose names should be parsed.
+
+        filenameparser : function
+            This function takes a filename as input, and returns a
+            dictionary containing parsed keys and values derived from it.
+
+        Returns
+        -------
+        values : list of dicts
+            The parsed values for each file, in order.
+        '''
+        key = 'filename-{}'.format(filenameparser.__name__)
+        values = []
+        for f in filenames:
+            e = self._entry(f)
+            if key not in e:
+                e[key] = {k: _encode(v) for k, v in filenameparser(f).items()}
+                self._modified = True
+            values.append({k: _decode(v) for k, v in e[key].items()})
+        return values
+
+    def _signature(self, filenames, **options):
+        '''
+        Create a unique key for a sequence of files (and how its time axis was made).
+        '''
+        paths = sorted([os.path.abspath(f) for f in filenames])
+        description = json.dumps(dict(paths=paths, **options), sort_keys=True, default=str)
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def recall_time_axis(self, filenames, **options):
+        '''
+        Recall a previously-defined time axis for a group of files,
+        as long as none of them have changed since it was stored.
+
+        Parameters
+        ----------
+        filenames : list
+            The files in the sequence.
+
+        **options : dict
+            Any options that affected how the time axis was defined.
+
+        Returns
+        -------
+        time : astropy Time, None
+            The times for each file (in the same order as `filenames`).
+
+        timeisfake : bool
+            Was this time axis made up?
+        '''
+
+        stored = self.sequences.get(self._signature(filenames, **options))
+        if stored is None:
+            return None, None
+
+        # make sure none of the files have changed since the time axis was stored
+        for path, stamp in zip(stored['order'], stored['stamps']):
+            e = self._entry(path)
+            if [e['size'], e['mtime']] != stamp:
+                return None, None
+
+        # put the times back into the requested order
+        times = dict(zip(stored['order'], stored['time']))
+        gps = [times[os.path.abspath(f)] for f in filenames]
+        time = Time(np.asarray(gps, dtype=float), format='gps', scale='tai')
+        return getattr(time, stored['scale']), stored['timeisfake']
+
+    def record(self, sequence, **options):
+        '''
+        Store the time axis and sort order of a sequence.
+
+        Parameters
+        ----------
+        sequence : FITS_Sequence
+            A sequence whose time axis has been defined.
+
+        **options : dict
+            Any options that affected how the time axis was defined.
+        '''
+
+        order = [os.path.abspath(f) for f in sequence.filenames]
+        gps = [float(t) for t in sequence.time.gps]
+        entries = [self._entry(f) for f in order]
+
+        # keep each file's time, so the index can be queried by time
+        if not sequence._timeisfake:
+            for e, t in zip(entries, gps):
+                e['time'] = t
+
+        signature = self._signature(order, **options)
+        stored = dict(order=order,
+                      time=gps,
+                      stamps=[[e['size'], e['mtime']] for e in entries],
+                      scale=sequence.time.scale,
+                      timeisfake=bool(sequence._timeisfake))
+        if self.sequences.get(signature) != stored:
+            self.sequences[signature] = stored
+            self._modified = True
+
+    def save(self):
+        '''
+        Save this index to disk (if anything has changed).
+        '''
+        if not self._modified:
+            return
+        temporary = self.path + '.{}.tmp'.format(os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(dict(version=self.version, files=self.files, sequences=self.sequences), f)
+        os.replace(temporary, self.path)
+        self._modified = False
+        self.speak('saved index of {} files to {}'.format(len(self.files), self.path))
+
+    def query(self, where={}, tmin=None, tmax=None, filenames=None):
+        '''
+        Find the indexed files that match some conditions,
+        without opening any of them.
+
+        For example, `index.query(where={'QUAL_BIT':0}, tmin=t0, tmax=t1)`
+        finds all the frames with good quality between t0 and t1
+        (if the index was made by a FITS_Sequence with
+        `header_keys=['QUAL_BIT']`).
+
+        Only keys that were indexed can be queried: by default, a
+        FITS_Sequence only extracts the header keywords that define
+        its time axis, so any others need to be listed in its
+        `header_keys` (or use header_keys='all') to be indexed.
+
+        Parameters
+        ----------
+        where : dict
+            Keys and values that must match exactly
+            (in either the header or filename values).
+            A ValueError is raised if none of the files
+            had one of these keys indexed.
+
+        tmin, tmax : astropy Time, float, None
+            The range of times to include (as Times or GPS seconds).
+            Only files with recorded times can match these.
+
+        filenames : list, None
+            Only consider these files (by default, consider all indexed files).
+
+        Returns
+        -------
+        matches : list
+            The paths of the matching files, sorted by time (if known).
+        '''
+
+        if isinstance(tmin, Time):
+            tmin = tmin.gps
+        if isinstance(tmax, Time):
+            tmax = tmax.gps
+
+        if filenames is None:
+            paths = list(self.files.keys())
+        else:
+            paths = [os.path.abspath(f) for f in filenames]
+
+        matches = []
+        unindexed = {k: 0 for k in where}
+        considered = 0
+        for path in paths:
+            e = self.files.get(path)
+            if e is None:
+                continue
+            considered += 1
+
+            # merge all the values we know about this file (and which keys were looked for)
+            values, indexed, everything = {}, set(), False
+            for k in e.keys():
+                if k.startswith('headers-'):
+                    values.update(e[k]['values'])
+                    if e[k]['keys'] is None:
+                        everything = True
+                    else:
+                        indexed.update(e[k]['keys'])
+                elif k.startswith('filename-'):
+                    values.update(e[k])
+                    indexed.update(e[k].keys())
+            for k in where:
+                if not (everything or (k in indexed) or (k in values)):
+                    unindexed[k] += 1
+
+            if not np.all([(k in values) and (values[k] == v) for k, v in where.items()]):
+                continue
+            t = e.get('time')
+            if (tmin is not None) or (tmax is not None):
+                if t is None:
+                    continue
+                if (tmin is not None) and (t < tmin):
+                    continue
+                if (tmax is not None) and (t > tmax):
+                    continue
+            matches.append((np.inf if t is None else t, path))
+
+        # a key that was never indexed can't match anything, which is probably a mistake
+        for k, n in unindexed.items():
+            if (n > 0) and (n == considered):
+                raise ValueError('"{}" was not indexed for any of these files '.format(k) +
+                                 '(list it in the `header_keys` of the FITS_Sequence)')
+            elif n > 0:
+                self.warning('"{}" was not indexed for {}/{} files, so they don\'t match'.format(k, n, considered))
+
+        return [path for t, path in sorted(matches)]
@@ -0,0 +1,609 @@
+'''
+Define a processing pipeline for images: an ordered list of steps
+(subtract a median or a neighboring frame, normalize, clip, bin...)
+that gets applied to each image of a sequence as it's needed.
+
+The pipeline is evaluated lazily, one timestep at a time. The output
+of every step is memoized (for the few most recent timesteps), so
+a step that needs its neighbors' inputs (like a difference image,
+or a rolling median) reuses them instead of recalculating them.
+Expensive shared products (like a median image) are calculated once
+by the sequence and reused by every step and frame that needs them.
+(For a step further down the pipeline, they're calculated from the
+output of the steps before it, rather than from the raw images.)
+Each step keeps a count of its calls and of the time spent in it
+(not counting the steps before it), so we can see where time goes.
+'''
+
+from ..imports import *
+from .caches import FrameCache
+from .rolling import RollingWindow
+from .Image_Sequence import Image_Sequence
+from collections import OrderedDict
+import time as clock
+import copy
+
+__all__ = ['Pipeline', 'Processed_Sequence', 'make_step',
+           'ProcessingStep', 'SubtractMedian', 'SubtractMean', 'SubtractBackground',
+           'SubtractPrevious', 'SubtractBeforeAndAfter', 'SubtractRolling',
+           'Normalize', 'Clip', 'Bin', 'Transform']
+
+
+def _describe(value):
+    '''
+    Describe a step's parameter as a string. Functions are described
+    by where they're defined (and anonymous ones by their identity too,
+    since they can't be told apart by name).
+    '''
+    if callable(value) and hasattr(value, '__qualname__'):
+        name = '{}.{}'.format(getattr(value, '__module__', None), value.__qualname__)
+        if ('<lambda>' in name) or ('<locals>' in name):
+            name += '@{:x}'.format(id(value))
+        return name
+    return repr(value)
+
+
+class ProcessingStep(object):
+    '''
+    One step of a processing pipeline.
+
+    Every step has an `apply(image, timestep, inputs)` method, which
+    returns a new image (it must never modify `image` in place).
+    `inputs` can provide the other images the step might need.
+        inputs.read(t) = the input to this step at timestep t
+        inputs.full(t) = the same, but for the whole image
+        inputs.crop(image) = crop a whole image to the region being processed
+        inputs.sequence = the sequence being processed
+        inputs.upstream = the sequence of this step's inputs (for reference
+                          images, like a median, made from what the
+                          steps before it have done)
+    '''
+
+    name = 'step'
+
+    # does processing a region give the same pixels as processing everything and cropping?
+    regionsafe = True
+
+    # how many of this step's recent inputs should be kept around?
+    inputbuffer = 1
+
+    def apply(self, image, timestep, inputs):
+        raise NotImplementedError('Sorry! {} has no way to apply itself.'.format(self))
+
+    @property
+    def description(self):
+        '''
+        The name of this step, with all of its parameters
+        (so steps that make different images are described
+        differently, even if they have the same name).
+        '''
+        parameters = ['{}={}'.format(k, _describe(v)) for k, v in sorted(vars(self).items())
+                      if not (k.startswith('_') or k in ['name', 'inputbuffer'])]
+        return '{}({})'.format(self.name, ', '.join(parameters))
+
+    def copy(self):
+        '''
+        A copy of this step, with none of its remembered state
+        (so it can be used in a different pipeline).
+        '''
+        return copy.copy(self)
+
+    def outputshape(self, shape):
+        '''
+        The (nrows, ncols) shape of the output, for inputs of a given shape.
+        '''
+        return shape
+
+    def __repr__(self):
+        return '<{}>'.format(self.name)
+
+
+class SubtractMedian(ProcessingStep):
+    '''
+    Subtract the per-pixel median image of the whole sequence.
+    '''
+
+    name = 'subtractmedian'
+
+    def __init__(self, method='exact'):
+        self.method = method
+
+    def apply(self, image, timestep, inputs):
+        return image - inputs.crop(inputs.upstream.median(method=self.method))
+
+
+class SubtractMean(ProcessingStep):
+    '''
+    Subtract the per-pixel mean image of the whole sequence.
+    '''
+
+    name = 'subtractmean'
+
+    def apply(self, image, timestep, inputs):
+        return image - inputs.crop(inputs.upstream.mean())
+
+
+class SubtractBackground(ProcessingStep):
+    '''
+    Subtract the median level of each (whole) image.
+    '''
+
+    name = 'subtractbackground'
+
+    def apply(self, image, timestep, inputs):
+        return image - np.median(inputs.full(timestep))
+
+
+class SubtractPrevious(ProcessingStep):
+    '''
+    Subtract the previous image (wrapping around at the start).
+    '''
+
+    name = 'subtractprevious'
+    inputbuffer = 2
+
+    def apply(self, image, timestep, inputs):
+        return image - inputs.read(timestep - 1)
+
+
+class SubtractBeforeAndAfter(ProcessingStep):
+    '''
+    Subtract the average of the images before and after (wrapping around).
+    '''
+
+    name = 'subtractbeforeandafter'
+    inputbuffer = 3
+
+    def apply(self, image, timestep, inputs):
+        return image - 0.5 * (inputs.read(timestep - 1) + inputs.read(timestep + 1))
+
+
+class SubtractRolling(ProcessingStep):
+    '''
+    Subtract a rolling median or mean of the images within +/- `halfwidth`
+    timesteps, updated one frame at a time as the window slides along.
+    '''
+
+    def __init__(self, how='median', halfwidth=5):
+        self.how = how
+        self.halfwidth = halfwidth
+        self.name = 'subtractrolling{}'.format(how)
+        self.inputbuffer = 2 * halfwidth + 2
+        self._windows = OrderedDict()
+
+    # how many regions' windows should be kept (each holds a whole window of pixels)?
+    maxwindows = 4
+
+    def copy(self):
+        new = ProcessingStep.copy(self)
+        new._windows = OrderedDict()
+        return new
+
+    def apply(self, image, timestep, inputs):
+        # (each region being processed needs its own window, and only the most recent are kept)
+        try:
+            window = self._windows[inputs.key]
+            self._windows.move_to_end(inputs.key)
+        except KeyError:
+            window = RollingWindow(inputs.read, inputs.N, halfwidth=self.halfwidth, how=self.how)
+            self._windows[inputs.key] = window
+            while len(self._windows) > self.maxwindows:
+                self._windows.popitem(last=False)
+        return image - window.background(timestep)
+
+
+class Normalize(ProcessingStep):
+    '''
+    Divide by a reference: the per-pixel 'median' or 'mean'
+    image of the sequence, or the 'background' level of each image.
+    '''
+
+    def __init__(self, reference='median', method='exact'):
+        self.reference = reference
+        self.method = method
+        self.name = 'normalize-{}'.format(reference)
+
+    def apply(self, image, timestep, inputs):
+        if self.reference == 'median':
+            reference = inputs.crop(inputs.upstream.median(method=self.method))
+        elif self.reference == 'mean':
+            reference = inputs.crop(inputs.upstream.mean())
+        elif self.reference == 'background':
+            reference = np.median(inputs.full(timestep))
+        else:
+            raise ValueError('"{}" is not a reference for normalizing'.format(self.reference))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return image / reference
+
+
+class Clip(ProcessingStep):
+    '''
+    Clip the image values to a range.
+    '''
+
+    name = 'clip'
+
+    def __init__(self, lower=None, upper=None):
+        self.lower = lower
+        self.upper = upper
+
+    def apply(self, image, timestep, inputs):
+        return np.clip(image, self.lower, self.upper)
+
+
+class Bin(ProcessingStep):
+    '''
+    Bin the image into (factor x factor) blocks,
+    trimming any leftover rows and columns.
+    '''
+
+    regionsafe = False
+
+    def __init__(self, factor=2, how='mean'):
+        self.factor = factor
+        self.how = how
+        self.name = 'bin{}'.format(factor)
+
+    def outputshape(self, shape):
+        return tuple(n // self.factor for n in shape)
+
+    def apply(self, image, timestep, inputs):
+        f = self.factor
+        nrows, ncols = self.outputshape(np.shape(image))
+        blocks = image[:nrows * f, :ncols * f].reshape(nrows, f, ncols, f)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return getattr(np, 'nan' + self.how)(blocks, axis=(1, 3))
+
+
+class Transform(ProcessingStep):
+    '''
+    Apply a pixel-by-pixel function (like np.log10 or np.sqrt) to the image.
+    '''
+
+    def __init__(self, function, name=None):
+        self.function = function
+        self.name = name or getattr(function, '__name__', 'transform')
+
+    def apply(self, image, timestep, inputs):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.function(image)
+
+
+def make_step(step, medianmethod='exact', rollingwindow=5):
+    '''
+    Make a processing step from its name (as used in imshowFrame's
+    `processingsteps`), or pass along something that's already a step.
+
+    Parameters
+    ----------
+    step : str, ProcessingStep
+        'subtractmedian', 'subtractmean', 'subtractbackground',
+        'subtractprevious', 'subtractbeforeandafter',
+        'subtractrollingmedian', 'subtractrollingmean',
+        'normalize' (by the median image), or a ProcessingStep.
+
+    medianmethod : str
+        How should median images be calculated (for 'subtractmedian')?
+        'exact' (the default), 'approximate', or 'auto' (see
+        `Image_Sequence.median`).
+
+    rollingwindow : int
+        The half-width of the window for rolling backgrounds.
+
+    Returns
+    -------
+    step : ProcessingStep
+        The step.
+    '''
+    if isinstance(step, ProcessingStep):
+        return step
+    steps = {'subtractmedian': lambda: SubtractMedian(method=medianmethod),
+             'subtractmean': SubtractMean,
+             'subtractbackground': SubtractBackground,
+             'subtractprevious': SubtractPrevious,
+             'subtractbeforeandafter': SubtractBeforeAndAfter,
+             'subtractrollingmedian': lambda: SubtractRolling('median', halfwidth=rollingwindow),
+             'subtractrollingmean': lambda: SubtractRolling('mean', halfwidth=rollingwindow),
+             'normalize': lambda: Normalize('median', method=medianmethod)}
+    try:
+        return steps[step]()
+    except KeyError:
+        raise ValueError('"{}" is not a processing step'.format(step))
+
+
+class _Inputs(object):
+    '''
+    What a step can see while it's processing one image.
+    '''
+
+    def __init__(self, pipeline, sequence, level, region, key):
+        self.pipeline = pipeline
+        self.sequence = sequence
+        self.level = level
+        self.region = region
+        self.key = key
+        self.N = len(sequence)
+
+    def read(self, timestep):
+        return self.pipeline._evaluate(self.sequence, self.level, timestep, self.region)
+
+    def full(self, timestep):
+        if self.region is None:
+            return self.read(timestep)
+        return self.pipeline._evaluate(self.sequence, self.level, timestep, None)
+
+    def crop(self, image):
+        if self.region is None:
+            return image
+        return image[self.region]
+
+    @property
+    def upstream(self):
+        return self.pipeline._upstream(self.sequence, self.level)
+
+
+class Pipeline(Talker):
+    '''
+    An ordered list of processing steps, applied lazily to the images of a sequence.
+    '''
+
+    def __init__(self, steps=[], buffer=4, rawbuffer=4, name='pipeline'):
+        '''
+        Set up a processing pipeline.
+
+        Parameters
+        ----------
+        steps : list
+            The ProcessingSteps (or their names) to apply, in order.
+
+        buffer : int
+            How many recent outputs of each step should be kept?
+
+        rawbuffer : int
+            How many recent raw images should be kept?
+
+        name : str
+            A name to give this pipeline.
+        '''
+        Talker.__init__(self)
+        self.name = name
+
+        # (each pipeline has its own copies of the steps, since some steps remember things)
+        self.steps = [make_step(s).copy() for s in steps]
+
+        # one cache for the raw images, and one for the output of each step
+        sizes = [rawbuffer] + [buffer] * len(self.steps)
+        for i, step in enumerate(self.steps):
+            sizes[i] = max(sizes[i], step.inputbuffer)
+        self.caches = [FrameCache(maxbytes=np.inf, maxitems=n, name='{}-{}'.format(name, i))
+                       for i, n in enumerate(sizes)]
+        self._sequence = None
+        self._upstreams = {}
+
+        # keep track of where the time goes
+        self.timing = OrderedDict()
+        for label in self._labels():
+            self.timing[label] = dict(calls=0, hits=0, seconds=0.0)
+        self._childtime = 0.0
+
+    def _labels(self):
+        return ['read'] + ['{}-{}'.format(i + 1, s.name) for i, s in enumerate(self.steps)]
+
+    def __repr__(self):
+        return '<{} | {}>'.format(self.name, ' > '.join(['read'] + [s.name for s in self.steps]))
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def description(self):
+        '''
+        All the steps of this pipeline, with their parameters.
+        '''
+        return ' > '.join(['read'] + [s.description for s in self.steps])
+
+    @property
+    def regionsafe(self):
+        '''
+        Can a region be processed on its own (without processing the whole image)?
+        '''
+        return all(s.regionsafe for s in self.steps)
+
+    def outputshape(self, shape):
+        '''
+        The (nrows, ncols) shape of processed images, for raw images of a given shape.
+        '''
+        shape = tuple(shape)
+        for s in self.steps:
+            shape = s.outputshape(shape)
+        return shape
+
+    def clear(self):
+        '''
+        Forget all memoized images (but keep the timing counters).
+        '''
+        for c in self.caches:
+            c.clear()
+        for s in self.steps:
+            if hasattr(s, '_windows'):
+                s._windows.clear()
+
+    def process(self, sequence, timestep, region=None):
+        '''
+        Get a processed image.
+
+        Parameters
+        ----------
+        sequence : Image_Sequence
+            The sequence of raw images.
+
+        timestep : int
+            Which element of the sequence?
+
+        region : (slice, slice), None
+            The (rows, cols) of the raw image to process, if we only
+            need part of it (by default, the whole thing). The pipeline
+            must be `regionsafe` for this.
+
+        Returns
+        -------
+        image : array
+            The processed image.
+        '''
+        if sequence is not self._sequence:
+            # (memoized images from some other sequence shouldn't be reused)
+            self.clear()
+            self._sequence = sequence
+            self._upstreams = {}
+        return self._evaluate(sequence, len(self.steps), timestep, region)
+
+    def _upstream(self, sequence, level):
+        '''
+        The sequence of outputs of the first `level` steps (which is
+        the raw sequence itself, for the first step), so reference
+        images like medians can be made from a step's own inputs.
+        '''
+        if level == 0:
+            return sequence
+        try:
+            return self._upstreams[level]
+        except KeyError:
+            partial = Pipeline(self.steps[:level], name='{}-upto{}'.format(self.name, level))
+            upstream = Processed_Sequence(sequence, partial)
+            self._upstreams[level] = upstream
+            return upstream
+
+    def _evaluate(self, sequence, level, timestep, region):
+        '''
+        Get the output of the first `level` steps for one timestep,
+        from the memoized outputs if possible.
+        '''
+        timestep = timestep % len(sequence)
+        if region is None:
+            regionkey = None
+        else:
+            # (slices can't be used as keys, so describe the region by its edges)
+            regionkey = tuple((r.start, r.stop) for r in region)
+        key = (timestep, regionkey)
+
+        timing = self.timing[self._labels()[level]]
+        image = self.caches[level].get(key)
+        if image is not None:
+            timing['hits'] += 1
+            return image
+
+        entry = self._childtime
+        start = clock.time()
+        if level == 0:
+            if (region is None) or not hasattr(sequence, 'read_region'):
+                image = sequence[timestep]
+                if region is not None:
+                    image = image[region]
+            else:
+                image = sequence.read_region(timestep, *region)
+            assert(image is not None)
+            inputtime = 0.0
+        else:
+            image = self._evaluate(sequence, level - 1, timestep, region)
+            inputtime = clock.time() - start
+            before = self._childtime
+            inputs = _Inputs(self, sequence, level - 1, region, regionkey)
+            image = self.steps[level - 1].apply(image, timestep, inputs)
+            # (any other images this step asked for were timed separately)
+            inputtime += self._childtime - before
+        elapsed = clock.time() - start
+
+        timing['calls'] += 1
+        timing['seconds'] += elapsed - inputtime
+        self._childtime = entry + elapsed
+        return self.caches[level].put(key, image)
+
+    def statistics(self):
+        '''
+        Summarize where the time has gone.
+
+        Returns
+        -------
+        statistics : dict
+            For reading and for each step: the number of images
+            calculated, the number reused from memory, and the total
+            time spent (not counting the steps before it).
+        '''
+        return OrderedDict((k, dict(v)) for k, v in self.timing.items())
+
+
+class Processed_Sequence(Image_Sequence):
+    '''
+    A sequence of images, passed through a processing pipeline.
+    '''
+
+    def __init__(self, sequence, steps=[], name=None, **kwargs):
+        '''
+        Initialize a Sequence that processes the images of another one.
+
+        Parameters
+        ----------
+        sequence : Image_Sequence
+            The sequence of raw images.
+
+        steps : list, Pipeline
+            The processing steps (or a whole Pipeline) to apply.
+
+        name : str, None
+            A name to give this sequence.
+        '''
+        self.raw = sequence
+        if isinstance(steps, Pipeline):
+            self.pipeline = steps
+        else:
+            self.pipeline = Pipeline(steps, **kwargs)
+        Image_Sequence.__init__(self, name=name or 'processed-{}'.format(sequence.name),
+                                time=sequence._get_times())
+        self._timeisfake = sequence._timeisfake
+
+    def __getitem__(self, timestep):
+        '''
+        Return the processed image for a given timestep.
+
+        Parameters
+        ----------
+        timestep : int
+            A timestep index (which element in the sequence do you want?)
+        '''
+        if timestep is None:
+            return None
+        return self.pipeline.process(self.raw, timestep)
+
+    def read_region(self, timestep, rows, cols):
+        '''
+        Read a rectangular region of the processed image for a given timestep
+        (processing only that region, if the pipeline can).
+
+        Parameters
+        ----------
+        timestep : int
+            A timestep index (which element in the sequence do you want?)
+
+        rows, cols : slice
+            The rows and columns of the region.
+
+        Returns
+        -------
+        region : 2D image
+            The pixels within the region.
+        '''
+        if self.pipeline.regionsafe:
+            return self.pipeline.process(self.raw, timestep, region=(rows, cols))
+        return self[timestep][rows, cols]
+
+    @property
+    def shape(self):
+        '''
+        Returns
+        -------
+        s : tuple
+            The shape of the image stack (ntimes x nrows x ncols)
+        '''
+        N, nrows, ncols = self.raw.shape
+        return (N,) + self.pipeline.outputshape((nrows, ncols))
@@ -0,0 +1,189 @@
+'''
+Define a prefetcher, which reads upcoming images on background
+threads while the current ones are being drawn. When animating,
+we know ahead of time which timesteps will be needed, and in what
+order, so reading from disk (and decompressing) can overlap with
+matplotlib drawing instead of blocking it.
+'''
+
+from ..imports import *
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import time as clock
+import threading
+import bisect
+
+__all__ = ['Prefetcher']
+
+
+class Prefetcher(Talker):
+    '''
+    Read images ahead of when they're needed,
+    on a pool of background threads, keeping
+    at most a fixed number of them in flight.
+    '''
+
+    def __init__(self, load, timesteps, depth=8, workers=2, name='prefetcher'):
+        '''
+        Start prefetching images.
+
+        Parameters
+        ----------
+        load : function
+            A function that takes a timestep and returns its image.
+
+        timesteps : list
+            The timesteps that will be requested, in the order they
+            will be requested. (Consecutive repeats are ignored.)
+
+        depth : int
+            The maximum number of images that can be read ahead of
+            the current one (whether still loading or waiting to be used).
+
+        workers : int
+            The number of background threads reading images.
+
+        name : str
+            A name to give this prefetcher.
+        '''
+
+        Talker.__init__(self)
+        self.name = name
+        self.load = load
+        self.depth = depth
+        self.workers = workers
+
+        # the order in which timesteps will be needed (dropping consecutive repeats)
+        timesteps = np.asarray(timesteps)
+        if len(timesteps) > 0:
+            keep = np.hstack([True, timesteps[1:] != timesteps[:-1]])
+            timesteps = timesteps[keep]
+        self.plan = timesteps
+        self.position = -1
+
+        # where each timestep comes up in the plan (so finding the next one is quick)
+        self._positions = {}
+        for i, timestep in enumerate(timesteps.tolist()):
+            self._positions.setdefault(timestep, []).append(i)
+        self.current = None
+
+        # the images that are being (or have been) read ahead
+        self._pending = OrderedDict()
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+        # keep track of how well the prefetching is working
+        self.requests = 0
+        self.ready = 0
+        self.stalls = 0
+        self.misses = 0
+        self.stalltime = 0.0
+        self._depths = []
+
+        self._refill()
+
+    def __repr__(self):
+        return '<{} | {}/{} timesteps | depth {} | {} workers>'.format(
+                    self.name, self.position + 1, len(self.plan), self.depth, self.workers)
+
+    def _advance(self, timestep):
+        '''
+        Move along the plan to a timestep (if it's coming up).
+        '''
+        positions = self._positions.get(timestep, [])
+        i = bisect.bisect_right(positions, self.position)
+        if i < len(positions):
+            self.position = positions[i]
+            return True
+        return False
+
+    def _refill(self):
+        '''
+        Make sure the next `depth` timesteps are being read,
+        and forget about any that are no longer coming up.
+        '''
+        window = self.plan[self.position + 1:self.position + 1 + self.depth]
+        wanted = set(window.tolist())
+        for timestep in list(self._pending.keys()):
+            if timestep not in wanted:
+                self._pending.pop(timestep).cancel()
+        for timestep in window.tolist():
+            if timestep not in self._pending:
+                self._pending[timestep] = self._executor.submit(self.load, timestep)
+
+    def get(self, timestep):
+        '''
+        Get a prefetched image.
+
+        Parameters
+        ----------
+        timestep : int
+            The timestep we want.
+
+        Returns
+        -------
+        image : array, None
+            The image, or None if this timestep wasn't prefetched
+            (in which case, the caller should read it itself).
+        '''
+
+        with self._lock:
+            if timestep == self.current:
+                # (this was already handed out, so it's probably cached)
+                return None
+
+            self.requests += 1
+            self._depths.append(sum([f.done() for f in self._pending.values()]))
+            future = self._pending.pop(timestep, None)
+            if not self._advance(timestep):
+                # this wasn't part of the plan
+                self.misses += 1
+                return None
+            self.current = timestep
+            self._refill()
+
+        if future is None:
+            self.misses += 1
+            return None
+        if future.done():
+            self.ready += 1
+        else:
+            # we have to wait for this image
+            self.stalls += 1
+            start = clock.time()
+            future.result()
+            self.stalltime += clock.time() - start
+        return future.result()
+
+    def close(self):
+        '''
+        Stop prefetching (cancelling anything that hasn't started yet).
+        '''
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+    def statistics(self):
+        '''
+        Summarize how well the prefetching is working.
+
+        Returns
+        -------
+        statistics : dict
+            The number of requests, how many were ready ahead of time,
+            how many had to wait (and for how long in total), how many
+            weren't prefetched at all, and the mean and maximum number
+            of images waiting to be used (the queue depth) at each request.
+        '''
+        depths = np.asarray(self._depths or [0])
+        return dict(requests=self.requests,
+                    ready=self.ready,
+                    stalls=self.stalls,
+                    misses=self.misses,
+                    stalltime=self.stalltime,
+                    meandepth=float(np.mean(depths)),
+                    maxdepth=int(np.max(depths)),
+                    depth=self.depth,
+                    workers=self.workers)
@@ -0,0 +1,220 @@
+'''
+Tools for estimating per-pixel quantiles (like the median) of a
+sequence in a single streaming pass, using a small fixed-bin
+histogram for every pixel. This needs memory only for the histograms
+(not for the whole cube), at the cost of some precision.
+
+Error bound
+-----------
+Each pixel's histogram covers a range [lower, upper) split into
+`nbins` equal bins of width w = (upper - lower)/nbins, plus one
+underflow and one overflow bin. The exact quantile (as defined by
+np.percentile, interpolating linearly between the two neighboring
+sorted values) lies between those two values; the estimate assumes
+values are spread uniformly within each bin, so it lies within the
+same bins. Therefore:
+
+    |estimate - exact| <= w * (number of bins spanned by the two values)
+
+which is just w whenever both values share a bin (as they always
+do for the median of an odd number of frames). If either value lands
+in the underflow (or overflow) bin, the estimate is clipped to the
+range and its error bound is reported as infinite.
+'''
+
+from ..imports import *
+
+__all__ = ['HistogramQuantiles', 'estimate_quantiles']
+
+
+class HistogramQuantiles(object):
+    '''
+    Estimate per-pixel quantiles from per-pixel fixed-bin histograms.
+    '''
+
+    # how many pixels' quantiles are calculated at once
+    chunksize = 65536
+
+    def __init__(self, lower, upper, nbins=32, maxcount=2**16 - 1):
+        '''
+        Start empty histograms.
+
+        Parameters
+        ----------
+        lower, upper : 2D arrays
+            The range covered by each pixel's histogram.
+
+        nbins : int
+            The number of bins covering that range.
+
+        maxcount : int
+            The largest number of images that will be added
+            (this sets the integer type of the counts).
+        '''
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self.shape = self.lower.shape
+        self.nbins = nbins
+
+        # (make sure every pixel's range has some width)
+        self.width = (self.upper - self.lower) / nbins
+        tiny = ~(self.width > 0)
+        self.width[tiny] = 1.0 / nbins
+        self.upper[tiny] = self.lower[tiny] + 1.0
+
+        dtype = np.uint16 if maxcount < 2**16 else np.uint32
+        npixels = int(np.prod(self.shape))
+
+        # the counts for each pixel are [underflow, nbins..., overflow]
+        self.counts = np.zeros((npixels, nbins + 2), dtype=dtype)
+        self._offsets = np.arange(npixels) * (nbins + 2)
+
+    def __repr__(self):
+        return '<HistogramQuantiles | {} | {} bins | {:.1f}MB>'.format(
+                    self.shape, self.nbins, self.counts.nbytes / 1024**2)
+
+    def add(self, image):
+        '''
+        Include one image in the histograms (ignoring non-finite pixels).
+
+        Parameters
+        ----------
+        image : 2D array
+            The image to include.
+        '''
+        image = np.asarray(image, dtype=np.float64).reshape(-1)
+        ok = np.isfinite(image)
+        scaled = (image[ok] - self.lower.reshape(-1)[ok]) / self.width.reshape(-1)[ok]
+
+        # which bin does each pixel fall in? (0 = underflow, nbins + 1 = overflow)
+        bins = np.clip(np.floor(scaled), -1, self.nbins).astype(np.int64) + 1
+
+        # each pixel appears only once, so this in-place fancy increment is safe
+        flat = self.counts.reshape(-1)
+        flat[self._offsets[ok] + bins] += 1
+
+    def quantile(self, q):
+        '''
+        Estimate a quantile for every pixel.
+
+        Parameters
+        ----------
+        q : float
+            The quantile (between 0 and 1).
+
+        Returns
+        -------
+        estimate : 2D array
+            The estimated quantile (NaN where there are no finite values).
+
+        errorbound : 2D array
+            The largest possible difference between the estimate
+            and the exact quantile (infinite where the quantile
+            fell outside the histogram's range).
+        '''
+        npixels = self.counts.shape[0]
+        estimate, errorbound = np.empty(npixels), np.empty(npixels)
+        lower, upper, width = [x.reshape(-1) for x in [self.lower, self.upper, self.width]]
+
+        # (work through the pixels in chunks, to keep the cumulative counts small)
+        for start in range(0, npixels, self.chunksize):
+            chunk = slice(start, start + self.chunksize)
+            counts = self.counts[chunk].astype(np.float64)
+            n = np.sum(counts, axis=1)
+            cumulative = np.cumsum(counts, axis=1)
+            pixels = np.arange(len(n))
+
+            def locate(k):
+                # find the bin containing the k-th smallest value (counting from 0),
+                # and estimate that value by spreading the bin's values uniformly
+                index = np.minimum(np.sum(cumulative <= k[:, np.newaxis], axis=1), self.nbins + 1)
+                before = cumulative[pixels, index] - counts[pixels, index]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    fraction = np.clip((k - before + 0.5) / counts[pixels, index], 0, 1)
+                return index, lower[chunk] + width[chunk] * (index - 1 + fraction)
+
+            # the exact quantile is between two neighboring sorted values (as in np.percentile)
+            position = q * np.maximum(n - 1, 0)
+            below, above = np.floor(position), np.ceil(position)
+            lowerindex, lowervalue = locate(below)
+            upperindex, uppervalue = locate(above)
+            e = np.clip(lowervalue + (position - below) * (uppervalue - lowervalue), lower[chunk], upper[chunk])
+
+            # both the estimate and the exact value lie within the bins spanned by those two values
+            bound = width[chunk] * (upperindex - lowerindex + 1)
+
+            # (anything that landed outside the range has no bound)
+            bound[(lowerindex == 0) | (upperindex == self.nbins + 1)] = np.inf
+            e[n == 0], bound[n == 0] = np.nan, np.nan
+            estimate[chunk], errorbound[chunk] = e, bound
+
+        return estimate.reshape(self.shape), errorbound.reshape(self.shape)
+
+
+def estimate_quantiles(sequence, q=[0.5], nbins=32, ncalibration=8, padding=1.0, timesteps=None):
+    '''
+    Estimate per-pixel quantiles of a sequence, in one streaming pass.
+
+    The range of each pixel's histogram is set from the first few
+    frames: their per-pixel min and max, widened on either side by
+    `padding` times their spread. Those frames are held in memory
+    until the range is known; after that, only the histograms are.
+
+    The memory needed is about nrows * ncols * (nbins + 2) * 2 bytes
+    (for fewer than 65536 frames). The error of each estimate is
+    returned alongside it; it is usually one bin width, which is
+    (1 + 2 * padding) * (the calibration frames' spread) / nbins.
+
+    Parameters
+    ----------
+    sequence : Image_Sequence
+        The sequence whose frames should be included.
+
+    q : list
+        The quantiles (between 0 and 1) to estimate.
+
+    nbins : int
+        The number of bins in each pixel's histogram.
+
+    ncalibration : int
+        How many frames should be used to set the histograms' ranges?
+
+    padding : float
+        How much should the ranges be widened beyond
+        the calibration frames' spread (on each side)?
+
+    timesteps : list, None
+        Which timesteps to include (by default, all of them).
+
+    Returns
+    -------
+    estimates : list of 2D arrays
+        The estimated quantile images (one for each of `q`).
+
+    errorbounds : list of 2D arrays
+        The maximum error of each pixel of each estimate.
+    '''
+    if timesteps is None:
+        timesteps = np.arange(sequence.N)
+
+    # set the ranges from the first few images
+    calibration = np.array([sequence[i] for i in timesteps[:ncalibration]], dtype=np.float64)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanmin(calibration, axis=0), np.nanmax(calibration, axis=0)
+    low[~np.isfinite(low)], high[~np.isfinite(high)] = 0.0, 0.0
+    spread = high - low
+    histograms = HistogramQuantiles(low - padding * spread, high + padding * spread,
+                                    nbins=nbins, maxcount=len(timesteps))
+
+    # stream all the images through the histograms
+    for image in calibration:
+        histograms.add(image)
+    del calibration
+    for i, t in enumerate(timesteps[ncalibration:]):
+        sequence.speak(' included frame {}/{} in histograms'.format(
+                            i + 1 + ncalibration, len(timesteps)), progress=True)
+        histograms.add(sequence[t])
+
+    results = [histograms.quantile(this) for this in q]
+    return [r[0] for r in results], [r[1] for r in results]
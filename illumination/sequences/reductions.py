@@ -0,0 +1,146 @@
+'''
+Tools for reducing a sequence of images down to a single image
+(a median, some percentiles), without ever holding the
+whole (ntimes x nrows x ncols) cube in memory at once. The image
+is split into spatial tiles small enough that a stack of every
+frame's pixels within one tile fits inside a memory budget; each
+tile is reduced on its own, and the results are stitched together.
+'''
+
+from ..imports import *
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ['tiled_reduce', 'define_tiles']
+
+# by default, use at most this many bytes for the stacks of tiles
+reductionbytes = 512 * 1024**2
+
+
+def define_tiles(N, shape, maxbytes=reductionbytes, itemsize=8):
+    '''
+    Split an image into tiles, each small enough that the
+    stack of N frames of that tile fits in a memory budget.
+
+    Tiles are whole rows wherever possible (since rows are
+    contiguous on disk), only splitting rows into columns
+    if even a single row of N frames won't fit.
+
+    Parameters
+    ----------
+    N : int
+        The number of frames that will be stacked.
+
+    shape : tuple
+        The (nrows, ncols) shape of each image.
+
+    maxbytes : int
+        The maximum number of bytes for the stack of one tile.
+
+    itemsize : int
+        The number of bytes per stacked pixel.
+
+    Returns
+    -------
+    tiles : list of (slice, slice)
+        The (rows, cols) slices for each tile.
+    '''
+    nrows, ncols = shape
+    perpixel = N * itemsize
+    if perpixel * ncols <= maxbytes:
+        rowspertile = int(np.clip(maxbytes // (perpixel * ncols), 1, nrows))
+        colspertile = ncols
+    else:
+        rowspertile = 1
+        colspertile = int(np.maximum(maxbytes // perpixel, 1))
+
+    tiles = []
+    for r in range(0, nrows, rowspertile):
+        for c in range(0, ncols, colspertile):
+            tiles.append((slice(r, np.minimum(r + rowspertile, nrows)),
+                          slice(c, np.minimum(c + colspertile, ncols))))
+    return tiles
+
+
+def _stack_tile(sequence, rows, cols, dtype=np.float64):
+    '''
+    Stack one tile from every frame of a sequence into a cube.
+    '''
+    N = sequence.N
+    cube = np.empty((N, rows.stop - rows.start, cols.stop - cols.start), dtype=dtype)
+    for i in range(N):
+        cube[i] = sequence.read_region(i, rows, cols)
+    return cube
+
+
+def _reduce_cube(cube, how, q=None):
+    '''
+    Reduce a cube along its first (time) axis.
+    '''
+    with warnings.catch_warnings():
+        # (all-NaN pixels are allowed, and should stay NaN)
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if how == 'median':
+            return np.nanmedian(cube, axis=0)
+        elif how == 'percentile':
+            return np.nanpercentile(cube, q, axis=0)
+        else:
+            raise ValueError('"{}" is not a tiled reduction'.format(how))
+
+
+def tiled_reduce(sequence, how='median', q=None, maxbytes=None, workers=1):
+    '''
+    Reduce a sequence of images into a single image,
+    one spatial tile at a time.
+
+    Parameters
+    ----------
+    sequence : Image_Sequence
+        The sequence to reduce. It must be able to read a tile
+        of one frame with `sequence.read_region(timestep, rows, cols)`.
+
+    how : str
+        What kind of reduction?
+            'median' = the per-pixel nanmedian
+            'percentile' = the per-pixel nanpercentile(s) `q`
+
+    q : float, list
+        The percentile(s) to calculate, for 'percentile'.
+
+    maxbytes : int, None
+        The memory budget (in bytes) for all the tile stacks
+        being worked on at once. If None, use the default.
+
+    workers : int
+        How many tiles should be reduced at once (in threads)?
+        The memory budget is split among them.
+
+    Returns
+    -------
+    image : array
+        The reduced image, with shape (nrows, ncols),
+        or (len(q), nrows, ncols) for a list of percentiles.
+    '''
+
+    N, nrows, ncols = sequence.shape
+
+    maxbytes = maxbytes or reductionbytes
+    workers = int(np.maximum(workers or 1, 1))
+    tiles = define_tiles(N, (nrows, ncols), maxbytes=maxbytes // workers)
+    sequence.speak('calculating {} of {} in {} tile(s) of up to {:.0f}MB'.format(
+                        how, sequence, len(tiles), maxbytes / workers / 1024**2))
+
+    outputshape = np.shape(q) + (nrows, ncols) if how == 'percentile' else (nrows, ncols)
+    result = np.empty(outputshape)
+
+    def process(tile):
+        rows, cols = tile
+        result[..., rows, cols] = _reduce_cube(_stack_tile(sequence, rows, cols), how, q=q)
+
+    if workers == 1:
+        for i, tile in enumerate(tiles):
+            sequence.speak(' reduced tile {}/{}'.format(i + 1, len(tiles)), progress=True)
+            process(tile)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(process, tiles))
+    return result
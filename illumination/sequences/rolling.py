@@ -0,0 +1,197 @@
+'''
+Tools for calculating a rolling (running) per-pixel background
+over a window of neighboring frames in time, like a median or
+mean of the frames within +/- k timesteps of each one.
+
+When moving through a sequence in order, the window slides by one
+frame at a time, so rather than recalculating from scratch, the
+window's state is updated: one frame leaves, one frame enters.
+    mean = a running sum and count of finite values for each pixel
+    median = a sorted stack of each pixel's values in the window,
+             where the leaving value is removed and the entering
+             value is inserted in place, costing O(window) per pixel
+             (instead of O(window * log(window)) for a new median)
+For medians, the frames themselves aren't kept: each value in the
+sorted stack is labeled with the slot (timestep % window) of the frame
+it came from, so the leaving frame's values can be found in the stack.
+'''
+
+from ..imports import *
+from collections import deque
+
+__all__ = ['RollingWindow']
+
+
+class RollingWindow(object):
+    '''
+    A per-pixel median or mean over a sliding window of frames.
+    '''
+
+    def __init__(self, read, N, halfwidth=5, how='median'):
+        '''
+        Set up a (not yet filled) rolling window.
+
+        Parameters
+        ----------
+        read : function
+            A function that takes a timestep and returns its image.
+
+        N : int
+            The number of timesteps in the sequence.
+
+        halfwidth : int
+            The window covers the frames within +/- halfwidth
+            of each timestep. (Near the start and end of the
+            sequence, the window is shifted to stay inside it.)
+
+        how : str
+            'median' or 'mean', ignoring non-finite values.
+        '''
+        if how not in ['median', 'mean']:
+            raise ValueError('"{}" is not a rolling background'.format(how))
+        self.read = read
+        self.N = N
+        self.halfwidth = halfwidth
+        self.width = int(np.minimum(2 * halfwidth + 1, N))
+        self.how = how
+
+        # which frames are in the window now? (only kept for means)
+        self.start = None
+        self.frames = deque()
+
+        # (for medians, the smallest integers that can label each frame's slot)
+        self._slottype = np.min_scalar_type(self.width)
+
+        # keep track of how much work has been done
+        self.reads = 0
+        self.rebuilds = 0
+
+    def __repr__(self):
+        return '<RollingWindow | {} of +/-{} frames | starting at {}>'.format(
+                    self.how, self.halfwidth, self.start)
+
+    def _first(self, timestep):
+        '''
+        The first timestep of the window around a timestep.
+        '''
+        return int(np.clip(timestep - self.halfwidth, 0, self.N - self.width))
+
+    def _load(self, timestep):
+        '''
+        Read one frame (as a flattened float64 array).
+        '''
+        self.reads += 1
+        image = np.asarray(self.read(timestep), dtype=np.float64)
+        self.shape = image.shape
+        return image.reshape(-1)
+
+    def _rebuild(self, start):
+        '''
+        Fill the window from scratch, starting from a timestep.
+        '''
+        self.rebuilds += 1
+        self.start = start
+        timesteps = np.arange(start, start + self.width)
+        stack = np.array([self._load(t) for t in timesteps])
+        if self.how == 'mean':
+            self.frames = deque(stack)
+            ok = np.isfinite(stack)
+            self.nfinite = np.sum(ok, axis=0)
+            self.total = np.sum(np.where(ok, stack, 0.0), axis=0)
+        else:
+            # (non-finite values are stored as +inf, so they sort to the end)
+            values = np.where(np.isfinite(stack), stack, np.inf)
+            order = np.argsort(values, axis=0, kind='stable')
+            self.sorted = np.take_along_axis(values, order, axis=0)
+            self.slots = (timesteps % self.width).astype(self._slottype)[order]
+            self.nfinite = np.sum(np.isfinite(stack), axis=0)
+
+    def _replace(self, leaving, entering):
+        '''
+        Swap one frame's values for another's in the window's state.
+
+        Parameters
+        ----------
+        leaving, entering : int
+            The timesteps leaving and entering the window
+            (which always share the same slot).
+        '''
+        image = self._load(entering)
+        if self.how == 'mean':
+            forward = entering > leaving
+            out = self.frames.popleft() if forward else self.frames.pop()
+            ok = np.isfinite(out)
+            self.total -= np.where(ok, out, 0.0)
+            self.nfinite -= ok.astype(int)
+            ok = np.isfinite(image)
+            self.total += np.where(ok, image, 0.0)
+            self.nfinite += ok.astype(int)
+            if forward:
+                self.frames.append(image)
+            else:
+                self.frames.appendleft(image)
+            return
+
+        # where is the leaving value, and where does the entering one belong?
+        s = self.sorted
+        columns = np.arange(s.shape[1])
+        slot = leaving % self.width
+        i = np.argmax(self.slots == slot, axis=0)
+        old = s[i, columns]
+        new = np.where(np.isfinite(image), image, np.inf)
+        self.nfinite += np.isfinite(new).astype(int) - np.isfinite(old).astype(int)
+        j = np.sum(s < new, axis=0) - (old < new)
+
+        # shift the values between those positions by one, and drop in the new one
+        r = np.arange(s.shape[0])[:, np.newaxis]
+        source = r + ((i <= r) & (r < j)) - ((j < r) & (r <= i))
+        self.sorted = np.take_along_axis(s, source, axis=0)
+        self.sorted[j, columns] = new
+        self.slots = np.take_along_axis(self.slots, source, axis=0)
+        self.slots[j, columns] = slot
+
+    def _slide(self, start):
+        '''
+        Move the window to start at a new timestep,
+        one frame at a time if that's cheaper than starting over.
+        '''
+        if (self.start is None) or (np.abs(start - self.start) >= self.width):
+            self._rebuild(start)
+            return
+        while self.start < start:
+            self._replace(self.start, self.start + self.width)
+            self.start += 1
+        while self.start > start:
+            self._replace(self.start + self.width - 1, self.start - 1)
+            self.start -= 1
+
+    def background(self, timestep):
+        '''
+        Calculate the background image for a timestep.
+
+        Parameters
+        ----------
+        timestep : int
+            The timestep (whose window should be used).
+
+        Returns
+        -------
+        background : 2D array
+            The per-pixel median or mean of the frames in the window
+            (NaN where none of them are finite).
+        '''
+        timestep = timestep % self.N
+        self._slide(self._first(timestep))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if self.how == 'mean':
+                result = self.total / self.nfinite
+            else:
+                # the median of the finite values, which sort before the +infs
+                columns = np.arange(self.sorted.shape[1])
+                n = self.nfinite
+                lower = self.sorted[np.maximum((n - 1) // 2, 0), columns]
+                upper = self.sorted[np.maximum(n // 2, 0), columns]
+                result = 0.5 * (lower + upper)
+        result = np.where(self.nfinite > 0, result, np.nan)
+        return result.reshape(self.shape)
@@ -1,6 +1,7 @@
 from .imports import *
+import io
 
-def get_writer(filename, fps=30, **kw):
+def get_writer(filename, fps=30, variable=False, **kw):
     '''
     Try to get an appropriate animation writer,
     given the filename provided.
@@ -14,6 +15,10 @@ def get_writer(filename, fps=30, **kw):
     fps : float
         Frames/second.
 
+    variable : bool
+        Should (non-movie) frames be able to last for more
+        than one step (see `VariablePillowWriter`)?
+
     kw : dict
         All other keywords will be passed to the initialization
         of the animation writer.
@@ -26,7 +31,10 @@ def get_writer(filename, fps=30, **kw):
             raise RuntimeError('This computer seems unable to ffmpeg.')
     else:
         try:
-            writer = ani.writers['pillow'](fps=fps, **kw)
+            if variable:
+                writer = VariablePillowWriter(fps=fps, **kw)
+            else:
+                writer = ani.writers['pillow'](fps=fps, **kw)
         except (RuntimeError, KeyError):
             writer = ani.writers['imagemagick'](fps=fps, **kw)
             raise RuntimeError('This computer seem unable to animate?')
@@ -73,3 +81,350 @@ def guess_time_format(t, default='jd'):
             return k
 
     return default
+
+
+def nearest_sorted(sortedvalues, values):
+    '''
+    Find the index of the closest element of a sorted array
+    to each of some values (in O(log N) per value).
+
+    Parameters
+    ----------
+    sortedvalues : array
+            An array of values, sorted in increasing order.
+
+    values : array, float
+            The value(s) to look up.
+
+    Returns
+    -------
+    indices : array, int
+            The index into `sortedvalues` of the closest element
+            to each value (ties go to the earlier element).
+    '''
+    n = len(sortedvalues)
+    right = np.clip(np.searchsorted(sortedvalues, values), 0, n - 1)
+    left = np.clip(right - 1, 0, n - 1)
+    closer = np.abs(values - sortedvalues[left]) <= np.abs(sortedvalues[right] - values)
+    return np.where(closer, left, right)
+
+
+def compose_recipe(recipe):
+    '''
+    Reduce a sequence of (transpose, flipy, flipx) steps to the
+    single step that does the same thing, so an image only needs
+    to be sliced (and copied) once, however many steps there are.
+
+    Parameters
+    ----------
+    recipe : list of (bool, bool, bool)
+            The (transpose, flipy, flipx) steps, in the order applied.
+
+    Returns
+    -------
+    composed : list of (bool, bool, bool)
+            One equivalent step (or none, if the steps cancel out).
+    '''
+    composed = (False, False, False)
+    for transpose, flipy, flipx in recipe:
+        t, y, x = composed
+        if transpose:
+            # a transpose turns earlier flips of rows into flips of columns
+            t, y, x = not t, x, y
+        composed = (t, y != bool(flipy), x != bool(flipx))
+    if any(composed):
+        return [composed]
+    return []
+
+
+def transform_image(image, recipe):
+    '''
+    Apply a sequence of (transpose, flipy, flipx) steps to an image,
+    in the same way as the Camera/CCD frames' `_transformimage`.
+
+    Parameters
+    ----------
+    image : 2D array
+            The image to transform.
+
+    recipe : list of (bool, bool, bool)
+            The (transpose, flipy, flipx) steps, in the order applied.
+
+    Returns
+    -------
+    transformed : 2D array
+            The transformed image (a view, not a copy).
+    '''
+    for transpose, flipy, flipx in compose_recipe(recipe):
+        if transpose:
+            image = image.T
+        if flipy:
+            image = image[::-1, :]
+        if flipx:
+            image = image[:, ::-1]
+    return image
+
+
+def untransform_region(rows, cols, shape, recipe):
+    '''
+    Find the region of an original image that ends up
+    in a given region of its transformed image.
+
+    Because every step of the transformation is a transpose
+    or a flip, any rectangle in the transformed image comes from
+    a rectangle in the original, and transforming just that
+    rectangle (with the same recipe) gives the same pixels.
+
+    Parameters
+    ----------
+    rows, cols : slice
+            The region of the transformed image.
+
+    shape : tuple
+            The (nrows, ncols) shape of the original image.
+
+    recipe : list of (bool, bool, bool)
+            The (transpose, flipy, flipx) steps, in the order applied.
+
+    Returns
+    -------
+    rows, cols : slice
+            The region of the original image.
+    '''
+
+    # keep track of the shape before each step
+    shapes = []
+    for transpose, flipy, flipx in recipe:
+        shapes.append(shape)
+        if transpose:
+            shape = shape[::-1]
+
+    # work backward from the transformed region
+    (r0, r1, _), (c0, c1, _) = rows.indices(shape[0]), cols.indices(shape[1])
+    for (transpose, flipy, flipx), before in zip(recipe[::-1], shapes[::-1]):
+        nrows, ncols = before[::-1] if transpose else before
+        if flipx:
+            c0, c1 = ncols - c1, ncols - c0
+        if flipy:
+            r0, r1 = nrows - r1, nrows - r0
+        if transpose:
+            (r0, r1), (c0, c1) = (c0, c1), (r0, r1)
+    return slice(r0, r1), slice(c0, c1)
+
+
+def block_reduce(image, factor, how='mean'):
+    '''
+    Reduce the resolution of an image, by combining
+    each (factor x factor) block of pixels into one.
+
+    Non-finite pixels are ignored (a block is only NaN if all
+    of its pixels are). If the image isn't a whole number of
+    blocks across, the leftover rows and columns at the edges
+    become partial blocks, rather than being trimmed off.
+
+    Parameters
+    ----------
+    image : 2D array
+            The image to reduce.
+
+    factor : int
+            How many pixels across should each block be?
+
+    how : str
+            'mean' or 'max', to combine the pixels of each block.
+
+    Returns
+    -------
+    reduced : 2D array
+            The (ceil(nrows/factor), ceil(ncols/factor)) reduced image.
+    '''
+    if how not in ['mean', 'max']:
+        raise ValueError('"{}" is not a way to reduce blocks'.format(how))
+    image = np.asarray(image)
+    if image.dtype.kind != 'f':
+        image = image.astype(np.float32)
+    if factor <= 1:
+        return image
+
+    # pad the edges with NaN out to a whole number of blocks
+    nrows, ncols = [-(-n // factor) for n in image.shape]
+    padding = [(0, nrows * factor - image.shape[0]), (0, ncols * factor - image.shape[1])]
+    if np.any(padding):
+        image = np.pad(image, padding, constant_values=np.nan)
+    blocks = image.reshape(nrows, factor, ncols, factor)
+
+    if how == 'max':
+        return np.fmax.reduce(np.fmax.reduce(blocks, axis=3), axis=1)
+    finite = np.isfinite(blocks)
+    total = np.where(finite, blocks, 0).sum(axis=(1, 3), dtype=np.float64)
+    count = finite.sum(axis=(1, 3))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (total / count).astype(image.dtype)
+
+
+class VariablePillowWriter(ani.PillowWriter):
+    '''
+    A Pillow writer (for GIFs) that can hold a frame on screen
+    for more than one step of an animation (see `repeat_frame`),
+    rather than storing identical frames again and again.
+    '''
+
+    def setup(self, fig, outfile, dpi=None):
+        super().setup(fig, outfile, dpi=dpi)
+        # how many steps each frame lasts (if more than one)
+        self._holds = {}
+
+    def finish(self):
+        if not can_push_frames(self):
+            # (if PillowWriter no longer keeps its frames in a list, hold nothing)
+            return super().finish()
+        durations = [int(1000 * self._holds.get(i, 1) / self.fps) for i in range(len(self._frames))]
+        self._frames[0].save(self.outfile, save_all=True, append_images=self._frames[1:],
+                             duration=durations, loop=0)
+
+
+def render_frame(writer):
+    '''
+    Render a writer's figure exactly as `writer.grab_frame()`
+    would, but return the image rather than saving it.
+
+    Parameters
+    ----------
+    writer : matplotlib.animation.AbstractMovieWriter
+            An animation writer, in the middle of `writer.saving()`.
+
+    Returns
+    -------
+    rgba : array
+            An (nrows, ncols, 4) array of uint8 RGBA pixels.
+    '''
+    buffer = io.BytesIO()
+    writer.fig.savefig(buffer, format='rgba', dpi=writer.dpi)
+    width, height = writer.frame_size
+    return np.frombuffer(buffer.getbuffer(), dtype=np.uint8).reshape(height, width, 4)
+
+
+def repeat_frame(writer, rgba):
+    '''
+    Show the last frame of an animation for one more step.
+
+    GIFs hold their last frame for longer (without storing it
+    again); other writers are sent the same image again.
+
+    Parameters
+    ----------
+    writer : matplotlib.animation.AbstractMovieWriter
+            An animation writer, in the middle of `writer.saving()`.
+
+    rgba : array
+            The last frame's (nrows, ncols, 4) uint8 RGBA pixels.
+    '''
+    if isinstance(writer, VariablePillowWriter) and can_push_frames(writer) and len(writer._frames) > 0:
+        last = len(writer._frames) - 1
+        writer._holds[last] = writer._holds.get(last, 1) + 1
+    else:
+        push_frame(writer, rgba)
+
+
+def can_push_frames(writer):
+    '''
+    Can already-rendered images be handed straight to this
+    animation writer (see `push_frame`)?
+
+    Pushing frames relies on where matplotlib's writers keep
+    them (a Pillow writer's list of frames, or the pipe to a
+    movie writer's process), which isn't part of its public
+    API, so this checks that those are really there. If not,
+    frames should be added with `writer.grab_frame()` instead.
+
+    Parameters
+    ----------
+    writer : matplotlib.animation.AbstractMovieWriter
+            An animation writer, in the middle of `writer.saving()`.
+
+    Returns
+    -------
+    ok : bool
+            True for the Pillow writer, and for piped
+            movie writers (like ffmpeg) that take raw RGBA.
+    '''
+    if isinstance(writer, ani.PillowWriter):
+        return isinstance(getattr(writer, '_frames', None), list)
+    return (isinstance(writer, ani.MovieWriter)
+            and not isinstance(writer, ani.FileMovieWriter)
+            and writer.frame_format == 'rgba'
+            and hasattr(getattr(writer, '_proc', None), 'stdin'))
+
+
+def push_frame(writer, rgba):
+    '''
+    Hand an already-rendered image to an animation writer, as
+    if `writer.grab_frame()` had been called, but without
+    asking matplotlib to redraw (and re-encode) the whole figure.
+
+    Parameters
+    ----------
+    writer : matplotlib.animation.AbstractMovieWriter
+            An animation writer, in the middle of `writer.saving()`.
+
+    rgba : array
+            An (nrows, ncols, 4) array of uint8 RGBA pixels, with
+            the same size as the writer's frames.
+    '''
+    rgba = np.ascontiguousarray(rgba, dtype=np.uint8)
+    height, width = rgba.shape[:2]
+    if (width, height) != tuple(writer.frame_size):
+        raise ValueError('{}x{} images cannot be added to a {}x{} animation'.format(
+                            width, height, *writer.frame_size))
+
+    if not can_push_frames(writer):
+        raise RuntimeError('Sorry! Images cannot be pushed to {}.'.format(writer))
+
+    if isinstance(writer, ani.PillowWriter):
+        from PIL import Image
+        im = Image.frombuffer('RGBA', (width, height), rgba.tobytes(), 'raw', 'RGBA', 0, 1)
+        # (as in PillowWriter, use RGB unless there's transparency)
+        writer._frames.append(im if im.getextrema()[3][0] < 255 else im.convert('RGB'))
+    else:
+        writer._proc.stdin.write(rgba.tobytes())
+
+
+def concatenate_animations(filenames, output, fps=30):
+    '''
+    Join animations (rendered separately, with the same
+    size and settings) one after another into a single file.
+
+    Parameters
+    ----------
+    filenames : list
+            The animations to join, in order.
+
+    output : str
+            Where to save the joined animation.
+
+    fps : float
+            Frames/second (for frames that don't say how long they last).
+    '''
+    if '.mp4' in output:
+        # (use ffmpeg's concat demuxer, copying the encoded streams as they are)
+        listfilename = output + '.segments.txt'
+        with open(listfilename, 'w') as f:
+            for filename in filenames:
+                f.write("file '{}'\n".format(os.path.abspath(filename).replace("'", "'\\''")))
+        try:
+            subprocess.run([plt.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+                            '-f', 'concat', '-safe', '0', '-i', listfilename,
+                            '-c', 'copy', output], check=True)
+        finally:
+            os.remove(listfilename)
+    else:
+        from PIL import Image, ImageSequence
+        # (keep how long each frame lasts, since deduplicated frames can be held longer)
+        frames, durations = [], []
+        for filename in filenames:
+            with Image.open(filename) as im:
+                for f in ImageSequence.Iterator(im):
+                    frames.append(f.copy())
+                    durations.append(f.info.get('duration', int(1000 / fps)))
+        frames[0].save(output, save_all=True, append_images=frames[1:],
+                       duration=durations, loop=0)
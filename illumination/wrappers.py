@@ -29,7 +29,7 @@ def camera_from_filename(f):
 def organize_sequences(pattern='*.fits',
                        filenameparser=flexible_filenameparser,
                        ext_image=1, use_headers=False, use_filenames=True,
-                       timekey='cadence'):
+                       timekey='cadence', index=None):
     '''
     Take a group of filenames, and group them in
     one of the following ways:
@@ -54,6 +54,11 @@ def organize_sequences(pattern='*.fits',
         It is used to decide how to group images.
 
      ext_image=0, use_headers=False, use_filenames=True,
+
+    index : SequenceIndex, str, bool, None
+        Should what we learn from the files be kept in an on-disk
+        index (see FITS_Sequence), so reorganizing the same files
+        doesn't require reparsing and rescanning them all?
     '''
     # create a list of filenames
     if type(pattern) == list:
@@ -63,16 +68,25 @@ def organize_sequences(pattern='*.fits',
         # if given a string, use it as a glob search string
         filenames = list(np.sort(glob.glob(pattern)))
 
+    # set up one index to share among all the sequences
+    if index is True:
+        index = SequenceIndex(default_index_path(filenames))
+    elif isinstance(index, str):
+        index = SequenceIndex(index)
+
+    # parse the filenames into dictionaries
+    if index:
+        parsed = index.filename_values(filenames, filenameparser)
+    else:
+        parsed = [filenameparser(f) for f in filenames]
+
     # create an empty dictionary of cameras + CCDs
     cameras = {'cam{}'.format(c):{
                     'ccd{}'.format(d):[] for d in [1,2,3,4,'?']}
                for c in [1,2,3,4,'?']}
 
     # loop through images, and figure out where they belong
-    for f in filenames:
-
-        # parse the filename into a dictionary
-        i = filenameparser(f)
+    for f, i in zip(filenames, parsed):
 
         # figure out an appropriate camera key
         if 'camera' in i:
@@ -100,7 +114,9 @@ def organize_sequences(pattern='*.fits',
                                                    ext_image=ext_image,
                                                    use_headers=use_headers,
                                                    use_filenames=use_filenames,
-                                                   timekey=timekey)
+                                                   filenameparser=filenameparser,
+                                                   timekey=timekey,
+                                                   index=index)
 
 
     # if there aren't multiple CCDs, compress each camera to single list
@@ -2,6 +2,7 @@ from illumination.imports import *
 from illumination.illustrations import *
 from illumination.cartoons import *
 from illumination.zoom import *
+import time as clock
 
 
 directory = "examples/"
@@ -19,6 +20,214 @@ def test_CameraIllustration(N=3, **kw):
     print("Take a look at {} and see what you think!".format(filename))
 
 
+def test_CameraIllustrationPrefetch(N=5):
+    print("\nTesting a Single Camera illustration, prefetching images.")
+    filenames = []
+    for i in range(N):
+        filename = os.path.join(directory, "temporaryprefetch-camera{}.fits".format(i))
+        create_test_fits(rows=300, cols=300).writeto(filename, overwrite=True)
+        filenames.append(filename)
+    illustration = CameraIllustration(data=filenames, ext_image=1)
+    illustration.plot()
+    filename = os.path.join(directory, "single-camera-prefetch-animation.mp4")
+    illustration.animate(filename, prefetch=4)
+    print(illustration.prefetchstatistics)
+    assert len(illustration.prefetchstatistics) == 1
+
+
+def test_CameraIllustrationBlit(N=4):
+    print("\nTesting a Single Camera illustration, blitting changing artists.")
+    from PIL import Image, ImageSequence
+
+    data = [create_test_fits(rows=100, cols=100) for _ in range(N)]
+    frames, speed = {}, {}
+    for blit in [False, True]:
+        illustration = CameraIllustration(data=data, ext_image=1)
+        illustration.plot()
+        filename = os.path.join(directory, "single-camera-blit={}.gif".format(blit))
+        start = clock.time()
+        illustration.animate(filename, fps=5, dpi=50, blit=blit)
+        speed[blit] = clock.time() - start
+        with Image.open(filename) as im:
+            frames[blit] = [np.asarray(f.convert("RGB")) for f in ImageSequence.Iterator(im)]
+        plt.close("all")
+
+    print("redrawing took {:.2f}s, blitting took {:.2f}s".format(speed[False], speed[True]))
+    assert len(frames[True]) == len(frames[False])
+    for a, b in zip(frames[True], frames[False]):
+        assert a.shape == b.shape
+        assert np.mean(np.all(a == b, axis=-1)) > 0.99
+
+
+def test_CameraIllustrationRaster(N=4):
+    print("\nTesting a Single Camera illustration, rendered without matplotlib.")
+    from PIL import Image, ImageSequence
+
+    data = [create_test_fits(rows=300, cols=300) for _ in range(N)]
+    frames, speed = {}, {}
+    for renderer in ["matplotlib", "raster"]:
+        illustration = CameraIllustration(data=data, ext_image=1)
+        illustration.plot()
+        filename = os.path.join(directory, "single-camera-{}.gif".format(renderer))
+        start = clock.time()
+        illustration.animate(filename, fps=5, dpi=50, renderer=renderer)
+        speed[renderer] = clock.time() - start
+        with Image.open(filename) as im:
+            frames[renderer] = [np.asarray(f.convert("RGB")).astype(int) for f in ImageSequence.Iterator(im)]
+        plt.close("all")
+
+    print("matplotlib took {matplotlib:.2f}s, rasterizing took {raster:.2f}s".format(**speed))
+    assert len(frames["raster"]) == len(frames["matplotlib"])
+    for a, b in zip(frames["raster"], frames["matplotlib"]):
+        assert a.shape == b.shape
+        assert np.mean(np.all(np.abs(a - b) <= 8, axis=-1)) > 0.98
+
+
+def test_CameraIllustrationWorkers(N=6):
+    print("\nTesting a Single Camera illustration, rendered in segments by worker processes.")
+    from PIL import Image, ImageSequence
+
+    data = [create_test_fits(rows=100, cols=100) for _ in range(N)]
+    frames = {}
+    for workers in [None, 3]:
+        illustration = CameraIllustration(data=data, ext_image=1)
+        illustration.plot()
+        filename = os.path.join(directory, "single-camera-workers={}.gif".format(workers))
+        illustration.animate(filename, fps=5, dpi=50, workers=workers)
+        with Image.open(filename) as im:
+            frames[workers] = [np.asarray(f.convert("RGB")).astype(int) for f in ImageSequence.Iterator(im)]
+        plt.close("all")
+
+    assert len(frames[3]) == len(frames[None])
+    for a, b in zip(frames[3], frames[None]):
+        assert np.mean(np.all(np.abs(a - b) <= 8, axis=-1)) > 0.98
+
+    # the same, joining the segments of a movie without re-encoding them
+    illustration = CameraIllustration(data=data, ext_image=1)
+    illustration.plot()
+    filename = os.path.join(directory, "single-camera-workers.mp4")
+    illustration.animate(filename, workers=2)
+    assert os.path.exists(filename)
+
+    # (workers report progress at every step, however the steps are rendered)
+    timeline = illustration.timeline
+    for options in [dict(), dict(deduplicate=True), dict(blit=True), dict(renderer="raster")]:
+        steps = []
+        filename = os.path.join(directory, "single-camera-progress.gif")
+        illustration._render(filename, timeline, fps=5, dpi=50, progress=steps.append, **options)
+        assert steps == list(range(1, len(timeline) + 1)), options
+
+
+def test_CameraIllustrationDeduplicate(N=3):
+    print("\nTesting a Single Camera illustration, animated at a finer cadence than its data.")
+    from PIL import Image, ImageSequence
+
+    data = [create_test_fits(rows=100, cols=100) for _ in range(N)]
+    frames, durations, speed = {}, {}, {}
+    for deduplicate in [False, True]:
+        illustration = CameraIllustration(data=data, ext_image=1)
+        illustration.plot()
+        filename = os.path.join(directory, "single-camera-deduplicate={}.gif".format(deduplicate))
+        start = clock.time()
+        illustration.animate(filename, fps=10, dpi=50, cadence=0.1 * u.s, deduplicate=deduplicate)
+        speed[deduplicate] = clock.time() - start
+        with Image.open(filename) as im:
+            frames[deduplicate] = [np.asarray(f.convert("RGB")) for f in ImageSequence.Iterator(im)]
+            durations[deduplicate] = [f.info["duration"] for f in ImageSequence.Iterator(im)]
+        plt.close("all")
+
+    print("redrawing every step took {:.2f}s, deduplicating took {:.2f}s".format(speed[False], speed[True]))
+    print("frame durations are {}".format(durations[True]))
+    assert len(frames[True]) == N
+    assert sum(durations[True]) == sum(durations[False])
+
+    # segments rendered by workers keep their frames' durations when they're joined
+    illustration = CameraIllustration(data=data, ext_image=1)
+    illustration.plot()
+    filename = os.path.join(directory, "single-camera-deduplicate-workers.gif")
+    illustration.animate(filename, fps=10, dpi=50, cadence=0.1 * u.s, deduplicate=True, workers=2)
+    with Image.open(filename) as im:
+        joined = [f.info["duration"] for f in ImageSequence.Iterator(im)]
+    plt.close("all")
+    print("joined frame durations are {}".format(joined))
+    assert sum(joined) == sum(durations[True])
+
+    # (only deduplicating animations need a writer that can hold frames)
+    from illumination.utilities import get_writer, VariablePillowWriter
+    assert not isinstance(get_writer("example.gif"), VariablePillowWriter)
+    assert isinstance(get_writer("example.gif", variable=True), VariablePillowWriter)
+
+
+def test_CameraIllustrationFallback(monkeypatch, N=3):
+    print("\nTesting that animations fall back to grab_frame, for writers whose internals differ.")
+    from PIL import Image, ImageSequence
+    import sys
+    from illumination.utilities import VariablePillowWriter, can_push_frames, push_frame, repeat_frame, render_frame
+
+    class RenamedPillowWriter(VariablePillowWriter):
+        """
+        A Pillow writer that keeps its frames somewhere other than `_frames`
+        (as a future version of matplotlib might).
+        """
+
+        def setup(self, fig, outfile, dpi=None):
+            super().setup(fig, outfile, dpi=dpi)
+            self._images = self.__dict__.pop("_frames")
+
+        def grab_frame(self, **savefig_kwargs):
+            rgba = render_frame(self)
+            self._images.append(Image.fromarray(rgba).convert("RGB"))
+
+        def finish(self):
+            self._images[0].save(self.outfile, save_all=True, append_images=self._images[1:],
+                                 duration=int(1000 / self.fps), loop=0)
+
+    base = sys.modules["illumination.illustrations.IllustrationBase"]
+    monkeypatch.setattr(base, "get_writer", lambda filename, fps=30, **kw: RenamedPillowWriter(fps=fps))
+    data = [create_test_fits(rows=100, cols=100) for _ in range(N)]
+    illustration = CameraIllustration(data=data, ext_image=1)
+    illustration.plot()
+    filename = os.path.join(directory, "single-camera-fallback.gif")
+    for options in [dict(), dict(deduplicate=True), dict(blit=True), dict(renderer="raster")]:
+        illustration.animate(filename, fps=5, dpi=50, **options)
+        with Image.open(filename) as im:
+            assert im.n_frames == len(illustration.timeline), options
+    plt.close("all")
+
+    # (and frames can't be pushed to them, or held on screen)
+    writer = RenamedPillowWriter(fps=5)
+    with writer.saving(plt.figure(), filename, 50):
+        assert not can_push_frames(writer)
+        rgba = np.zeros(writer.frame_size[::-1] + (4,), dtype=np.uint8)
+        for add in [push_frame, repeat_frame]:
+            try:
+                add(writer, rgba)
+                assert False
+            except RuntimeError:
+                pass
+        assert writer._holds == {}
+        writer.grab_frame()
+    plt.close("all")
+
+
+def test_Timeline(N=4, nsteps=100000):
+    print("\nTesting the precomputed animation timeline.")
+    illustration = CameraIllustration(
+        data=[create_test_fits(rows=30, cols=30) for _ in range(N)], ext_image=1
+    )
+    gps = illustration._get_times().gps
+    steps = np.linspace(np.min(gps), np.max(gps), nsteps)
+
+    start = clock.time()
+    timeline = Timeline(illustration.frames, steps)
+    print("built {} in {:.3f}s".format(timeline, clock.time() - start))
+
+    assert timeline.timesteps.shape == (nsteps, len(illustration.frames))
+    assert np.sum(timeline.changed) == N
+    assert timeline.timestep(0, timeline.names[0]) == 0
+    assert timeline.timestep(nsteps - 1, timeline.names[0]) == N - 1
+
+
 def test_FourCameraIllustration():
     print("\nTesting the Four Camera illustration.")
     data = {
@@ -0,0 +1,115 @@
+from illumination.imports import *
+from illumination.colors import *
+from illumination.illustrations import *
+from illumination.cartoons import *
+import time as clock
+
+
+def test_sampled_color_scale(size=2000, maxsamples=100000):
+    print("\nTesting color scales estimated from samples of the pixels.")
+    image = np.random.lognormal(3, 1, (size, size))
+    image[:10] = np.nan
+
+    start = clock.time()
+    cmap, exact, ticks = cmap_norm_ticks(image, maxsamples=None)
+    slow = clock.time() - start
+    start = clock.time()
+    cmap, sampled, ticks = cmap_norm_ticks(image, maxsamples=maxsamples)
+    fast = clock.time() - start
+    print("exact took {:.3f}s, sampled took {:.3f}s".format(slow, fast))
+    print("vmin={:.3f} vs {:.3f}, vmax={:.3f} vs {:.3f}".format(exact.vmin, sampled.vmin, exact.vmax, sampled.vmax))
+    assert np.isclose(sampled.vmin, exact.vmin, rtol=0.05)
+    assert np.isclose(sampled.vmax, exact.vmax, rtol=0.05)
+
+    # the same seed always picks the same pixels
+    assert np.array_equal(sample_pixels(image, 1000, seed=42), sample_pixels(image, 1000, seed=42), equal_nan=True)
+
+    # combining samples weights each array by its size
+    small, big = np.zeros(100), np.ones(10000)
+    combined = combine_samples([sample_pixels(small, 1000), sample_pixels(big, 1000)],
+                               [small.size, big.size], maxsamples=1000)
+    assert np.isclose(np.mean(combined), big.size / (small.size + big.size), atol=0.02)
+
+
+def test_shared_color_samples(N=3):
+    print("\nTesting that shared color scales reuse their samples.")
+    data = [create_test_fits(rows=300, cols=300) for _ in range(N)]
+    illustration = CameraIllustration(data=data, ext_image=1)
+    illustration.plot()
+    frame = illustration.frames["camera"]
+    samples = colorsamples[frame.data]
+    print(samples.keys())
+    assert len(samples) == 1
+
+    # replotting shouldn't sample again
+    before = list(samples.values())[0][0]
+    illustration._cmap_norm_ticks(remake=True)
+    assert list(samples.values())[0][0] is before
+
+    # frames that process the same data differently get their own samples
+    from illumination.frames import imshowFrame
+    from illumination.sequences import Clip
+    images = np.random.uniform(0, 100, (N, 20, 20))
+    low = imshowFrame(data=images, processingsteps=[Clip(0, 10)])
+    high = imshowFrame(data=images, processingsteps=[Clip(0, 90)], sharecolorsamples=True)
+    high.data = low.data
+    assert np.max(low._get_color_sample()[0]) <= 10
+    assert np.max(high._get_color_sample()[0]) > 10
+
+
+def test_quantized_cube(N=4):
+    print("\nTesting images quantized into color indices.")
+    directory = "examples/"
+    mkdir(directory)
+    filenames = []
+    for i in range(N):
+        filename = os.path.join(directory, "temporaryquantized{}.fits".format(i))
+        create_test_fits(rows=200, cols=200).writeto(filename, overwrite=True)
+        filenames.append(filename)
+    cubefilename = os.path.join(directory, "quantized.npy")
+    for f in [cubefilename, cubefilename + ".json"]:
+        if os.path.exists(f):
+            os.remove(f)
+
+    for attempt in ["first", "again"]:
+        illustration = CameraIllustration(data=filenames, ext_image=1)
+        illustration.plot()
+        frame = illustration.frames["camera"]
+
+        # count how many images have to be read and processed
+        reads = []
+        get = frame._get_display_image
+        frame._get_display_image = lambda *args, **kw: reads.append(1) or get(*args, **kw)
+        cube = frame.quantize("uint8", filename=cubefilename)
+        print("quantizing the {} time needed {} reads for {}".format(attempt, len(reads), cube))
+        assert cube.complete
+        assert len(reads) == (N if attempt == "first" else 0)
+
+        # updating draws from the cube, and looks like the original images
+        for timestep in range(N):
+            frame.update(None, timestep=timestep)
+            original = get(timestep=timestep)[0]
+            norm = frame.plotted["norm"]
+            shown = frame.plotted["image"].get_array()
+            ok = np.isfinite(norm(original)) & (norm(original) >= 0) & (norm(original) <= 1)
+            assert np.all(np.abs(norm(shown) - norm(original))[ok] <= 1.0 / cube.levels)
+        assert len(reads) == (N if attempt == "first" else 0)
+        print("the cube takes {} bytes, vs {} as float64".format(cube.cube.nbytes, np.size(cube.cube) * 8))
+
+        # the raster renderer colors the indices directly
+        illustration.animate(os.path.join(directory, "quantized.gif"), fps=5, dpi=50, renderer="raster")
+        plt.close("all")
+
+    # a cube made with differently processed images isn't reused
+    from illumination.sequences import Clip
+    for lower, expected in [(0, N), (0, 0), (1, N)]:
+        illustration = CameraIllustration(data=filenames, ext_image=1)
+        illustration.plot()
+        frame = illustration.frames["camera"]
+        frame.processingsteps = [Clip(lower, None)]
+        reads = []
+        get = frame._get_display_image
+        frame._get_display_image = lambda *args, **kw: reads.append(1) or get(*args, **kw)
+        frame.quantize("uint8", filename=cubefilename)
+        assert len(reads) == expected
+        plt.close("all")
@@ -8,3 +8,62 @@ def test_timeseries():
     y = np.random.normal(0, 1, len(x))
     f = EmptyTimeseriesFrame(ax=plt.gca())
     f.ax.plot(x, y)
+
+
+def test_block_reduce():
+    from illumination.utilities import block_reduce
+
+    image = np.arange(35, dtype=float).reshape(5, 7)
+    image[0, 0] = np.nan
+    reduced = block_reduce(image, 2)
+    print(reduced)
+    assert reduced.shape == (3, 4)
+    assert reduced[0, 0] == np.mean([1, 7, 8])
+    assert reduced[2, 3] == image[4, 6]
+    assert block_reduce(image, 2, how="max")[0, 0] == 8
+
+    # (a block with nothing finite in it stays NaN)
+    image[:2, :2] = np.nan
+    assert np.isnan(block_reduce(image, 2)[0, 0])
+
+
+def test_downsampled_display(N=3):
+    print("\nTesting that big images are drawn at about the screen's resolution.")
+    import time as clock
+    from illumination.illustrations import CameraIllustration
+
+    data = [create_test_fits(rows=1200, cols=1300) for _ in range(N)]
+    speed = {}
+    for downsample in [None, "auto"]:
+        illustration = CameraIllustration(data=data, ext_image=1, downsample=downsample)
+        illustration.plot()
+        frame = illustration.frames["camera"]
+        start = clock.time()
+        for timestep in range(N):
+            frame.update(None, timestep=timestep)
+            illustration.figure.canvas.draw()
+        speed[downsample] = (clock.time() - start) / N
+        shown = frame.plotted["image"].get_array().shape
+        print("with downsample={}, {} is drawn as {}".format(downsample, data[0][1].shape, shown))
+        plt.close("all")
+
+    print("drawing took {:.3f}s/frame at full resolution, {:.3f}s/frame reduced".format(
+        speed[None], speed["auto"]))
+    assert frame.displayfactor > 1
+    assert shown == tuple(-(-n // frame.displayfactor) for n in data[0][1].shape)
+    assert frame.plotted["image"].get_extent()[1] >= 1300
+    assert frame._reduced.statistics()["misses"] >= N - 1
+
+    # (partial blocks at the edges are clipped to the image itself)
+    clip = frame.plotted["image"].get_clip_path()
+    corners = frame.ax.transData.inverted().transform(clip.get_fully_transformed_path().get_extents())
+    assert np.allclose(corners, [[0, 0], [1300, 1200]])
+
+    # by default, every pixel is drawn where it always was
+    illustration = CameraIllustration(data=data, ext_image=1)
+    illustration.plot()
+    frame = illustration.frames["camera"]
+    assert frame.displayfactor == 1
+    assert frame.plotted["image"].get_array().shape == data[0][1].shape
+    assert tuple(frame.plotted["image"].get_extent()) == (0, 1300, 0, 1200)
+    plt.close("all")
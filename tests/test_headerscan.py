@@ -0,0 +1,168 @@
+from illumination.imports import *
+from illumination.sequences import *
+from illumination.sequences.fitsreader import read_fits_header_values, read_fits_headers
+from illumination.cartoons import *
+import time as clock
+import pytest
+
+directory = "examples/"
+mkdir(directory)
+
+headerdirectory = os.path.join(directory, "headers")
+mkdir(headerdirectory)
+
+
+def create_timed_files(N=64, rows=200, cols=200, directory=headerdirectory):
+    """
+    Create a little ensemble of files with times in their headers.
+
+    This is a helper for the tests below.
+    """
+    filenames = []
+    for i in range(N):
+        filename = os.path.join(str(directory), "timed-{:05}.fits".format(i))
+        if not os.path.exists(filename):
+            hdulist = create_test_fits(rows=rows, cols=cols)
+            hdulist[0].header["TIME"] = 2458000.5 - i * 0.02
+            hdulist[1].header["QUAL_BIT"] = i % 3
+            hdulist.writeto(filename, overwrite=True)
+        filenames.append(filename)
+    return filenames
+
+
+def test_scan_headers():
+    """
+    Make sure parallel header scans match serial ones, in file order.
+    """
+    filenames = create_timed_files()
+    serial = scan_headers(filenames, extensions=[0, 1], workers=1)
+    for pool in ["thread", "process"]:
+        parallel = scan_headers(filenames, extensions=[0, 1], workers=4, pool=pool)
+        assert [p["TIME"] for p in parallel] == [s["TIME"] for s in serial]
+
+    # the sequence should sort itself by time
+    s = FITS_Sequence(filenames, ext_image=1, headerworkers=4, header_keys=["QUAL_BIT"])
+    assert np.all(np.diff(s.time.gps) > 0)
+    assert s.filenames[0] == filenames[-1]
+    assert "QUAL_BIT" in s.temporal
+
+
+def test_missing_end(tmp_path):
+    """
+    Make sure headers without an END card can still be read (as astropy can).
+    """
+    filenames = []
+    for i, end in enumerate([True, False, True]):
+        filename = os.path.join(str(tmp_path), "header-{}.fits".format(i))
+        hdu = fits.PrimaryHDU()
+        hdu.header["TIME"] = 2458000.5 + i
+        hdu.writeto(filename)
+        if not end:
+            contents = bytearray(open(filename, "rb").read())
+            i = contents.find(b"END" + b" " * 77)
+            contents[i : i + 80] = b" " * 80
+            open(filename, "wb").write(contents)
+        filenames.append(filename)
+
+    # one bad file shouldn't spoil the whole scan
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        values = scan_headers(filenames, extensions=[0], keys=["TIME"])
+        assert [v["TIME"] for v in values] == [2458000.5, 2458001.5, 2458002.5]
+        assert read_fits_headers(filenames[1], [0])[0]["TIME"] == 2458001.5
+
+
+def test_index(tmp_path):
+    """
+    Make sure an index remembers what it learned about files.
+    """
+    # (these files get modified, so they're kept apart from the other tests')
+    filenames = create_timed_files(N=16, rows=20, cols=20, directory=tmp_path)
+    indexpath = os.path.join(str(tmp_path), "test-index.json")
+
+    first = FITS_Sequence(filenames, ext_image=1, index=indexpath, header_keys=["QUAL_BIT"])
+    assert os.path.exists(indexpath)
+
+    # reopening should recall everything, without rescanning
+    index = SequenceIndex(indexpath)
+    again = FITS_Sequence(filenames, ext_image=1, index=index, header_keys=["QUAL_BIT"])
+    assert index._modified == False
+    assert np.allclose(again.time.gps, first.time.gps, rtol=0, atol=1e-6)
+    assert np.all(again.filenames == first.filenames)
+    assert np.all(again.temporal["QUAL_BIT"] == first.temporal["QUAL_BIT"])
+
+    # query the index, without touching any files
+    good = index.query(where={"QUAL_BIT": 0}, tmin=first.time[2], tmax=first.time[10])
+    assert len(good) == 3
+    for f in good:
+        assert fits.getheader(f, 1)["QUAL_BIT"] == 0
+
+    # keys that were never indexed can't be queried
+    with pytest.raises(ValueError):
+        index.query(where={"NOPE": 0})
+
+    # a modified file should be rescanned (and only that one)
+    hdulist = fits.open(filenames[0])
+    hdulist[0].header["TIME"] = 2458000.0
+    hdulist.writeto(filenames[0], overwrite=True)
+    scanned = []
+
+    def scan(f, keys=None):
+        scanned.extend(f)
+        return scan_headers(f, extensions=[0, 1], keys=keys)
+
+    values = index.header_values(filenames, [0, 1], scan=scan, keys=["TIME"])
+    assert scanned == [filenames[0]]
+    assert values[0]["TIME"] == 2458000.0
+
+
+def test_header_keys():
+    """
+    Make sure only the requested header keys are extracted, into typed columns.
+    """
+    filenames = create_timed_files(N=16)
+
+    # only parse the cards we ask for
+    for f in filenames[:3]:
+        values = read_fits_header_values(f, extensions=[0, 1], keys=["TIME", "QUAL_BIT", "NOPE"])
+        assert values[0] == {"TIME": fits.getheader(f, 0)["TIME"]}
+        assert values[1] == {"QUAL_BIT": fits.getheader(f, 1)["QUAL_BIT"]}
+
+    # by default, only keep the keys that might define time
+    s = FITS_Sequence(filenames, ext_image=1)
+    assert "QUAL_BIT" not in s.temporal
+    assert s.temporal["TIME"].dtype == np.float64
+    assert not s._timeisfake
+
+    # ask for more keys
+    s = FITS_Sequence(filenames, ext_image=1, header_keys=["QUAL_BIT", "NAXIS1"])
+    assert s.temporal["QUAL_BIT"].dtype.kind == "i"
+    assert "NAXIS1" in s.static and "NAXIS1" not in s.temporal
+
+    # or everything
+    everything = FITS_Sequence(filenames, ext_image=1, header_keys="all")
+    assert set(s.temporal.keys()) <= set(everything.temporal.keys())
+    assert len(everything.static) > len(s.static)
+    print(s.temporal.keys(), s.static.keys())
+
+
+def test_benchmark_scan_headers(sizes=[16, 64], workers=[1, 2, 4, 8]):
+    """
+    Make sure every way of scanning headers gives the same values,
+    and print how the scan scales with the number of files and workers.
+    """
+    filenames = create_timed_files(N=np.max(sizes))
+    print("\n{:>8} {:>8} {:>8} {:>12}".format("files", "pool", "workers", "seconds"))
+    for N in sizes:
+        serial = scan_headers(filenames[:N], extensions=[0, 1], workers=1)
+        for pool in ["thread", "process"]:
+            for w in workers:
+                start = clock.time()
+                headers = scan_headers(filenames[:N], extensions=[0, 1], workers=w, pool=pool)
+                print("{:>8} {:>8} {:>8} {:>12.4f}".format(N, pool, w, clock.time() - start))
+                assert headers == serial
+
+
+if __name__ == "__main__":
+    test_scan_headers()
+    test_benchmark_scan_headers(sizes=[16, 64, 256, 1024])
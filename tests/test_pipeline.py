@@ -0,0 +1,110 @@
+from illumination.imports import *
+from illumination.sequences import *
+from illumination.frames import imshowFrame
+
+
+def test_pipeline(N=8):
+    """
+    Make sure a pipeline applies its steps in order, memoizes them, and times them.
+    """
+    images = np.random.normal(0, 1, (N, 12, 16))
+    sequence = Array_Sequence(images)
+
+    pipeline = Pipeline([Clip(-1, 1), "subtractprevious", Transform(np.abs)])
+    print(pipeline)
+    clipped = np.clip(images, -1, 1)
+    for timestep in range(N):
+        expected = np.abs(clipped[timestep] - clipped[timestep - 1])
+        assert np.allclose(pipeline.process(sequence, timestep), expected)
+
+    # (regions can be processed on their own)
+    region = (slice(2, 7), slice(3, 11))
+    assert np.allclose(pipeline.process(sequence, 4, region=region),
+                       np.abs(clipped[4] - clipped[3])[region])
+
+    # each raw image (and each clipped one) should only have been calculated once,
+    # except the last (also needed at the start), and the two regions
+    statistics = pipeline.statistics()
+    for k, v in statistics.items():
+        print(k, v)
+    assert statistics["read"]["calls"] == N + 3
+    assert statistics["1-clip"]["calls"] == N + 3
+    assert statistics["1-clip"]["hits"] >= N - 1
+
+    # a pipeline can make a new sequence too
+    binned = Processed_Sequence(sequence, ["subtractmedian", Bin(4)])
+    assert binned.shape == (N, 3, 4)
+    median = np.median(images, axis=0)
+    expected = (images[5] - median).reshape(3, 4, 4, 4).mean(axis=(1, 3))
+    assert np.allclose(binned[5], expected)
+    assert np.allclose(binned.read_region(5, slice(1, 3), slice(0, 2)), expected[1:3, 0:2])
+
+
+def test_reference_steps(N=7):
+    """
+    Make sure reference images (like medians) are made from
+    the output of the steps before them, not the raw images.
+    """
+    images = np.random.lognormal(3, 1, (N, 10, 12))
+    sequence = Array_Sequence(images)
+
+    pipeline = Pipeline(["subtractbackground", "subtractmedian"])
+    background = images - np.median(images, axis=(1, 2))[:, np.newaxis, np.newaxis]
+    expected = background - np.median(background, axis=0)
+    for timestep in range(N):
+        assert np.allclose(pipeline.process(sequence, timestep), expected[timestep])
+
+    pipeline = Pipeline([Transform(np.sqrt), Normalize("median")])
+    roots = np.sqrt(images)
+    expected = roots / np.median(roots, axis=0)
+    assert np.allclose(pipeline.process(sequence, 3), expected[3])
+    region = (slice(2, 5), slice(4, 9))
+    assert np.allclose(pipeline.process(sequence, 3, region=region), expected[3][region])
+
+    pipeline = Pipeline([Clip(10, 30), "subtractmean"])
+    clipped = np.clip(images, 10, 30)
+    assert np.allclose(pipeline.process(sequence, 1), clipped[1] - np.mean(clipped, axis=0))
+
+
+def test_step_descriptions(N=9):
+    """
+    Make sure steps with different parameters are described differently,
+    and that pipelines don't share what their steps remember.
+    """
+    assert Clip(0, 1).description != Clip(0, 2).description
+    assert SubtractRolling(halfwidth=2).description != SubtractRolling(halfwidth=3).description
+    assert Transform(lambda x: x).description != Transform(lambda x: 2 * x).description
+    assert Transform(np.sqrt).description == Transform(np.sqrt).description
+    print(Pipeline([Clip(0, 1), SubtractRolling(halfwidth=2), Transform(np.sqrt)]).description)
+
+    images = np.random.normal(0, 1, (N, 10, 12))
+    step = SubtractRolling(halfwidth=2)
+    first, second = Pipeline([step]), Pipeline([step, "subtractmedian"])
+    assert first.steps[0] is not second.steps[0]
+    first.process(Array_Sequence(images), 0)
+    second.process(Array_Sequence(images[::-1]), 0)
+    assert second._upstreams[1].pipeline.steps[0] is not second.steps[0]
+    assert len(step._windows) == 0
+
+    # only a few regions' rolling windows are kept around
+    sequence = Array_Sequence(images)
+    for i in range(8):
+        first.process(sequence, 0, region=(slice(i, i + 2), slice(0, 5)))
+    assert len(first.steps[0]._windows) == SubtractRolling.maxwindows
+
+
+def test_frame_pipeline(N=6):
+    """
+    Make sure imshowFrames build their pipelines from their processing steps.
+    """
+    images = np.random.normal(0, 1, (N, 12, 16))
+    frame = imshowFrame(data=images, processingsteps=["subtractmedian", "subtractprevious"])
+    median = np.median(images, axis=0)
+    for timestep in range(N):
+        expected = (images[timestep] - median) - (images[timestep - 1] - median)
+        assert np.allclose(frame.get_processed_image(timestep), expected)
+
+    # changing the steps should change the pipeline
+    frame.processingsteps = [Normalize("mean")]
+    assert np.allclose(frame.get_processed_image(2), images[2] / np.mean(images, axis=0))
+    print(frame.pipeline, frame.pipeline.statistics())
@@ -36,6 +36,319 @@ def test_FITS():
     e = FITS_Sequence([hdulist], ext_image=ext_image)
 
 
+def test_FITS_cache():
+    """
+    Make sure repeated frame access is served from the cache.
+    """
+    filenames = []
+    for i in range(3):
+        filename = os.path.join(directory, "temporarycache{}.fits".format(i))
+        create_test_fits(rows=50, cols=60).writeto(filename, overwrite=True)
+        filenames.append(filename)
+
+    a = FITS_Sequence(filenames, ext_image=1)
+    first = a[0]
+    again = a[0]
+    assert again is first
+    assert a.cache.hits >= 1
+
+    # regions of cached images come from the cache (and count as hits)
+    hits = a.cache.hits
+    assert np.all(a.read_region(0, slice(1, 5), slice(2, 6)) == first[1:5, 2:6])
+    assert a.cache.hits == hits + 1
+
+    # a budget of just over one image should evict as we go
+    b = FITS_Sequence(filenames, ext_image=1, cachebytes=first.nbytes + 1)
+    for i in range(3):
+        b[i]
+    assert len(b.cache) == 1
+    assert b.cache.evictions >= 2
+
+    # a shared cache can serve more than one sequence
+    shared = FrameCache()
+    c = FITS_Sequence(filenames, ext_image=1, cache=shared)
+    d = FITS_Sequence(filenames, ext_image=1, cache=shared)
+    assert c[1] is d[1]
+
+    # cached images are read-only, but the arrays handed to the cache stay writeable
+    image = np.zeros((3, 4))
+    stored = shared.put("mine", image)
+    assert image.flags.writeable and not stored.flags.writeable
+    assert shared.get("mine") is stored
+    assert np.shares_memory(stored, image)
+
+    # caching can be turned off
+    e = FITS_Sequence(filenames, ext_image=1, cache=False)
+    assert e.cache is None
+    assert np.all(e[2] == a[2])
+
+
+def test_FITS_direct():
+    """
+    Make sure the direct reader matches astropy.
+    """
+    filenames = []
+    for i in range(3):
+        filename = os.path.join(directory, "temporarydirect{}.fits".format(i))
+        hdulist = create_test_fits(rows=50, cols=60)
+        hdulist.append(fits.ImageHDU(np.arange(3000).reshape(50, 60).astype(np.uint16)))
+        hdulist.writeto(filename, overwrite=True)
+        filenames.append(filename)
+
+    for ext_image in [1, 4]:
+        slow = FITS_Sequence(filenames, ext_image=ext_image, reader="astropy")
+        fast = FITS_Sequence(filenames, ext_image=ext_image, reader="direct")
+        assert fast.shape == slow.shape == (3, 50, 60)
+        for i in range(3):
+            assert fast[i].dtype == slow[i].dtype.newbyteorder("=")
+            assert np.all(fast[i] == slow[i])
+
+
+def test_FITS_prefetch(N=6):
+    """
+    Make sure prefetched images match the ones read on demand.
+    """
+    filenames = []
+    for i in range(N):
+        filename = os.path.join(directory, "temporaryprefetch{}.fits".format(i))
+        create_test_fits(rows=50, cols=60).writeto(filename, overwrite=True)
+        filenames.append(filename)
+
+    a = FITS_Sequence(filenames, ext_image=1, cache=False)
+    b = FITS_Sequence(filenames, ext_image=1, cache=False)
+    b.prefetch(range(N), depth=3, workers=2)
+    for i in range(N):
+        assert np.all(a[i] == b[i])
+        assert len(b.prefetcher._pending) <= 3
+    statistics = b.stop_prefetching()
+    print(statistics)
+    assert statistics["ready"] + statistics["stalls"] == N
+    assert statistics["misses"] == 0
+    assert b.prefetcher is None
+
+    # timesteps that come up more than once are followed through the plan
+    plan = [0, 1, 2, 1, 0, 1, 2]
+    p = Prefetcher(lambda t: t, plan, depth=2, workers=1)
+    assert [p.get(t) for t in plan] == plan
+    assert (p.position == len(plan) - 1) and (p.misses == 0)
+    p.close()
+
+    # the plan can be looked up from times
+    assert np.all(a._find_timesteps(a.time.gps + 0.1) == np.arange(N))
+
+
+def test_tiled_reductions(N=5):
+    """
+    Make sure tiled reductions match reductions of the full cube.
+    """
+    filenames = []
+    for i in range(N):
+        filename = os.path.join(directory, "temporaryreduce{}.fits".format(i))
+        hdulist = create_test_fits(rows=50, cols=60)
+        hdulist[1].data[i, :] = np.nan
+        hdulist.writeto(filename, overwrite=True)
+        filenames.append(filename)
+
+    cube = np.array([fits.getdata(f, 1) for f in filenames]).astype(np.float64)
+    for reader in ["astropy", "direct"]:
+        for maxbytes, workers in [(None, 1), (N * 8 * 60 * 7, 1), (N * 8 * 25, 3)]:
+            s = FITS_Sequence(filenames, ext_image=1, reader=reader, cache=False)
+            assert np.allclose(s.median(maxbytes=maxbytes, workers=workers), np.nanmedian(cube, axis=0))
+            assert np.allclose(
+                s.percentile([10, 90], maxbytes=maxbytes, workers=workers),
+                np.nanpercentile(cube, [10, 90], axis=0),
+            )
+    assert np.allclose(s.sum(), np.nansum(cube, axis=0))
+    assert "sum" in s.spatial
+
+    # the tiles should cover every pixel exactly once, within the budget
+    for maxbytes in [10**9, 8 * N * 60 * 3, 8 * N * 7]:
+        covered = np.zeros((50, 60))
+        for rows, cols in define_tiles(N, (50, 60), maxbytes=maxbytes):
+            covered[rows, cols] += 1
+            assert N * 8 * covered[rows, cols].size <= np.maximum(maxbytes, N * 8)
+        assert np.all(covered == 1)
+
+
+def test_statistics(tmp_path, N=20):
+    """
+    Make sure the one-pass statistics match numpy's (and merge correctly).
+    """
+    np.random.seed(42)
+    cube = 1e6 + np.random.normal(0, 1, (N, 30, 40))
+    cube[::3, 5, :] = np.nan
+    cube[:, 6, 7] = np.nan
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        expected = dict(
+            mean=np.nanmean(cube, axis=0),
+            std=np.nanstd(cube, axis=0),
+            min=np.nanmin(cube, axis=0),
+            max=np.nanmax(cube, axis=0),
+            sum=np.nansum(cube, axis=0),
+            nfinite=np.sum(np.isfinite(cube), axis=0),
+            median=np.nanmedian(cube, axis=0),
+        )
+
+    for workers in [1, 3]:
+        s = Array_Sequence(cube.copy())
+        results = s.statistics(list(expected.keys()), workers=workers)
+        for k in expected:
+            assert np.allclose(results[k], expected[k], equal_nan=True), k
+            assert s.spatial[k] is results[k]
+
+    # merging partial accumulators is the same as accumulating everything at once
+    everything, first, second = [StatisticsAccumulator((30, 40)) for _ in range(3)]
+    for i in range(N):
+        everything.add(cube[i])
+        (first if i < 7 else second).add(cube[i])
+    merged = first.merge(second).results()
+    for k, v in everything.results().items():
+        assert np.allclose(merged[k], v, equal_nan=True), k
+
+    # the streamed mean of a sequence counts non-finite values as zero
+    mapped = np.memmap(tmp_path / "cube.dat", dtype=cube.dtype, mode="w+", shape=cube.shape)
+    mapped[:] = cube
+    assert np.allclose(Array_Sequence(mapped).mean(), np.nansum(cube, axis=0) / N)
+
+    # sums of big integer-valued frames are exact
+    counts = np.random.randint(0, 2**40, (N, 30, 40))
+    assert np.all(Array_Sequence(counts.astype(float)).sum() == np.sum(counts, axis=0))
+
+
+def test_approximate_quantiles(N=101):
+    """
+    Make sure the approximate quantiles stay within their error bounds.
+    """
+    np.random.seed(42)
+    cube = np.random.normal(100, 10, (N, 30, 40))
+    cube[::4, 3, :] = np.nan
+    s = Array_Sequence(cube)
+
+    for q in [50, 10, 95]:
+        estimate, errorbound = s.approximate_percentile(q, nbins=32)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            exact = np.nanpercentile(cube, q, axis=0)
+        bounded = np.isfinite(errorbound)
+        assert np.mean(bounded) > 0.9
+        assert np.all(np.abs(estimate - exact)[bounded] <= errorbound[bounded])
+        print(q, np.median(np.abs(estimate - exact)), np.median(errorbound))
+
+    # the median is exact unless an approximation is asked for
+    assert np.allclose(s.median(), np.nanmedian(cube, axis=0))
+    assert np.all(s.median(method="approximate") == s.spatial["approximatemedian-32bins"])
+    assert np.allclose(s.median(method="auto"), np.nanmedian(cube, axis=0))
+    assert s.median(method="auto", maxbytes=1000) is s.spatial["approximatemedian-32bins"]
+
+    # approximations with different numbers of bins are kept apart
+    coarse = s.median(method="approximate", nbins=4)
+    assert coarse is s.spatial["approximatemedian-4bins"]
+    assert coarse is not s.spatial["approximatemedian-32bins"]
+
+
+def test_find_timesteps(N=50):
+    """
+    Make sure the sorted time index finds the same timesteps as a brute-force search.
+    """
+    np.random.seed(42)
+    gps = np.random.uniform(1e9, 1e9 + 1e5, N)
+    s = Array_Sequence(np.zeros((N, 3, 4)), time=Time(gps, format="gps", scale="tdb"))
+    requested = np.random.uniform(1e9 - 1e4, 1e9 + 1.1e5, 200)
+    expected = [np.argmin(np.abs(gps - r)) for r in requested]
+    assert np.all(s._find_timesteps(requested) == expected)
+    assert np.all(s._find_timesteps(Time(requested, format="gps", scale="tdb")) == expected)
+    assert s._find_timestep(Time(requested[0], format="gps", scale="tdb")) == expected[0]
+
+    # changing the time axis should update the index
+    s.time = Time(gps[::-1], format="gps", scale="tdb")
+    assert s._find_timestep(gps[0]) == N - 1
+
+
+def test_consolidate(N=7):
+    """
+    Consolidate a FITS_Sequence into chunked cubes, and read them back.
+    """
+    filenames = []
+    for i in range(N):
+        filename = os.path.join(directory, "temporaryconsolidate{}.fits".format(i))
+        hdulist = create_test_fits(rows=30, cols=40, seed=i)
+        hdulist[0].header["TIME"] = 2458000.5 + i * 0.02
+        hdulist.writeto(filename, overwrite=True)
+        filenames.append(filename)
+    original = FITS_Sequence(filenames, ext_image=1, timekey="TIME")
+    cube = original._gather_3d()
+    assert (original.time.scale == "tdb") and not original._timeisfake
+
+    for chunkshape in [(1, None, None), (None, 8, 8), (3, 16, 25)]:
+        path = os.path.join(directory, "consolidated-{}-{}-{}".format(*chunkshape))
+        chunked = original.consolidate(path, chunkshape=chunkshape, overwrite=True)
+        print(chunked)
+        assert chunked.shape == original.shape
+        assert np.allclose(chunked.time.jd, original.time.jd, rtol=0, atol=1e-9)
+
+        reopened = make_image_sequence(path)
+        assert isinstance(reopened, Chunked_Sequence)
+        for i in [0, 3, -1]:
+            assert np.array_equal(reopened[i], cube[i], equal_nan=True)
+            assert np.array_equal(reopened.read_region(i, slice(5, 20), slice(7, 33)),
+                                  cube[i, 5:20, 7:33], equal_nan=True)
+        assert np.array_equal(reopened.read_timeseries(slice(2, 11), slice(30, 31)),
+                              cube[:, 2:11, 30:31], equal_nan=True)
+        for timesteps in [slice(0, None, 2), slice(None, None, -3), slice(4, 1, 1)]:
+            assert np.array_equal(reopened.read_timeseries(slice(2, 11), slice(30, 31), timesteps),
+                                  cube[timesteps, 2:11, 30:31], equal_nan=True)
+
+    # whole frames from frame-shaped chunks shouldn't need to be copied
+    framewise = Chunked_Sequence(os.path.join(directory, "consolidated-1-None-None"))
+    assert isinstance(framewise[2].base, np.memmap) or isinstance(framewise[2], np.memmap)
+
+
+class CountingDataset:
+    """
+    A minimal array-like (like an h5py dataset) that keeps track
+    of how many pixels have been read from it.
+    """
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.pixelsread = 0
+
+    def __getitem__(self, key):
+        chunk = np.array(self.array[key])
+        self.pixelsread += chunk.size
+        return chunk
+
+
+def test_array_like(N=6):
+    """
+    Make sure memory maps and other array-likes aren't loaded all at once.
+    """
+    filename = os.path.join(directory, "temporarymemmap.npy")
+    cube = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float32, shape=(N, 20, 30))
+    cube[:] = np.random.normal(0, 1, cube.shape)
+    cube.flush()
+
+    mapped = make_image_sequence(np.load(filename, mmap_mode="r"))
+    assert isinstance(mapped, Array_Sequence) and not mapped.inmemory
+    assert isinstance(mapped[2], np.memmap)
+    assert np.allclose(mapped.mean(), np.mean(cube, 0))
+    assert np.allclose(mapped.median(), np.median(cube, 0))
+
+    dataset = CountingDataset(np.asarray(cube))
+    lazy = make_image_sequence(dataset)
+    assert isinstance(lazy, Array_Sequence)
+    assert dataset.pixelsread == 0
+    assert np.array_equal(lazy[3], cube[3])
+    assert dataset.pixelsread == 20 * 30
+    assert np.array_equal(lazy.read_region(1, slice(2, 5), slice(3, 9)), cube[1, 2:5, 3:9])
+    assert np.allclose(lazy.mean(), np.mean(cube, 0))
+    assert np.allclose(lazy.median(), np.median(cube, 0))
+
+
 """def test_TPF():
     '''
     Run a test of the TPF_Sequence.
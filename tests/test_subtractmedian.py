@@ -44,5 +44,78 @@ def test_subtractprevious(N=3, **kw):
     print("Take a look at {} and see what you think!".format(filename))
 
 
+class CountingSequence(Array_Sequence):
+    """
+    An Array_Sequence that counts how many times each frame is read.
+    """
+
+    def __getitem__(self, timestep):
+        self.reads[timestep % self.N] += 1
+        return Array_Sequence.__getitem__(self, timestep)
+
+
+def test_reads_once(N=10):
+    """
+    Make sure animating difference images in order reads each raw frame only once.
+    """
+    images = np.random.normal(0, 1, (N, 20, 30))
+    for steps in [["subtractprevious"], ["subtractbeforeandafter"]]:
+        sequence = CountingSequence(images)
+        frame = imshowFrame(data=sequence, processingsteps=steps)
+        sequence.reads = np.zeros(N, dtype=int)
+        for timestep in range(N):
+            processed = frame.get_processed_image(timestep)
+            if steps == ["subtractprevious"]:
+                expected = images[timestep] - images[timestep - 1]
+            else:
+                after = (timestep + 1) % N
+                expected = images[timestep] - 0.5 * (images[timestep - 1] + images[after])
+            assert np.allclose(processed, expected)
+
+            # asking again shouldn't need any new reads
+            frame.get_processed_image(timestep)
+        print(steps, sequence.reads)
+
+        # (except the first and last frames, which are also needed to wrap around)
+        assert np.all(sequence.reads[1:-1] == 1)
+        assert np.all(sequence.reads[[0, -1]] <= 2)
+
+
+def test_rolling_background(N=30, k=3):
+    """
+    Make sure rolling medians and means match brute-force calculations,
+    while reading each frame only once when moving through in order.
+    """
+    images = np.random.normal(0, 1, (N, 8, 9))
+    images[:, 0, 0] = np.nan
+    images[::4, 1, 1] = np.nan
+    images[5, 2, :] = np.inf
+
+    for how in ["median", "mean"]:
+        sequence = CountingSequence(images)
+        frame = imshowFrame(data=sequence, processingsteps=["subtractrolling" + how], rollingwindow=k)
+        sequence.reads = np.zeros(N, dtype=int)
+
+        # move forward in order, then jump around a bit
+        for timestep in list(range(N)) + [10, 9, 8, 20, 2]:
+            start = int(np.clip(timestep - k, 0, N - (2 * k + 1)))
+            window = np.where(np.isfinite(images), images, np.nan)[start : start + 2 * k + 1]
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                expected = images[timestep] - getattr(np, "nan" + how)(window, axis=0)
+            processed = frame.get_processed_image(timestep)
+            assert np.allclose(processed, expected, equal_nan=True)
+            if timestep == N - 1:
+                print(how, sequence.reads)
+                assert np.all(sequence.reads == 1)
+
+        # rolling medians keep just their sorted stack, not the frames too
+        window = list(frame.pipeline.steps[0]._windows.values())[0]
+        print(window)
+        if how == "median":
+            assert len(window.frames) == 0
+            assert window.slots.dtype == np.uint8
+
+
 if __name__ == "__main__":
     test_subtraction()
@@ -2,6 +2,8 @@ from illumination.imports import *
 from illumination.illustrations import *
 from illumination.zoom import *
 from illumination.cartoons import *
+from illumination.sequences import FITS_Sequence
+from astropy.nddata.utils import Cutout2D
 
 
 directory = "examples/"
@@ -94,6 +96,82 @@ def test_FourCameraLocalZoom(N=3, zoom=3, size=(50, 50)):
     print("Take a look at {} and see what you think!".format(filename))
 
 
+def test_region_reads(N=4, size=(9, 7)):
+    """
+    Make sure zooms that read only their region of each image
+    match cutouts from the full (transformed) images.
+    """
+    from illumination.frames import ccds, cameras, LocalZoomFrame
+    from illumination.utilities import transform_image, untransform_region
+
+    # every transform recipe should be traceable back to the original pixels
+    image = np.arange(50 * 60).reshape(50, 60)
+    for recipe in [[], [(True, False, False)], [(False, True, True), (True, True, True)]]:
+        transformed = transform_image(image, recipe)
+        rows, cols = slice(3, 17), slice(40, 45)
+        original = untransform_region(rows, cols, image.shape, recipe)
+        assert np.all(transform_image(image[original], recipe) == transformed[rows, cols])
+
+    filenames = []
+    for i in range(N):
+        filename = os.path.join(directory, "temporaryregion{}.fits".format(i))
+        create_test_fits(rows=50, cols=60, seed=i).writeto(filename, overwrite=True)
+        filenames.append(filename)
+
+    for steps in [[], ["subtractmedian"], ["subtractprevious"]]:
+        sequence = FITS_Sequence(filenames, ext_image=1)
+        ccd = ccds["ccd1"](data=sequence, camera=cameras["cam3"](), processingsteps=steps)
+        for position in [(30, 20), (0, 0), (59, 49)]:
+            zoom = LocalZoomFrame(source=ccd, position=position, size=size)
+            for timestep in range(N):
+                image, _ = zoom._get_image(timestep=timestep)
+                full, _ = ccd._get_image(timestep=timestep)
+                expected = Cutout2D(full, ccd._transformxy(*position), size, mode="partial").data
+                assert np.array_equal(image, expected, equal_nan=True)
+    print("zooms read only their regions, and match full-frame cutouts")
+
+
+def test_shared_transformed_images(N=3):
+    """
+    Make sure CCD+camera transforms are done in one contiguous
+    copy, which zooms then cut from rather than reading again.
+    """
+    from illumination.frames import ccds, cameras, LocalZoomFrame
+    from illumination.utilities import transform_image, compose_recipe
+
+    # any two steps reduce to one that does the same thing
+    image = np.arange(5 * 7).reshape(5, 7)
+    steps = [(t, y, x) for t in [False, True] for y in [False, True] for x in [False, True]]
+    for first in steps:
+        for second in steps:
+            expected = transform_image(transform_image(image, [first]), [second])
+            composed = compose_recipe([first, second])
+            assert len(composed) <= 1
+            assert np.array_equal(transform_image(image, composed), expected)
+
+    filenames = []
+    for i in range(N):
+        filename = os.path.join(directory, "temporaryshared{}.fits".format(i))
+        create_test_fits(rows=50, cols=60, seed=i).writeto(filename, overwrite=True)
+        filenames.append(filename)
+
+    ccd = ccds["ccd1"](data=FITS_Sequence(filenames, ext_image=1), camera=cameras["cam1"]())
+    zoom = LocalZoomFrame(source=ccd, position=(30, 20), size=(9, 7))
+    for timestep in range(N):
+        full, _ = ccd._get_image(timestep=timestep)
+        assert full.flags["C_CONTIGUOUS"]
+        raw = ccd.get_processed_image(timestep)
+        assert np.array_equal(full, transform_image(raw, ccd._transformrecipe()), equal_nan=True)
+
+        # the zoom cuts its image out of the one its source just made
+        before = ccd.pipeline.statistics()
+        image, _ = zoom._get_image(timestep=timestep)
+        assert ccd.pipeline.statistics() == before
+        expected = Cutout2D(full, ccd._transformxy(30, 20), (9, 7), mode="partial").data
+        assert np.array_equal(image, expected, equal_nan=True)
+    print(ccd._transformed)
+
+
 """
 def test_CameraIllustrationWithStamps():
     print("\nTesting a Single Camera with some stamps.")